@@ -1,164 +1,253 @@
 """
 Protocol health: DAU, swap count, volume, median swap size, Gini, whale share %, health score 0-100.
+One scan of the swaps (per-day and per-(day, wallet) grouping sets), then NumPy for all days at once.
+Incremental by default: only days from the analytics_watermarks high-water mark on are rebuilt.
 """
 from __future__ import annotations
 
-from datetime import datetime, timezone, timedelta
+import os
+from datetime import datetime, timedelta, timezone
 
-from db.connection import init_connection_pool
-from db.queries import run_query, execute_sql
+import numpy as np
+
+from db.connection import init_connection_pool, unit_of_work
+from db.queries import get_watermark, run_query, run_query_columnar, set_watermark, write_analytics_rows
+
+HEALTH_COLUMNS = (
+    "date_bucket",
+    "unique_active_wallets",
+    "total_swaps",
+    "total_volume_usd",
+    "median_swap_size",
+    "gini_coefficient",
+    "whale_share_pct",
+    "health_score",
+)
+WHALE_SWAP_USD = 50000
+WATERMARK_JOB = "protocol_health"
+# Extra days re-scanned before the watermark day, for rows that land late
+LOOKBACK_DAYS = int(os.getenv("PROTOCOL_HEALTH_LOOKBACK_DAYS", "1"))
 
 
 def _ensure_pool():
     init_connection_pool()
 
 
-def _gini(values: list[float]) -> float:
-    if not values:
-        return 0.0
-    sorted_vals = sorted(values)
-    n = len(sorted_vals)
-    cumsum = 0.0
-    for i, v in enumerate(sorted_vals):
-        cumsum += (2 * (i + 1) - n - 1) * v
-    total = sum(sorted_vals)
-    if total == 0:
-        return 0.0
-    return cumsum / (n * total)
+def _gini_by_group(group: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Gini of `values` within each group id in [0, n_groups), all groups in one sort."""
+    order = np.lexsort((values, group))
+    g = group[order]
+    v = values[order]
+    counts = np.bincount(g, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(len(v)) - starts[g] + 1  # 1-based position within its group
+    weighted = np.bincount(g, weights=(2 * rank - counts[g] - 1) * v, minlength=n_groups)
+    totals = np.bincount(g, weights=v, minlength=n_groups)
+    denom = counts * totals
+    return np.divide(weighted, denom, out=np.zeros(n_groups), where=denom != 0)
 
 
-def _daily_metrics() -> list[dict]:
-    _ensure_pool()
-    sql = """
+def _health_sql(table: str, wallet_column: str, amount: str, since: bool = False) -> str:
+    where = "WHERE event_timestamp >= %s" if since else ""
+    return f"""
         SELECT
-            date_trunc('day', event_timestamp)::date AS date_bucket,
-            count(DISTINCT wallet_address) AS unique_active_wallets,
-            count(*) AS total_swaps,
-            sum(amount_usd) AS total_volume_usd,
-            percentile_cont(0.5) WITHIN GROUP (ORDER BY amount_usd) AS median_swap_size
-        FROM marts.fact_swaps
-        GROUP BY 1
-    """
-    try:
-        return run_query(sql, ())
-    except Exception:
-        sql_raw = """
+            date_bucket,
+            wallet_address,
+            GROUPING(wallet_address) AS is_day,
+            count(*) AS swaps,
+            sum(amount_usd) AS volume,
+            sum(CASE WHEN amount_usd >= {WHALE_SWAP_USD} THEN amount_usd ELSE 0 END) AS whale_volume,
+            CASE WHEN GROUPING(wallet_address) = 1
+                THEN percentile_cont(0.5) WITHIN GROUP (ORDER BY amount_usd)
+            END AS median_swap_size
+        FROM (
             SELECT
                 date_trunc('day', event_timestamp)::date AS date_bucket,
-                count(DISTINCT sender_address) AS unique_active_wallets,
-                count(*) AS total_swaps,
-                sum(COALESCE(usd_value, 0)) AS total_volume_usd,
-                percentile_cont(0.5) WITHIN GROUP (ORDER BY COALESCE(usd_value, 0)) AS median_swap_size
-            FROM raw_swaps
-            GROUP BY 1
-        """
-        return run_query(sql_raw, ())
+                {wallet_column} AS wallet_address,
+                {amount} AS amount_usd
+            FROM {table}
+            {where}
+        ) s
+        GROUP BY GROUPING SETS ((date_bucket, wallet_address), (date_bucket))
+    """
 
 
-def _daily_whale_share() -> dict[tuple, float]:
-    _ensure_pool()
-    sql = """
-        SELECT
-            date_trunc('day', event_timestamp)::date AS date_bucket,
-            sum(CASE WHEN amount_usd >= 50000 THEN amount_usd ELSE 0 END) AS whale_volume,
-            sum(amount_usd) AS total_volume
-        FROM marts.fact_swaps
-        GROUP BY 1
+def _scan(since=None) -> dict[str, np.ndarray]:
     """
+    Day rows (is_day = 1) and (day, wallet) rows (is_day = 0) from a single pass over the
+    swaps, optionally only those from `since` (a day start) on.
+    """
+    _ensure_pool()
+    params = (since,) if since is not None else ()
     try:
-        rows = run_query(sql, ())
+        return run_query_columnar(_health_sql("marts.fact_swaps", "wallet_address", "amount_usd", since is not None), params)
     except Exception:
-        sql_raw = """
-            SELECT
-                date_trunc('day', event_timestamp)::date AS date_bucket,
-                sum(CASE WHEN COALESCE(usd_value, 0) >= 50000 THEN usd_value ELSE 0 END) AS whale_volume,
-                sum(COALESCE(usd_value, 0)) AS total_volume
-            FROM raw_swaps
-            GROUP BY 1
-        """
-        rows = run_query(sql_raw, ())
-    out = {}
-    for r in rows:
-        db = r.get("date_bucket")
-        total = float(r.get("total_volume") or 0)
-        whale = float(r.get("whale_volume") or 0)
-        out[db] = (whale / total * 100.0) if total else 0.0
-    return out
-
-
-def _daily_wallet_volumes() -> dict[tuple, list[float]]:
-    _ensure_pool()
-    sql = """
-        SELECT
-            date_trunc('day', event_timestamp)::date AS date_bucket,
-            wallet_address,
-            sum(amount_usd) AS vol
-        FROM marts.fact_swaps
-        GROUP BY 1, 2
+        return run_query_columnar(_health_sql("raw_swaps", "sender_address", "COALESCE(usd_value, 0)", since is not None), params)
+
+
+def _group_swaps(ts: np.ndarray, wallets: np.ndarray, amounts: np.ndarray) -> dict[str, np.ndarray]:
+    """The rows _health_sql returns, computed in NumPy from individual swaps."""
+    amounts = np.nan_to_num(amounts.astype(np.float64))
+    days, day_ids = np.unique(ts.astype("datetime64[D]"), return_inverse=True)
+    n_days = len(days)
+    counts = np.bincount(day_ids, minlength=n_days)
+    whale_amounts = np.where(amounts >= WHALE_SWAP_USD, amounts, 0.0)
+
+    # percentile_cont(0.5): mean of the two middle amounts of each day
+    sorted_amounts = amounts[np.lexsort((amounts, day_ids))]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    median = (sorted_amounts[starts + (counts - 1) // 2] + sorted_amounts[starts + counts // 2]) / 2
+
+    codes: dict = {}
+    wallet_ids = np.fromiter((codes.setdefault(w, len(codes)) for w in wallets), dtype=np.int64, count=len(wallets))
+    pairs, pair_ids = np.unique(day_ids * len(codes) + wallet_ids, return_inverse=True)
+    pair_wallets = np.empty(len(codes), dtype=object)
+    pair_wallets[:] = list(codes)
+
+    return {
+        "date_bucket": np.concatenate([days, days[pairs // len(codes)]]),
+        "wallet_address": np.concatenate([np.full(n_days, None, dtype=object), pair_wallets[pairs % len(codes)]]),
+        "is_day": np.concatenate([np.ones(n_days), np.zeros(len(pairs))]),
+        "swaps": np.concatenate([counts, np.bincount(pair_ids)]).astype(np.float64),
+        "volume": np.concatenate([np.bincount(day_ids, amounts, n_days), np.bincount(pair_ids, amounts)]),
+        "whale_volume": np.concatenate([np.bincount(day_ids, whale_amounts, n_days), np.bincount(pair_ids, whale_amounts)]),
+        "median_swap_size": np.concatenate([median, np.full(len(pairs), np.nan)]),
+    }
+
+
+def _archived_scan(before: datetime | None) -> dict[str, np.ndarray]:
+    """
+    Day and (day, wallet) rows for raw_swaps months archived to Parquet (db.archive), only
+    before `before` (the first day the live scan has), so no day is counted twice.
     """
+    from db import archive
+
+    if not any(e["table"] == "raw_swaps" and e["rows"] for e in archive.load_manifest()):
+        return {}
+    data = archive.read_columnar("raw_swaps", until=before, columns=("event_timestamp", "sender_address", "usd_value"))
+    if not data:
+        return {}
+    return _group_swaps(data["event_timestamp"], data["sender_address"], data["usd_value"])
+
+
+def _with_archive(live: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Live scan plus the archived days before it."""
+    before = None
+    if live and len(live["date_bucket"]):
+        first = live["date_bucket"].min().astype("datetime64[D]").astype(datetime)
+        before = datetime(first.year, first.month, first.day, tzinfo=timezone.utc)
+    archived = _archived_scan(before)
+    if not archived:
+        return live
+    if not live:
+        return archived
+    return {k: np.concatenate([archived[k], live[k]]) for k in archived}
+
+
+def _source_high_water():
+    """Latest swap timestamp in the source the scan will read."""
     try:
-        rows = run_query(sql, ())
+        rows = run_query("SELECT max(event_timestamp) AS ts FROM marts.fact_swaps")
     except Exception:
-        sql_raw = """
-            SELECT
-                date_trunc('day', event_timestamp)::date AS date_bucket,
-                sender_address AS wallet_address,
-                sum(COALESCE(usd_value, 0)) AS vol
-            FROM raw_swaps
-            GROUP BY 1, 2
-        """
-        rows = run_query(sql_raw, ())
-    by_date: dict[tuple, list[float]] = {}
-    for r in rows:
-        db = r.get("date_bucket")
-        vol = float(r.get("vol") or 0)
-        by_date.setdefault(db, []).append(vol)
-    return by_date
-
-
-def run() -> None:
+        rows = run_query("SELECT max(event_timestamp) AS ts FROM raw_swaps")
+    ts = rows[0]["ts"] if rows else None
+    # fact_swaps stores naive UTC timestamps
+    if ts is not None and ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+def _health_rows(data: dict[str, np.ndarray]) -> list[dict]:
+    if not data:
+        return []
+    day_mask = data["is_day"] == 1
+    days = data["date_bucket"][day_mask]
+    n_days = len(days)
+    if not n_days:
+        return []
+    sorted_days = np.sort(days)
+    day_ids = np.searchsorted(sorted_days, days)
+
+    wallet_mask = ~day_mask
+    wallet_day = np.searchsorted(sorted_days, data["date_bucket"][wallet_mask])
+    wallet_vol = np.nan_to_num(data["volume"][wallet_mask])
+    has_wallet = np.not_equal(data["wallet_address"][wallet_mask], None).astype(bool)
+
+    uaw = np.bincount(wallet_day[has_wallet], minlength=n_days)
+    gini = _gini_by_group(wallet_day, wallet_vol, n_days)
+
+    swaps = np.zeros(n_days)
+    volume = np.zeros(n_days)
+    whale = np.zeros(n_days)
+    median = np.zeros(n_days)
+    swaps[day_ids] = np.nan_to_num(data["swaps"][day_mask])
+    volume[day_ids] = np.nan_to_num(data["volume"][day_mask])
+    whale[day_ids] = np.nan_to_num(data["whale_volume"][day_mask])
+    median[day_ids] = np.nan_to_num(data["median_swap_size"][day_mask])
+    whale_share = np.divide(whale * 100.0, volume, out=np.zeros(n_days), where=volume != 0)
+
+    # Health score 0-100: weighted mix of activity and diversity
+    health = np.where(volume > 0, np.minimum(30, (volume / 1e6) * 30), 0.0)  # volume component
+    health += np.where(uaw > 0, np.minimum(25, uaw / 10), 0.0)  # wallet activity
+    health += (1 - gini) * 25  # lower gini = more distributed = better
+    health += np.minimum(20, swaps / 50)
+    health = np.minimum(100.0, health)
+
+    return [
+        {
+            "date_bucket": sorted_days[i].astype(object),
+            "unique_active_wallets": int(uaw[i]),
+            "total_swaps": int(swaps[i]),
+            "total_volume_usd": float(volume[i]),
+            "median_swap_size": float(median[i]),
+            "gini_coefficient": round(float(gini[i]), 6),
+            "whale_share_pct": round(float(whale_share[i]), 4),
+            "health_score": round(float(health[i]), 2),
+        }
+        for i in range(n_days)
+    ]
+
+
+def run_full() -> None:
+    """Rebuild every day from genesis, including months archived out of raw_swaps."""
     _ensure_pool()
-    daily = _daily_metrics()
-    whale_share = _daily_whale_share()
-    wallet_vols = _daily_wallet_volumes()
-    if not daily:
+    high_water = _source_high_water()
+    out = _health_rows(_with_archive(_scan()))
+    if not out:
         return
-    execute_sql("TRUNCATE analytics_protocol_health")
-    for r in daily:
-        db = r.get("date_bucket")
-        if not db:
-            continue
-        uaw = int(r.get("unique_active_wallets") or 0)
-        total_swaps = int(r.get("total_swaps") or 0)
-        total_volume = float(r.get("total_volume_usd") or 0)
-        median_swap = float(r.get("median_swap_size") or 0)
-        gini = _gini(wallet_vols.get(db, []))
-        ws = whale_share.get(db, 0.0)
-        # Health score 0-100: weighted mix of activity and diversity
-        health = 0.0
-        if total_volume > 0:
-            health += min(30, (total_volume / 1e6) * 30)  # volume component
-        if uaw > 0:
-            health += min(25, uaw / 10)  # wallet activity
-        health += (1 - gini) * 25  # lower gini = more distributed = better
-        health += min(20, total_swaps / 50)
-        health_score = min(100.0, health)
-        execute_sql(
-            """
-            INSERT INTO analytics_protocol_health
-            (date_bucket, unique_active_wallets, total_swaps, total_volume_usd, median_swap_size, gini_coefficient, whale_share_pct, health_score)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (date_bucket) DO UPDATE SET
-                unique_active_wallets = EXCLUDED.unique_active_wallets,
-                total_swaps = EXCLUDED.total_swaps,
-                total_volume_usd = EXCLUDED.total_volume_usd,
-                median_swap_size = EXCLUDED.median_swap_size,
-                gini_coefficient = EXCLUDED.gini_coefficient,
-                whale_share_pct = EXCLUDED.whale_share_pct,
-                health_score = EXCLUDED.health_score
-            """,
-            (db, uaw, total_swaps, total_volume, median_swap, round(gini, 6), round(ws, 4), round(health_score, 2)),
-        )
+    with unit_of_work() as cur:
+        write_analytics_rows("analytics_protocol_health", HEALTH_COLUMNS, out, mode="replace", cur=cur)
+        if high_water is not None:
+            set_watermark(WATERMARK_JOB, high_water, cur=cur)
+
+
+def run_incremental() -> int:
+    """
+    Recompute only days at or after the watermark's day (minus LOOKBACK_DAYS for late
+    rows) and upsert them; falls back to a full rebuild with no watermark. Returns days written.
+    """
+    _ensure_pool()
+    watermark = get_watermark(WATERMARK_JOB)
+    if watermark is None:
+        run_full()
+        return -1
+    high_water = _source_high_water()
+    if high_water is None:
+        return 0
+    since = watermark.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=LOOKBACK_DAYS)
+    out = _health_rows(_scan(since))
+    with unit_of_work() as cur:
+        write_analytics_rows("analytics_protocol_health", HEALTH_COLUMNS, out, mode="upsert", conflict=("date_bucket",), cur=cur)
+        set_watermark(WATERMARK_JOB, max(watermark, high_water), cur=cur)
+    return len(out)
+
+
+def run(mode: str | None = None) -> None:
+    mode = (mode or os.getenv("PROTOCOL_HEALTH_MODE", "incremental")).strip().lower()
+    if mode == "full":
+        run_full()
+    else:
+        run_incremental()
 
 
 if __name__ == "__main__":
@@ -1,47 +1,75 @@
 """
-Token flow: inflow/outflow/net per token per hour. Output → analytics_token_flows.
+Token flow: inflow/outflow/net per token per hour, aggregated in SQL (optionally with
+HyperLogLog unique counts). Output → analytics_token_flows.
 """
 from __future__ import annotations
 
+import os
 from datetime import datetime, timezone, timedelta
 
 from db.connection import init_connection_pool
-from db.queries import run_query, execute_sql
+from db.queries import run_query, write_analytics_rows
+
+FLOW_COLUMNS = (
+    "hour_bucket",
+    "token_address",
+    "inflow_usd",
+    "outflow_usd",
+    "net_flow_usd",
+    "unique_senders",
+    "unique_receivers",
+    "flow_direction",
+)
 
 
 def _ensure_pool():
     init_connection_pool()
 
 
-def _transfer_flows(hours: int = 168 * 2) -> list[dict]:
-    _ensure_pool()
-    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
-    sql = """
+def _approx_distinct() -> bool:
+    """TOKEN_FLOW_APPROX_DISTINCT=1: HyperLogLog unique counts (needs the postgresql-hll extension)."""
+    return os.getenv("TOKEN_FLOW_APPROX_DISTINCT", "").strip().lower() in ("1", "true", "yes")
+
+
+def _flow_sql(table: str, amount_column: str, approx: bool) -> str:
+    if approx:
+        senders = "hll_cardinality(hll_add_agg(hll_hash_text(COALESCE(trim(from_address), ''))))::bigint"
+        receivers = "hll_cardinality(hll_add_agg(hll_hash_text(COALESCE(trim(to_address), ''))))::bigint"
+    else:
+        senders = "count(DISTINCT COALESCE(trim(from_address), ''))"
+        receivers = "count(DISTINCT COALESCE(trim(to_address), ''))"
+    return f"""
         SELECT
             date_trunc('hour', event_timestamp) AS hour_bucket,
-            token_address,
-            from_address,
-            to_address,
-            COALESCE(amount_usd, 0) AS amount_usd,
-            COALESCE(direction, 'out') AS direction
-        FROM marts.fact_transfers
+            lower(trim(token_address)) AS token_address,
+            sum(CASE WHEN lower(COALESCE(direction, 'out')) = 'in' THEN COALESCE({amount_column}, 0) ELSE 0 END) AS inflow_usd,
+            sum(CASE WHEN lower(COALESCE(direction, 'out')) = 'in' THEN 0 ELSE COALESCE({amount_column}, 0) END) AS outflow_usd,
+            {senders} AS unique_senders,
+            {receivers} AS unique_receivers
+        FROM {table}
         WHERE event_timestamp >= %s
+          AND COALESCE(trim(token_address), '') <> ''
+        GROUP BY 1, 2
     """
-    try:
-        return run_query(sql, (since,))
-    except Exception:
-        sql_raw = """
-            SELECT
-                date_trunc('hour', event_timestamp) AS hour_bucket,
-                token_address,
-                from_address,
-                to_address,
-                COALESCE(usd_value, 0) AS amount_usd,
-                COALESCE(direction, 'out') AS direction
-            FROM raw_transfers
-            WHERE event_timestamp >= %s
-        """
-        return run_query(sql_raw, (since,))
+
+
+def _transfer_flows(hours: int = 168 * 2) -> list[dict]:
+    """Per (hour, token) inflow/outflow and unique sender/receiver counts, aggregated in Postgres."""
+    _ensure_pool()
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+    modes = [True, False] if _approx_distinct() else [False]
+    for approx in modes:
+        try:
+            return run_query(_flow_sql("marts.fact_transfers", "amount_usd", approx), (since,))
+        except Exception:
+            pass
+        try:
+            return run_query(_flow_sql("raw_transfers", "usd_value", approx), (since,))
+        except Exception:
+            # Missing hll extension: fall back to exact counts
+            if not approx:
+                raise
+    return []
 
 
 def run() -> None:
@@ -49,37 +77,11 @@ def run() -> None:
     rows = _transfer_flows(168 * 2)
     if not rows:
         return
-    # Aggregate by (hour_bucket, token_address): inflow, outflow, unique_senders, unique_receivers
-    agg: dict[tuple, dict] = {}
-    for r in rows:
-        h = r.get("hour_bucket")
-        if hasattr(h, "isoformat"):
-            pass
-        elif isinstance(h, str):
-            from dateutil import parser
-            h = parser.parse(h)
-        else:
-            continue
-        tok = (r.get("token_address") or "").strip().lower()
-        if not tok:
-            continue
-        key = (h, tok)
-        if key not in agg:
-            agg[key] = {"inflow": 0.0, "outflow": 0.0, "senders": set(), "receivers": set()}
-        amt = float(r.get("amount_usd") or 0)
-        direction = (r.get("direction") or "out").lower()
-        if direction == "in":
-            agg[key]["inflow"] += amt
-        else:
-            agg[key]["outflow"] += amt
-        agg[key]["senders"].add((r.get("from_address") or "").strip())
-        agg[key]["receivers"].add((r.get("to_address") or "").strip())
-
     threshold = 1000.0
-    execute_sql("TRUNCATE analytics_token_flows")
-    for (hour_bucket, token_address), v in agg.items():
-        inflow = v["inflow"]
-        outflow = v["outflow"]
+    out = []
+    for r in rows:
+        inflow = float(r.get("inflow_usd") or 0)
+        outflow = float(r.get("outflow_usd") or 0)
         net = inflow - outflow
         if net > threshold:
             flow_direction = "accumulation"
@@ -87,30 +89,17 @@ def run() -> None:
             flow_direction = "distribution"
         else:
             flow_direction = "neutral"
-        execute_sql(
-            """
-            INSERT INTO analytics_token_flows
-            (hour_bucket, token_address, inflow_usd, outflow_usd, net_flow_usd, unique_senders, unique_receivers, flow_direction)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (hour_bucket, token_address) DO UPDATE SET
-                inflow_usd = EXCLUDED.inflow_usd,
-                outflow_usd = EXCLUDED.outflow_usd,
-                net_flow_usd = EXCLUDED.net_flow_usd,
-                unique_senders = EXCLUDED.unique_senders,
-                unique_receivers = EXCLUDED.unique_receivers,
-                flow_direction = EXCLUDED.flow_direction
-            """,
-            (
-                hour_bucket,
-                token_address,
-                inflow,
-                outflow,
-                net,
-                len(v["senders"]),
-                len(v["receivers"]),
-                flow_direction,
-            ),
-        )
+        out.append({
+            "hour_bucket": r["hour_bucket"],
+            "token_address": r["token_address"],
+            "inflow_usd": inflow,
+            "outflow_usd": outflow,
+            "net_flow_usd": net,
+            "unique_senders": int(r.get("unique_senders") or 0),
+            "unique_receivers": int(r.get("unique_receivers") or 0),
+            "flow_direction": flow_direction,
+        })
+    write_analytics_rows("analytics_token_flows", FLOW_COLUMNS, out, mode="replace")
 
 
 if __name__ == "__main__":
@@ -1,44 +1,53 @@
 """
-Z-score anomaly detection on hourly volume. Output → analytics_anomalies.
+Z-score anomaly detection on hourly volume, vectorized over a dense token x hour grid.
+Incremental by default: per-token rolling state lives in analytics_anomaly_state and only
+newly closed hours are scored. Output → analytics_anomalies (appended).
 """
 from __future__ import annotations
 
+import os
 import uuid
 from datetime import datetime, timezone, timedelta
 
-from db.connection import init_connection_pool
-from db.queries import run_query, execute_sql
+import numpy as np
+
+from db.connection import init_connection_pool, unit_of_work
+from db.queries import run_query, run_query_columnar, write_analytics_rows
 
 
 def _ensure_pool():
     init_connection_pool()
 
 
-def _hourly_volume(hours: int = 168 * 2) -> list[dict]:
+def _hourly_volume(hours: int = 168 * 2, since: datetime | None = None, until: datetime | None = None) -> dict[str, np.ndarray]:
+    """Hourly swap volume per token for [since, until) as columns; since defaults to `hours` ago."""
     _ensure_pool()
-    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+    since = since or datetime.now(timezone.utc) - timedelta(hours=hours)
+    until = until or datetime.now(timezone.utc) + timedelta(hours=1)
     sql = """
         SELECT
             date_trunc('hour', event_timestamp) AS hour_bucket,
-            token_in_address AS token_address,
+            lower(trim(token_in_address)) AS token_address,
             sum(amount_usd) AS volume_usd
         FROM marts.fact_swaps
-        WHERE event_timestamp >= %s
+        WHERE event_timestamp >= %s AND event_timestamp < %s
+          AND COALESCE(trim(token_in_address), '') <> ''
         GROUP BY 1, 2
     """
     try:
-        return run_query(sql, (since,))
+        return run_query_columnar(sql, (since, until))
     except Exception:
         sql_raw = """
             SELECT
                 date_trunc('hour', event_timestamp) AS hour_bucket,
-                token0_address AS token_address,
+                lower(trim(token0_address)) AS token_address,
                 sum(COALESCE(usd_value, 0)) AS volume_usd
             FROM raw_swaps
-            WHERE event_timestamp >= %s
+            WHERE event_timestamp >= %s AND event_timestamp < %s
+              AND COALESCE(trim(token0_address), '') <> ''
             GROUP BY 1, 2
         """
-        return run_query(sql_raw, (since,))
+        return run_query_columnar(sql_raw, (since, until))
 
 
 def _severity(z: float) -> str:
@@ -54,74 +63,257 @@ def _severity(z: float) -> str:
     return "normal"
 
 
-def run() -> None:
-    _ensure_pool()
-    rows = _hourly_volume(168 * 2)
-    if not rows:
-        return
-    # Build series per (token_address): list of (hour_bucket, volume)
-    by_token: dict[str, list[tuple[datetime, float]]] = {}
-    for r in rows:
-        tok = (r.get("token_address") or "").strip().lower()
-        if not tok:
-            continue
-        h = r.get("hour_bucket")
-        if hasattr(h, "isoformat"):
-            pass
-        elif isinstance(h, str):
-            from dateutil import parser
-            h = parser.parse(h)
-        else:
-            continue
-        vol = float(r.get("volume_usd") or 0)
-        by_token.setdefault(tok, []).append((h, vol))
+WINDOW = 168  # 7 days of hourly buckets
+THRESHOLD = 1.5
+# Hours kept back after they close so dbt has materialised them into fact_swaps
+SETTLE_HOURS = int(os.getenv("ANOMALY_SETTLE_HOURS", "1"))
+# Anomalies older than this are pruned (the dashboard looks at the last two windows)
+RETENTION_HOURS = WINDOW * 2
+ANOMALY_COLUMNS = (
+    "anomaly_id",
+    "hour_bucket",
+    "token_address",
+    "actual_volume",
+    "expected_volume",
+    "z_score",
+    "severity",
+    "detected_at",
+)
+STATE_COLUMNS = ("token_address", "last_hour", "ring", "ring_pos", "hours_seen", "window_sum", "window_sumsq", "updated_at")
+ANOMALY_NAMESPACE = uuid.UUID("6c1f3e4a-8e0b-5d2c-9a7f-3b1e2d4c5a60")
+
+
+def _hour(value: datetime) -> np.datetime64:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, "h")
+
+
+def _dense_grid(
+    data: dict[str, np.ndarray],
+    start: np.datetime64 | None = None,
+    end: np.datetime64 | None = None,
+    tokens: list[str] | None = None,
+) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (tokens, hours, volumes[token, hour], first_index[token]) from hour_bucket /
+    token_address / volume_usd columns: every token on one dense hourly grid over
+    [start, end) (default: the span of the data), hours without swaps filled with 0.
+    `tokens` pins the leading rows of the grid to a known order.
+    """
+    token_idx: dict[str, int] = {t: i for i, t in enumerate(tokens or [])}
+    hours_raw = np.asarray(data.get("hour_bucket", np.array([], dtype="datetime64[h]"))).astype("datetime64[h]")
+    volumes_raw = np.nan_to_num(np.asarray(data.get("volume_usd", np.array([])), dtype=np.float64))
+    tok_ids = np.zeros(len(hours_raw), dtype=np.int64)
+    if len(hours_raw):
+        uniq, inverse = np.unique(np.asarray(data["token_address"]).astype(str), return_inverse=True)
+        for t in uniq:
+            token_idx.setdefault(str(t), len(token_idx))
+        tok_ids = np.array([token_idx[str(t)] for t in uniq], dtype=np.int64)[inverse]
+    if start is None:
+        start = hours_raw.min() if len(hours_raw) else None
+    if end is None:
+        end = hours_raw.max() + 1 if len(hours_raw) else None
+    if start is None or end is None or end <= start:
+        return list(token_idx), np.array([], dtype="datetime64[h]"), np.zeros((len(token_idx), 0)), np.zeros(len(token_idx), dtype=np.int64)
+    hours = np.arange(start, end, dtype="datetime64[h]")
+    cols = (hours_raw - start).astype(np.int64)
+    keep = (cols >= 0) & (cols < len(hours))
+    volumes = np.zeros((len(token_idx), len(hours)))
+    np.add.at(volumes, (tok_ids[keep], cols[keep]), volumes_raw[keep])
+    first = np.full(len(token_idx), len(hours), dtype=np.int64)
+    np.minimum.at(first, tok_ids[keep], cols[keep])
+    return list(token_idx), hours, volumes, first
+
 
-    window = 168  # 7 days
+def _window_sums(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sum of every `window`-wide run of columns, [a, a + window) for a in 0..n_hours - window.
+    Each run is a suffix of one window-aligned block plus a prefix of the next, so nothing
+    is subtracted and a quiet run after a busy one sums exactly.
+    """
+    n_tokens, n_hours = x.shape
+    n_blocks = -(-n_hours // window)
+    blocks = np.zeros((n_tokens, n_blocks * window))
+    blocks[:, :n_hours] = x
+    blocks = blocks.reshape(n_tokens, n_blocks, window)
+    prefix = np.cumsum(blocks, axis=2).reshape(n_tokens, -1)
+    suffix = np.cumsum(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_tokens, -1)
+    starts = np.arange(n_hours - window + 1)
+    # Runs starting mid-block end in the next block, at start + window - 1
+    tail = np.where(starts % window > 0, prefix[:, np.minimum(starts + window - 1, prefix.shape[1] - 1)], 0.0)
+    return suffix[:, starts] + tail
+
+
+def rolling_zscores(volumes: np.ndarray, first: np.ndarray, window: int = WINDOW) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (mean, std, valid) of the `window` hours before each hour, for all tokens at once via
+    block prefix/suffix sums. Population variance, 0 when it is within rounding of the mean
+    (a constant or all-zero window); valid only once a token has a full window of history
+    since its first hour.
+    """
+    n_tokens, n_hours = volumes.shape
+    mean = np.zeros_like(volumes)
+    std = np.zeros_like(volumes)
+    valid = np.zeros(volumes.shape, dtype=bool)
+    if n_hours <= window:
+        return mean, std, valid
+    # Window for hour i is [i - window, i)
+    m = _window_sums(volumes, window)[:, :-1] / window
+    var = _window_sums(volumes * volumes, window)[:, :-1] / window - m * m
+    # Rounding left over from sq/window - m² in a constant window is not spread
+    var[var <= 1e-12 * m * m + 1e-300] = 0.0
+    mean[:, window:] = m
+    std[:, window:] = np.sqrt(var)
+    valid[:, window:] = np.arange(window, n_hours)[None, :] >= (first[:, None] + window)
+    return mean, std, valid
+
+
+def _anomaly_id(token_address: str, hour: datetime) -> uuid.UUID:
+    """Deterministic id, so reruns and incremental passes never duplicate an anomaly."""
+    return uuid.uuid5(ANOMALY_NAMESPACE, f"{token_address}|{hour.isoformat()}")
+
+
+def _score(
+    tokens: list[str],
+    hours: np.ndarray,
+    volumes: np.ndarray,
+    first: np.ndarray,
+    window: int,
+    now: datetime,
+) -> list[dict]:
+    """Anomaly rows for every hour column of `hours`; volumes carries `window` leading history columns."""
+    mean, std, valid = rolling_zscores(volumes, first, window)
+    std = np.where(std == 0, 1e-9, std)
+    z = (volumes - mean) / std
+    offset = volumes.shape[1] - len(hours)
+    hits = np.argwhere(valid & (np.abs(z) > THRESHOLD))
     anomalies = []
-    now = datetime.now(timezone.utc)
-    for token_address, series in by_token.items():
-        series.sort(key=lambda x: x[0])
-        for i in range(window, len(series)):
-            recent = [v for _, v in series[i - window:i]]
-            if len(recent) < 2:
-                continue
-            mean = sum(recent) / len(recent)
-            var = sum((x - mean) ** 2 for x in recent) / len(recent)
-            std = (var ** 0.5) or 1e-9
-            current = series[i][1]
-            z = (current - mean) / std if std else 0
-            if abs(z) > 1.5:
-                severity = _severity(z)
-                anomalies.append({
-                    "anomaly_id": uuid.uuid4(),
-                    "hour_bucket": series[i][0],
-                    "token_address": token_address,
-                    "actual_volume": current,
-                    "expected_volume": mean,
-                    "z_score": round(z, 4),
-                    "severity": severity,
-                    "detected_at": now,
-                })
-
-    execute_sql("TRUNCATE analytics_anomalies")
-    for a in anomalies:
-        execute_sql(
-            """
-            INSERT INTO analytics_anomalies
-            (anomaly_id, hour_bucket, token_address, actual_volume, expected_volume, z_score, severity, detected_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                a["anomaly_id"],
-                a["hour_bucket"],
-                a["token_address"],
-                a["actual_volume"],
-                a["expected_volume"],
-                a["z_score"],
-                a["severity"],
-                a["detected_at"],
-            ),
-        )
+    for ti, ci in hits:
+        if ci < offset:
+            continue
+        zi = float(z[ti, ci])
+        hour = hours[ci - offset].astype(datetime).replace(tzinfo=timezone.utc)
+        anomalies.append({
+            "anomaly_id": _anomaly_id(tokens[ti], hour),
+            "hour_bucket": hour,
+            "token_address": tokens[ti],
+            "actual_volume": float(volumes[ti, ci]),
+            "expected_volume": float(mean[ti, ci]),
+            "z_score": round(zi, 4),
+            "severity": _severity(zi),
+            "detected_at": now,
+        })
+    return anomalies
+
+
+def detect(data: dict[str, np.ndarray], window: int = WINDOW, now: datetime | None = None) -> list[dict]:
+    """Anomaly rows (|z| > THRESHOLD) for hourly volume columns of any number of tokens."""
+    tokens, hours, volumes, first = _dense_grid(data)
+    if not tokens:
+        return []
+    return _score(tokens, hours, volumes, first, window, now or datetime.now(timezone.utc))
+
+
+# Incremental mode: per-token ring buffer of the last WINDOW hourly volumes
+
+def _load_state() -> dict[str, dict]:
+    rows = run_query(
+        "SELECT token_address, last_hour, ring, ring_pos, hours_seen FROM analytics_anomaly_state"
+    )
+    return {r["token_address"]: r for r in rows}
+
+
+def _closed_until(now: datetime) -> datetime:
+    """Exclusive end of the hours safe to process: closed, plus SETTLE_HOURS for dbt to catch up."""
+    return now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=SETTLE_HOURS)
+
+
+def run_incremental(window: int = WINDOW, now: datetime | None = None, reset: bool = False) -> int:
+    """
+    Score only hours closed since the last run against each token's persisted window and
+    append the anomalies. State and anomalies are written in one transaction; with reset,
+    the persisted state is ignored and both tables are replaced in that same transaction.
+    Returns the number of hours processed.
+    """
+    _ensure_pool()
+    now = now or datetime.now(timezone.utc)
+    until = _closed_until(now)
+    state = {} if reset else _load_state()
+    if state:
+        # All tokens advance together, so one watermark covers the table
+        since = max(r["last_hour"] for r in state.values()) + timedelta(hours=1)
+    else:
+        since = until - timedelta(hours=window * 2)
+    if since >= until:
+        return 0
+
+    data = _hourly_volume(since=since, until=until)
+    known = sorted(state)
+    tokens, hours, new_volumes, new_first = _dense_grid(data, _hour(since), _hour(until), known)
+    if not tokens:
+        if reset:
+            _write_incremental([], [], now, reset=True)
+        return 0
+
+    # History columns: each known token's ring unrolled oldest -> newest
+    history = np.zeros((len(tokens), window))
+    first = new_first + window
+    seen = np.zeros(len(tokens), dtype=np.int64)
+    for i, tok in enumerate(known):
+        st = state[tok]
+        ring = np.array(st["ring"] or [], dtype=float)
+        if len(ring) == window:
+            history[i] = np.roll(ring, -int(st["ring_pos"]))
+        seen[i] = int(st["hours_seen"])
+        first[i] = window - min(seen[i], window)
+    volumes = np.concatenate([history, new_volumes], axis=1)
+    anomalies = _score(tokens, hours, volumes, first, window, now)
+
+    # New state: last `window` hours, stored as a ring whose write position is hours_seen % window
+    n_new = len(hours)
+    seen = np.where(np.arange(len(tokens)) < len(known), seen + n_new, n_new - np.minimum(new_first, n_new))
+    ordered = volumes[:, -window:]
+    last_hour = until - timedelta(hours=1)
+    state_rows = []
+    for i, tok in enumerate(tokens):
+        pos = int(seen[i] % window)
+        state_rows.append({
+            "token_address": tok,
+            "last_hour": last_hour,
+            "ring": np.roll(ordered[i], pos).tolist(),
+            "ring_pos": pos,
+            "hours_seen": int(seen[i]),
+            "window_sum": float(ordered[i].sum()),
+            "window_sumsq": float((ordered[i] ** 2).sum()),
+            "updated_at": now,
+        })
+    _write_incremental(anomalies, state_rows, now, reset=reset)
+    return n_new
+
+
+def _write_incremental(anomalies: list[dict], state_rows: list[dict], now: datetime, reset: bool = False) -> None:
+    with unit_of_work() as cur:
+        if reset:
+            # DELETE, not TRUNCATE: readers keep the old rows until this commits
+            cur.execute("DELETE FROM analytics_anomaly_state")
+            cur.execute("DELETE FROM analytics_anomalies")
+        write_analytics_rows("analytics_anomalies", ANOMALY_COLUMNS, anomalies, mode="append", conflict=("anomaly_id",), cur=cur)
+        write_analytics_rows("analytics_anomaly_state", STATE_COLUMNS, state_rows, mode="upsert", conflict=("token_address",), cur=cur)
+        cur.execute("DELETE FROM analytics_anomalies WHERE hour_bucket < %s", (now - timedelta(hours=RETENTION_HOURS),))
+
+
+def run_full(now: datetime | None = None) -> None:
+    """Rebuild: replay the last 2 windows of closed hours into fresh state and anomalies."""
+    run_incremental(now=now, reset=True)
+
+
+def run(mode: str | None = None) -> None:
+    mode = (mode or os.getenv("ANOMALY_MODE", "incremental")).strip().lower()
+    if mode == "full":
+        run_full()
+    else:
+        run_incremental()
 
 
 if __name__ == "__main__":
@@ -1,159 +1,267 @@
 """
 Whale segmentation: K-means (k=4) + RFM scoring. Output → analytics_wallet_segments.
+Cluster ids are stable activity ranks; WALLET_CLUSTER_ENGINE=minibatch warm-starts from
+centroids saved in analytics_cluster_state and re-clusters only changed wallets.
 """
 from __future__ import annotations
 
+import os
 from datetime import datetime, timezone, timedelta
-from decimal import Decimal
 
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
 from db.connection import init_connection_pool
-from db.queries import run_query, execute_sql
+from db.queries import run_query, run_query_columnar, write_analytics_rows
+
+N_CLUSTERS = 4
+N_FEATURES = 3  # recency, log frequency, log volume
+# MiniBatchKMeans engine: rows per partial_fit step and hours between full refits
+MINIBATCH_SIZE = 4096
+REFIT_HOURS = int(os.getenv("WALLET_CLUSTER_REFIT_HOURS", "24"))
+CLUSTER_STATE_COLUMNS = ("engine", "centroids", "ranks", "n_wallets", "n_refit", "full_fit_at", "updated_at")
+SEGMENT_COLUMNS = ("wallet_address", "segment", "cluster_id", "rfm_recency", "rfm_frequency", "rfm_volume", "computed_at")
 
 
 def _ensure_pool():
     init_connection_pool()
 
 
-def _fetch_swap_activity(days: int = 30) -> list[dict]:
+def _wallet_features(days: int = 30) -> dict[str, np.ndarray]:
+    """
+    One row per wallet, aggregated in Postgres: first/last swap time, swap count, volume
+    and largest single swap, as NumPy columns.
+    """
     _ensure_pool()
-    # Prefer marts.fact_swaps; fallback to raw_swaps if marts not populated
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    # Prefer raw_swaps; fallback to marts.fact_swaps
     sql = """
-        SELECT sender_address AS wallet_address, event_timestamp, COALESCE(usd_value, 0) AS amount_usd
+        SELECT
+            lower(trim(sender_address)) AS wallet_address,
+            min(event_timestamp) AS first_ts,
+            max(event_timestamp) AS last_ts,
+            count(*) AS frequency,
+            sum(COALESCE(usd_value, 0)) AS volume,
+            max(COALESCE(usd_value, 0)) AS max_amount
         FROM raw_swaps
         WHERE event_timestamp >= %s
+          AND COALESCE(trim(sender_address), '') <> ''
+        GROUP BY 1
     """
-    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
     try:
-        rows = run_query(sql, (since,))
+        return run_query_columnar(sql, (since,))
     except Exception:
         sql_marts = """
-            SELECT wallet_address, event_timestamp, amount_usd
+            SELECT
+                lower(trim(wallet_address)) AS wallet_address,
+                min(event_timestamp) AS first_ts,
+                max(event_timestamp) AS last_ts,
+                count(*) AS frequency,
+                sum(COALESCE(amount_usd, 0)) AS volume,
+                max(COALESCE(amount_usd, 0)) AS max_amount
             FROM marts.fact_swaps
             WHERE event_timestamp >= %s
+              AND COALESCE(trim(wallet_address), '') <> ''
+            GROUP BY 1
         """
-        rows = run_query(sql_marts, (since,))
-    return rows
+        return run_query_columnar(sql_marts, (since,))
+
+
+def _activity_ranks(centers: np.ndarray) -> np.ndarray:
+    """
+    Stable label per centroid (in standardised feature space): its rank by activity, i.e.
+    low recency, high frequency and volume. 0 = least active, N_CLUSTERS - 1 = most active.
+    """
+    score = -centers[:, 0] + centers[:, 1] + centers[:, 2]
+    ranks = np.empty(len(centers), dtype=np.int64)
+    ranks[np.argsort(score, kind="stable")] = np.arange(len(centers))
+    return ranks
 
 
-def _rfm_and_cluster(rows: list[dict]) -> list[dict]:
+def _cluster_engine() -> str:
+    engine = os.getenv("WALLET_CLUSTER_ENGINE", "kmeans").strip().lower()
+    return engine if engine in ("kmeans", "minibatch") else "kmeans"
+
+
+def _cluster(
+    X_raw: np.ndarray,
+    wallets: np.ndarray,
+    frequency: np.ndarray,
+    volume: np.ndarray,
+    now: datetime,
+) -> np.ndarray:
+    """Stable cluster label (activity rank) per wallet, using the configured engine."""
+    mu = X_raw.mean(axis=0)
+    sd = X_raw.std(axis=0) + 1e-9
+    X = (X_raw - mu) / sd
+    k = min(N_CLUSTERS, len(X))
+    if _cluster_engine() == "kmeans":
+        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+        labels = kmeans.fit_predict(X)
+        return _activity_ranks(kmeans.cluster_centers_)[labels]
+    return _cluster_minibatch(X, mu, sd, k, wallets, frequency, volume, now)
+
+
+def _load_cluster_state(k: int) -> dict | None:
+    try:
+        rows = run_query(
+            "SELECT centroids, ranks, full_fit_at FROM analytics_cluster_state WHERE engine = %s",
+            ("minibatch",),
+        )
+    except Exception:
+        return None
     if not rows:
+        return None
+    centroids = np.array(rows[0]["centroids"], dtype=np.float64)
+    if centroids.size != k * N_FEATURES:
+        return None
+    return {
+        "centroids": centroids.reshape(k, N_FEATURES),
+        "ranks": np.array(rows[0]["ranks"], dtype=np.int64),
+        "full_fit_at": rows[0]["full_fit_at"],
+    }
+
+
+def _previous_assignments() -> dict[str, np.ndarray]:
+    try:
+        return run_query_columnar(
+            "SELECT wallet_address, cluster_id, rfm_frequency, rfm_volume FROM analytics_wallet_segments"
+        )
+    except Exception:
+        return {}
+
+
+def _cluster_minibatch(
+    X: np.ndarray,
+    mu: np.ndarray,
+    sd: np.ndarray,
+    k: int,
+    wallets: np.ndarray,
+    frequency: np.ndarray,
+    volume: np.ndarray,
+    now: datetime,
+) -> np.ndarray:
+    """
+    MiniBatchKMeans warm-started from the centroids saved by the previous run (kept in raw
+    feature space, so they survive re-standardisation). Only wallets whose frequency or
+    volume changed are fed to partial_fit and re-assigned; the rest keep their label,
+    re-mapped if the centroid activity ranks moved. A full fit runs every REFIT_HOURS.
+    """
+    state = _load_cluster_state(k)
+    labels = np.full(len(X), -1, dtype=np.int64)
+    full = state is None or now - state["full_fit_at"] >= timedelta(hours=REFIT_HOURS)
+
+    changed = np.ones(len(X), dtype=bool)
+    if not full:
+        prev = _previous_assignments()
+        if prev:
+            index = {w: i for i, w in enumerate(prev["wallet_address"])}
+            pos = np.array([index.get(w, -1) for w in wallets], dtype=np.int64)
+            seen = pos >= 0
+            p = pos[seen]
+            same = (prev["rfm_frequency"][p] == frequency[seen]) & (prev["rfm_volume"][p] == np.round(volume[seen], 2))
+            changed[np.flatnonzero(seen)[same]] = False
+            # Their previous labels, as ranks under the previous centroids
+            keep_old_ranks = prev["cluster_id"][p][same].astype(np.int64)
+
+    init = (state["centroids"] - mu) / sd if state is not None else "k-means++"
+    model = MiniBatchKMeans(
+        n_clusters=k,
+        init=init,
+        n_init=1 if state is not None else 3,
+        batch_size=MINIBATCH_SIZE,
+        random_state=42,
+    )
+    if full:
+        model.fit(X)
+    elif changed.sum() >= k:
+        # Even-sized batches, so none is smaller than k (partial_fit rejects those)
+        X_changed = X[changed]
+        for batch in np.array_split(X_changed, -(-len(X_changed) // MINIBATCH_SIZE)):
+            model.partial_fit(batch)
+    else:
+        # Too few changed wallets to update the centroids: assign them to the saved ones
+        model.cluster_centers_ = np.asarray(init, dtype=np.float64)
+
+    ranks = _activity_ranks(model.cluster_centers_)
+    if changed.any():
+        # Nearest centroid (what predict does; also works when centroids were only assigned)
+        dist = ((X[changed][:, None, :] - model.cluster_centers_[None, :, :]) ** 2).sum(axis=2)
+        labels[changed] = ranks[dist.argmin(axis=1)]
+    if not changed.all():
+        old_index = np.argsort(state["ranks"])  # old rank -> centroid index
+        labels[~changed] = ranks[old_index[keep_old_ranks]]
+
+    write_analytics_rows(
+        "analytics_cluster_state",
+        CLUSTER_STATE_COLUMNS,
+        [{
+            "engine": "minibatch",
+            "centroids": (model.cluster_centers_ * sd + mu).ravel().tolist(),
+            "ranks": ranks.tolist(),
+            "n_wallets": int(len(X)),
+            "n_refit": int(changed.sum()),
+            "full_fit_at": now if full else state["full_fit_at"],
+            "updated_at": now,
+        }],
+        mode="upsert",
+        conflict=("engine",),
+    )
+    return labels
+
+
+def _rfm_and_cluster(features: dict[str, np.ndarray], now: datetime | None = None) -> list[dict]:
+    if not features or len(features["wallet_address"]) < 4:
         return []
-    now = datetime.now(timezone.utc)
-    by_wallet: dict[str, list[dict]] = {}
-    for r in rows:
-        w = (r.get("wallet_address") or "").strip().lower()
-        if not w:
-            continue
-        if w not in by_wallet:
-            by_wallet[w] = []
-        ts = r.get("event_timestamp")
-        if hasattr(ts, "isoformat"):
-            pass
-        elif isinstance(ts, str):
-            from dateutil import parser
-            ts = parser.parse(ts)
-        else:
-            continue
-        amount = float(r.get("amount_usd") or 0)
-        by_wallet[w].append({"ts": ts, "amount": amount})
-
-    recency_list = []
-    frequency_list = []
-    volume_list = []
-    wallets = []
-    for w, events in by_wallet.items():
-        if not events:
-            continue
-        last_ts = max(e["ts"] for e in events)
-        recency_list.append((now - last_ts).total_seconds() / 86400)
-        frequency_list.append(len(events))
-        volume_list.append(sum(e["amount"] for e in events))
-        wallets.append(w)
-
-    if len(wallets) < 4:
-        return []
+    now = now or datetime.now(timezone.utc)
+    now64 = np.datetime64(now.astimezone(timezone.utc).replace(tzinfo=None), "us")
+    wallets = features["wallet_address"]
+    frequency = features["frequency"].astype(np.int64)
+    volume = np.nan_to_num(features["volume"])
+    day = np.timedelta64(86400, "s")
+    recency = (now64 - features["last_ts"]) / day
+    n_days = np.maximum(0.1, (now64 - features["first_ts"]) / day)
 
     X = np.column_stack([
-        np.array(recency_list),
-        np.log1p(frequency_list),
-        np.log1p(volume_list),
+        recency,
+        np.log1p(frequency),
+        np.log1p(volume),
     ])
-    X = (X - X.mean(axis=0)) / (X.std(axis=0) + 1e-9)
-    kmeans = KMeans(n_clusters=min(4, len(wallets)), random_state=42, n_init=10)
-    labels = kmeans.fit_predict(X)
-
-    volume_sorted = sorted(zip(wallets, volume_list), key=lambda x: -x[1])
-    top_1_pct = max(1, len(volume_sorted) // 100)
-    whale_wallets = {w for w, _ in volume_sorted[:top_1_pct]}
-    for w, events in by_wallet.items():
-        if any(e["amount"] >= 50000 for e in events):
-            whale_wallets.add(w)
-
-    result = []
-    for i, w in enumerate(wallets):
-        rec = recency_list[i]
-        freq = frequency_list[i]
-        vol = volume_list[i]
-        cluster = int(labels[i])
-        # Bot: >50 swaps/day and avg < 100
-        n_days = max(0.1, (now - min(e["ts"] for e in by_wallet[w])).total_seconds() / 86400)
-        swaps_per_day = len(by_wallet[w]) / n_days
-        avg_size = vol / len(by_wallet[w]) if by_wallet[w] else 0
-        if swaps_per_day >= 50 and avg_size < 100:
-            segment = "bot"
-        elif w in whale_wallets:
-            segment = "whale"
-        elif cluster == 1 or (freq >= 10 and vol >= 10000):
-            segment = "active_trader"
-        else:
-            segment = "retail"
-        result.append({
-            "wallet_address": w,
-            "segment": segment,
-            "cluster_id": cluster,
-            "rfm_recency": round(rec, 4),
-            "rfm_frequency": freq,
-            "rfm_volume": round(vol, 2),
+    labels = _cluster(X, wallets, frequency, volume, now)
+
+    # Whale: top 1% by volume, or any single swap >= 50k
+    top_1_pct = max(1, len(wallets) // 100)
+    is_whale = np.zeros(len(wallets), dtype=bool)
+    is_whale[np.argsort(-volume, kind="stable")[:top_1_pct]] = True
+    is_whale |= np.nan_to_num(features["max_amount"]) >= 50000
+    # Bot: >50 swaps/day and avg < 100
+    is_bot = (frequency / n_days >= 50) & (volume / np.maximum(frequency, 1) < 100)
+    # Labels are activity ranks, so the top one is always the most active cluster
+    is_active = (labels == N_CLUSTERS - 1) | ((frequency >= 10) & (volume >= 10000))
+    segments = np.select([is_bot, is_whale, is_active], ["bot", "whale", "active_trader"], default="retail")
+
+    recency_r = np.round(recency, 4)
+    volume_r = np.round(volume, 2)
+    return [
+        {
+            "wallet_address": wallets[i],
+            "segment": str(segments[i]),
+            "cluster_id": int(labels[i]),
+            "rfm_recency": float(recency_r[i]),
+            "rfm_frequency": int(frequency[i]),
+            "rfm_volume": float(volume_r[i]),
             "computed_at": now,
-        })
-    return result
+        }
+        for i in range(len(wallets))
+    ]
 
 
 def run() -> None:
     _ensure_pool()
-    rows = _fetch_swap_activity(30)
-    segments = _rfm_and_cluster(rows)
+    segments = _rfm_and_cluster(_wallet_features(30))
     if not segments:
         return
-    now = datetime.now(timezone.utc)
-    execute_sql("TRUNCATE analytics_wallet_segments")
-    for s in segments:
-        execute_sql(
-            """
-            INSERT INTO analytics_wallet_segments
-            (wallet_address, segment, cluster_id, rfm_recency, rfm_frequency, rfm_volume, computed_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (wallet_address) DO UPDATE SET
-                segment = EXCLUDED.segment,
-                cluster_id = EXCLUDED.cluster_id,
-                rfm_recency = EXCLUDED.rfm_recency,
-                rfm_frequency = EXCLUDED.rfm_frequency,
-                rfm_volume = EXCLUDED.rfm_volume,
-                computed_at = EXCLUDED.computed_at
-            """,
-            (
-                s["wallet_address"],
-                s["segment"],
-                s["cluster_id"],
-                s["rfm_recency"],
-                s["rfm_frequency"],
-                s["rfm_volume"],
-                s["computed_at"],
-            ),
-        )
+    write_analytics_rows("analytics_wallet_segments", SEGMENT_COLUMNS, segments, mode="replace")
 
 
 if __name__ == "__main__":
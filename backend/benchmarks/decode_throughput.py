@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Decoder throughput: web3 event processing + decode() vs raw topics/data decode_raw_batch().
+Checks both paths produce identical records.
+
+Usage (from backend/):
+  python -m benchmarks.decode_throughput [n_logs]
+"""
+from __future__ import annotations
+
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3 import Web3
+
+from indexer.decoder import (
+    ERC20_TRANSFER_ABI,
+    SWAP_TOPIC,
+    TRANSFER_TOPIC,
+    UNISWAP_V3_SWAP_ABI,
+    ERC20Decoder,
+    UniswapDecoder,
+)
+from indexer.evm_indexer import UNISWAP_V3_POOLS
+
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+
+
+def _addr_topic(rng: random.Random) -> HexBytes:
+    return HexBytes(b"\0" * 12 + rng.randbytes(20))
+
+
+def _log(rng: random.Random, i: int, address: str, topic: str, data: bytes) -> dict:
+    return {
+        "address": address,
+        "topics": [HexBytes(topic), _addr_topic(rng), _addr_topic(rng)],
+        "data": HexBytes(data),
+        "blockNumber": 18_000_000 + i // 20,
+        "logIndex": i % 20,
+        "transactionHash": HexBytes(rng.randbytes(32)),
+        "transactionIndex": 0,
+        "blockHash": HexBytes(rng.randbytes(32)),
+        "removed": False,
+    }
+
+
+def make_swaps(n: int, rng: random.Random) -> list[dict]:
+    pool = UNISWAP_V3_POOLS[0]["address"]
+    logs = []
+    for i in range(n):
+        a0 = rng.randint(1, 10**12)
+        a1 = rng.randint(1, 10**21)
+        if rng.random() < 0.5:
+            a0 = -a0
+        else:
+            a1 = -a1
+        data = encode(
+            ["int256", "int256", "uint160", "uint128", "int24"],
+            [a0, a1, rng.randint(1, 2**160 - 1), rng.randint(0, 2**128 - 1), rng.randint(-887272, 887272)],
+        )
+        logs.append(_log(rng, i, pool, SWAP_TOPIC, data))
+    return logs
+
+
+def make_transfers(n: int, rng: random.Random) -> list[dict]:
+    return [_log(rng, i, USDC, TRANSFER_TOPIC, encode(["uint256"], [rng.randint(0, 2**96)])) for i in range(n)]
+
+
+def _bench(label: str, fn) -> list:
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    print(f"  {label:<8} {dt * 1000:9.1f} ms  {len(out) / dt:12,.0f} logs/s")
+    return out
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(7)
+    ts = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    w3 = Web3()
+    pool = UNISWAP_V3_POOLS[0]
+    cases = [
+        (
+            "Swap",
+            make_swaps(n, rng),
+            UniswapDecoder(pool["address"], pool["token0"], pool["token1"]),
+            w3.eth.contract(address=Web3.to_checksum_address(pool["address"]), abi=UNISWAP_V3_SWAP_ABI).events.Swap(),
+        ),
+        (
+            "Transfer",
+            make_transfers(n, rng),
+            ERC20Decoder(USDC),
+            w3.eth.contract(address=USDC, abi=ERC20_TRANSFER_ABI).events.Transfer(),
+        ),
+    ]
+    for name, logs, decoder, event in cases:
+        print(f"{name} x {n}")
+        web3_out = _bench("web3", lambda: [decoder.decode(dict(event.process_log(l)), ts) for l in logs])
+        raw_out = _bench("raw", lambda: decoder.decode_raw_batch(logs, lambda bn: ts))
+        assert web3_out == raw_out, f"{name}: raw decode differs from web3 decode"
+    print("raw and web3 decoders agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Query plans for the hot raw-table queries (analysis windows, /api/swaps fallbacks, pool
+price warm-up): scan types, partitions touched and cost. Run it before and after
+`python -m db.migrate` to compare.
+
+Usage (from backend/):
+  python -m benchmarks.query_plans [--analyze] [--save plans.json] [--baseline plans.json]
+"""
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from analysis.protocol_health import _health_sql
+from analysis.token_flow_analysis import _flow_sql
+from db.connection import get_conn_cursor
+from indexer.evm_indexer import UNISWAP_V3_POOLS
+
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+
+def _sample(cur, sql: str, default: Any) -> Any:
+    cur.execute(sql)
+    row = cur.fetchone()
+    return row[0] if row and row[0] is not None else default
+
+
+def _queries(cur) -> List[Tuple[str, str, tuple]]:
+    now = datetime.now(timezone.utc)
+    wallet = _sample(cur, "SELECT sender_address FROM raw_swaps ORDER BY event_timestamp DESC LIMIT 1", "0x0")
+    block = _sample(cur, "SELECT max(block_number) FROM raw_swaps", 0)
+    return [
+        (
+            "protocol_health window (7d)",
+            _health_sql("raw_swaps", "sender_address", "COALESCE(usd_value, 0)", since=True),
+            (now - timedelta(days=7),),
+        ),
+        ("token_flow window (336h)", _flow_sql("raw_transfers", "usd_value", False), ((now - timedelta(hours=336)).isoformat(),)),
+        (
+            "api swaps newest",
+            "SELECT * FROM raw_swaps ORDER BY event_timestamp DESC LIMIT 100 OFFSET 0",
+            (),
+        ),
+        (
+            "api swaps by wallet",
+            "SELECT * FROM raw_swaps WHERE sender_address = %s ORDER BY event_timestamp DESC LIMIT 100",
+            (wallet,),
+        ),
+        (
+            "api swaps by token",
+            "SELECT * FROM raw_swaps WHERE token0_address = %s OR token1_address = %s ORDER BY event_timestamp DESC LIMIT 100",
+            (WETH, WETH),
+        ),
+        (
+            "transfers by token (24h)",
+            "SELECT count(*) FROM raw_transfers WHERE token_address = %s AND event_timestamp >= %s",
+            (WETH, now - timedelta(hours=24)),
+        ),
+        (
+            "pool price warm-up",
+            """
+            SELECT DISTINCT ON (lower(pool_address)) lower(pool_address), block_number, sqrt_price_x96
+            FROM raw_swaps
+            WHERE lower(pool_address) = ANY(%s) AND block_number < %s AND sqrt_price_x96 IS NOT NULL
+            ORDER BY lower(pool_address), block_number DESC, log_index DESC
+            """,
+            ([p["address"].lower() for p in UNISWAP_V3_POOLS], block),
+        ),
+    ]
+
+
+def _walk(node: Dict[str, Any], scans: List[str], relations: set) -> None:
+    kind = node.get("Node Type", "")
+    if "Scan" in kind:
+        scans.append(kind)
+        if node.get("Relation Name"):
+            relations.add(node["Relation Name"])
+    for child in node.get("Plans") or []:
+        _walk(child, scans, relations)
+
+
+def explain(cur, sql: str, params: tuple, analyze: bool) -> Dict[str, Any]:
+    opts = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cur.execute(f"EXPLAIN ({opts}) {sql}", params)
+    raw = cur.fetchone()[0]
+    doc = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    plan = doc["Plan"]
+    scans: List[str] = []
+    relations: set = set()
+    _walk(plan, scans, relations)
+    return {
+        "cost": plan.get("Total Cost"),
+        "time_ms": doc.get("Execution Time"),
+        "scans": sorted(set(scans)),
+        "relations": len(relations),
+    }
+
+
+def main(argv: List[str]) -> None:
+    analyze = "--analyze" in argv
+    save = argv[argv.index("--save") + 1] if "--save" in argv else None
+    baseline_path = argv[argv.index("--baseline") + 1] if "--baseline" in argv else None
+    baseline = json.load(open(baseline_path)) if baseline_path else {}
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with get_conn_cursor() as (conn, cur):
+        for name, sql, params in _queries(cur):
+            results[name] = explain(cur, sql, params, analyze)
+
+    print(f"{'query':<30} {'cost':>12} {'time ms':>10} {'rels':>5}  scans")
+    for name, r in results.items():
+        time_ms = f"{r['time_ms']:.1f}" if r["time_ms"] is not None else "-"
+        print(f"{name:<30} {r['cost']:>12.1f} {time_ms:>10} {r['relations']:>5}  {', '.join(r['scans'])}")
+        before = baseline.get(name)
+        if before:
+            ratio = before["cost"] / r["cost"] if r["cost"] else float("inf")
+            print(f"{'':<30} {before['cost']:>12.1f} {'':>10} {before['relations']:>5}  {', '.join(before['scans'])}  (baseline, {ratio:.1f}x cost)")
+    if save:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved to {save}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
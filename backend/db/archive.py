@@ -0,0 +1,347 @@
+"""
+Raw-table archival: closed monthly partitions of raw_events / raw_swaps / raw_transfers are
+exported to compressed Parquet under RAW_ARCHIVE_DIR, recorded in manifest.json, then
+dropped from Postgres. Readers serve archived rows back to backfill (instead of the RPC)
+and to full re-analysis (protocol_health.run_full).
+
+Layout: <RAW_ARCHIVE_DIR>/<table>/<table>_YYYYMM.parquet
+NUMERIC and JSONB columns are stored as text (uint256 amounts overflow decimal128).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+from .connection import get_conn_cursor
+from .partitions import RAW_TABLES, closed_partitions, ensure_months
+from .queries import stream_batches
+
+ARCHIVE_DIR = Path(os.getenv("RAW_ARCHIVE_DIR", str(Path(__file__).resolve().parents[1] / "archive")))
+COMPRESSION = os.getenv("RAW_ARCHIVE_COMPRESSION", "zstd")
+MANIFEST_NAME = "manifest.json"
+# Parquet row group size; also the read batch size
+ROW_GROUP_SIZE = 100_000
+
+_manifest_lock = threading.Lock()
+
+
+def _arrow_type(pg_type: str):
+    import pyarrow as pa
+
+    return {
+        "bigint": pa.int64(),
+        "integer": pa.int32(),
+        "boolean": pa.bool_(),
+        "bytea": pa.binary(),
+        "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+    }.get(pg_type, pa.string())
+
+
+def _columns(cur, table: str) -> List[Tuple[str, str]]:
+    """(column, Postgres data_type) of `table` in table order."""
+    cur.execute(
+        """
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+        """,
+        (table,),
+    )
+    return [(r[0], r[1]) for r in cur.fetchall()]
+
+
+def _select_list(columns: Sequence[Tuple[str, str]]) -> str:
+    return ", ".join(f"{c}::text AS {c}" if t in ("numeric", "jsonb") else c for c, t in columns)
+
+
+# Manifest
+
+def _manifest_path() -> Path:
+    return ARCHIVE_DIR / MANIFEST_NAME
+
+
+def load_manifest() -> List[Dict[str, Any]]:
+    """Archived months as {table, month, path, rows, bytes, sha256, min_block, max_block, ...}."""
+    path = _manifest_path()
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return json.load(f).get("partitions", [])
+
+
+def _record(entry: Dict[str, Any]) -> None:
+    """Add or replace the (table, month) entry; the file is swapped in atomically."""
+    with _manifest_lock:
+        entries = [e for e in load_manifest() if (e["table"], e["month"]) != (entry["table"], entry["month"])]
+        entries.append(entry)
+        entries.sort(key=lambda e: (e["table"], e["month"]))
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = _manifest_path().with_suffix(".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"partitions": entries}, f, indent=2)
+        os.replace(tmp, _manifest_path())
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# Export
+
+def _write_parquet(relation: str, columns: Sequence[Tuple[str, str]], dest: Path) -> Dict[str, Any]:
+    """
+    Stream one partition into dest (via a temp file). Rows already archived at dest and not in
+    the partition (a month restored for backfill, then archived again) are carried over.
+    Returns rows and block range.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [pa.field(c, _arrow_type(t)) for c, t in columns],
+        metadata={"pg_types": json.dumps(dict(columns))},
+    )
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(".parquet.tmp")
+    rows = 0
+    blocks: List[int] = []
+    keys: set = set()
+    sql = f'SELECT {_select_list(columns)} FROM "{relation}" ORDER BY block_number, log_index'
+    with pq.ParquetWriter(tmp, schema, compression=COMPRESSION) as writer:
+        for batch in stream_batches(sql, (), ROW_GROUP_SIZE, columnar=True):
+            arrays = []
+            for c, t in columns:
+                values = batch[c]
+                if t == "bytea":
+                    values = [None if v is None else bytes(v) for v in values]
+                arrays.append(pa.array(values, type=schema.field(c).type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=ROW_GROUP_SIZE)
+            rows += len(batch["block_number"])
+            blocks += [batch["block_number"][0], batch["block_number"][-1]]
+            if dest.exists():
+                keys.update(zip(batch["tx_hash"], batch["log_index"]))
+        if dest.exists():
+            prior = pq.read_table(dest)
+            keep = [(h, i) not in keys for h, i in zip(prior.column("tx_hash").to_pylist(), prior.column("log_index").to_pylist())]
+            prior = prior.filter(pa.array(keep, type=pa.bool_())).cast(schema)
+            if prior.num_rows:
+                writer.write_table(prior, row_group_size=ROW_GROUP_SIZE)
+                rows += prior.num_rows
+                blocks += [pc.min(prior.column("block_number")).as_py(), pc.max(prior.column("block_number")).as_py()]
+    os.replace(tmp, dest)
+    return {"rows": rows, "min_block": min(blocks) if blocks else None, "max_block": max(blocks) if blocks else None}
+
+
+def archive_partition(parent: str, name: str, month: date, attached: bool = True) -> Dict[str, Any]:
+    """
+    Export one monthly partition to Parquet, check the row count, record it in the manifest,
+    then drop it from Postgres (detaching first if still attached). Returns the manifest entry.
+    """
+    dest = ARCHIVE_DIR / parent / f"{name}.parquet"
+    prior = next((e for e in load_manifest() if e["table"] == parent and e["month"] == month.strftime("%Y-%m")), None)
+    with get_conn_cursor() as (conn, cur):
+        columns = _columns(cur, parent)
+        cur.execute(f'SELECT count(*) FROM "{name}"')
+        expected = cur.fetchone()[0]
+    if prior is None or expected:
+        written = _write_parquet(name, columns, dest)
+        if written["rows"] < expected:
+            raise RuntimeError(f"{name}: wrote {written['rows']} rows, partition has {expected}")
+        entry = {
+            "table": parent,
+            "partition": name,
+            "month": month.strftime("%Y-%m"),
+            "path": str(dest.relative_to(ARCHIVE_DIR)),
+            "rows": written["rows"],
+            "bytes": dest.stat().st_size,
+            "sha256": _sha256(dest),
+            "min_block": written["min_block"],
+            "max_block": written["max_block"],
+            "compression": COMPRESSION,
+            "archived_at": datetime.now(timezone.utc).isoformat(),
+        }
+        _record(entry)
+    else:
+        # Empty partition for a month that is already archived: nothing to add
+        entry = prior
+    with get_conn_cursor() as (conn, cur):
+        if attached:
+            cur.execute(f'ALTER TABLE {parent} DETACH PARTITION "{name}"')
+        cur.execute(f'DROP TABLE "{name}"')
+    return entry
+
+
+def _detached_partitions(parent: str) -> List[Dict[str, Any]]:
+    """Monthly tables left behind by an earlier detach (see partitions.detach_older_than)."""
+    with get_conn_cursor() as (conn, cur):
+        cur.execute(
+            """
+            SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition
+              AND relnamespace = current_schema()::regnamespace
+              AND relname ~ %s
+            """,
+            (f"^{parent}_[0-9]{{6}}$",),
+        )
+        names = sorted(r[0] for r in cur.fetchall())
+    return [{"name": n, "month": date(int(n[-6:-2]), int(n[-2:]), 1)} for n in names]
+
+
+def archive_closed(keep_months: int) -> List[Dict[str, Any]]:
+    """Archive and drop every raw-table month older than keep_months (and detached leftovers)."""
+    entries = []
+    for parent in RAW_TABLES:
+        for p in _detached_partitions(parent):
+            entries.append(archive_partition(parent, p["name"], p["month"], attached=False))
+        for p in closed_partitions(parent, keep_months):
+            entries.append(archive_partition(parent, p["name"], p["month"]))
+    return entries
+
+
+# Readers
+
+def _entries(table: str, since: datetime | None = None, until: datetime | None = None) -> List[Dict[str, Any]]:
+    lo = since.strftime("%Y-%m") if since else None
+    hi = until.strftime("%Y-%m") if until else None
+    return [
+        e for e in load_manifest()
+        if e["table"] == table and e["rows"] and (lo is None or e["month"] >= lo) and (hi is None or e["month"] <= hi)
+    ]
+
+
+def _iter_tables(entries: Sequence[Dict[str, Any]], columns: Sequence[str] | None, predicate) -> Iterator[Tuple[Any, Dict[str, str]]]:
+    """Filtered Arrow tables (one per row group) plus the Postgres types of the archived columns."""
+    import pyarrow.parquet as pq
+
+    for e in entries:
+        pf = pq.ParquetFile(ARCHIVE_DIR / e["path"])
+        pg_types = json.loads(pf.schema_arrow.metadata[b"pg_types"])
+        for batch in pf.iter_batches(batch_size=ROW_GROUP_SIZE):
+            table = batch if predicate is None else batch.filter(predicate(batch))
+            if columns:
+                table = table.select(list(columns))
+            if table.num_rows:
+                yield table, pg_types
+
+
+def _time_predicate(since: datetime | None, until: datetime | None):
+    if since is None and until is None:
+        return None
+    import pyarrow.compute as pc
+
+    def pred(batch):
+        ts = batch.column("event_timestamp")
+        mask = None
+        if since is not None:
+            mask = pc.greater_equal(ts, since)
+        if until is not None:
+            upper = pc.less(ts, until)
+            mask = upper if mask is None else pc.and_(mask, upper)
+        return mask
+
+    return pred
+
+
+def _py_rows(table, pg_types: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Arrow rows as dicts shaped like psycopg2 results (NUMERIC -> Decimal)."""
+    rows = table.to_pylist()
+    numeric = [c for c in table.column_names if pg_types.get(c) == "numeric"]
+    for r in rows:
+        for c in numeric:
+            if r[c] is not None:
+                r[c] = Decimal(r[c])
+    return rows
+
+
+def read_columnar(
+    table: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    columns: Sequence[str] | None = None,
+) -> dict:
+    """Archived rows as {column: NumPy array}, typed like queries.run_query_columnar; {} if none."""
+    import numpy as np
+    import pyarrow as pa
+
+    parts: Dict[str, list] = {}
+    for t, pg_types in _iter_tables(_entries(table, since, until), columns, _time_predicate(since, until)):
+        for name in t.column_names:
+            col = t.column(name)
+            if pg_types.get(name) in ("numeric", "bigint", "integer"):
+                arr = col.cast(pa.float64()).to_numpy(zero_copy_only=False)
+            elif pa.types.is_timestamp(col.type):
+                arr = col.to_numpy().astype("datetime64[us]")
+            else:
+                arr = np.array(col.to_pylist(), dtype=object)
+            parts.setdefault(name, []).append(arr)
+    return {name: np.concatenate(arrays) for name, arrays in parts.items()}
+
+
+# Backfill
+
+def _block_coverage(table: str) -> List[Tuple[int, int]]:
+    """Block ranges fully held by the archive: runs of consecutive archived months."""
+    months = sorted((e for e in load_manifest() if e["table"] == table), key=lambda e: e["month"])
+    ranges: List[Tuple[int, int]] = []
+    prev = None
+    for e in months:
+        y, m = map(int, e["month"].split("-"))
+        contiguous = prev is not None and (y * 12 + m) - prev == 1
+        prev = y * 12 + m
+        if e["min_block"] is None:
+            # Empty month: keeps a run contiguous but adds no blocks
+            continue
+        if contiguous and ranges:
+            ranges[-1] = (ranges[-1][0], e["max_block"])
+        else:
+            ranges.append((e["min_block"], e["max_block"]))
+    return ranges
+
+
+def covers(from_block: int, to_block: int) -> bool:
+    """True when raw_swaps and raw_transfers are both archived for the whole block range."""
+    for table in ("raw_swaps", "raw_transfers"):
+        if not any(lo <= from_block and to_block <= hi for lo, hi in _block_coverage(table)):
+            return False
+    return True
+
+
+def rows_for_blocks(from_block: int, to_block: int) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """(events, swaps, transfers) archived for [from_block, to_block], ready for copy_raw_rows."""
+    import pyarrow.compute as pc
+
+    from .queries import RAW_EVENT_COLUMNS, RAW_SWAP_COLUMNS, RAW_TRANSFER_COLUMNS
+
+    def pred(batch):
+        b = batch.column("block_number")
+        return pc.and_(pc.greater_equal(b, from_block), pc.less_equal(b, to_block))
+
+    out = []
+    for table, columns in (
+        ("raw_events", RAW_EVENT_COLUMNS),
+        ("raw_swaps", RAW_SWAP_COLUMNS),
+        ("raw_transfers", RAW_TRANSFER_COLUMNS),
+    ):
+        entries = [
+            e for e in load_manifest()
+            if e["table"] == table and e["rows"] and e["min_block"] <= to_block and e["max_block"] >= from_block
+        ]
+        rows: List[Dict] = []
+        for t, pg_types in _iter_tables(entries, columns, pred):
+            rows.extend(_py_rows(t, pg_types))
+        out.append(rows)
+        # Restored rows need their month's partition back, or they'd land in the default one
+        ensure_months(table, {r["event_timestamp"].date().replace(day=1) for r in rows})
+    return out[0], out[1], out[2]
@@ -64,3 +64,14 @@ def get_conn_cursor():
     finally:
         _pool.putconn(conn)
 
+
+@contextmanager
+def unit_of_work():
+    """
+    One connection and one transaction spanning several writes.
+
+    Yields a cursor to pass as ``cur=`` to db.queries functions; everything commits
+    together on exit or rolls back together on error.
+    """
+    with get_conn_cursor() as (conn, cur):
+        yield cur
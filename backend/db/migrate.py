@@ -0,0 +1,78 @@
+"""
+Schema migrations: backend/db/migrations/NNNN_name.sql applied in file-name order on top of
+schema.sql, each in its own transaction and recorded in schema_migrations.
+
+Usage (from backend/):
+  python -m db.migrate            # apply pending migrations
+  python -m db.migrate status     # list applied / pending
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+from .connection import get_conn_cursor
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Serialises concurrent runners (e.g. several API replicas starting at once)
+_LOCK_ID = 0x43504D47
+
+
+def _ensure_table(cur) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version     TEXT PRIMARY KEY,
+            applied_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+def available() -> List[Tuple[str, Path]]:
+    """(version, path) of every migration file, in order; version is the file stem."""
+    return [(p.stem, p) for p in sorted(MIGRATIONS_DIR.glob("*.sql"))]
+
+
+def applied() -> set:
+    with get_conn_cursor() as (conn, cur):
+        _ensure_table(cur)
+        cur.execute("SELECT version FROM schema_migrations")
+        return {r[0] for r in cur.fetchall()}
+
+
+def pending() -> List[Tuple[str, Path]]:
+    done = applied()
+    return [(v, p) for v, p in available() if v not in done]
+
+
+def migrate() -> List[str]:
+    """Apply pending migrations in order; stops at the first failure. Returns versions applied."""
+    done: List[str] = []
+    for version, path in pending():
+        with get_conn_cursor() as (conn, cur):
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_ID,))
+            # Another runner may have applied it while we waited for the lock
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone():
+                continue
+            cur.execute(path.read_text())
+            cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        print(f"[Migrate] applied {version}")
+        done.append(version)
+    return done
+
+
+def main(argv: List[str]) -> None:
+    if argv and argv[0] == "status":
+        done = applied()
+        for version, _ in available():
+            print(f"{'applied' if version in done else 'pending'}  {version}")
+        return
+    if not migrate():
+        print("[Migrate] schema is up to date")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
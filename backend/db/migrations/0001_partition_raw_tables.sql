@@ -0,0 +1,88 @@
+-- Monthly range partitioning of raw_events / raw_swaps / raw_transfers on event_timestamp.
+--
+-- The partition key must be part of every unique constraint, so the primary key becomes
+-- (id, event_timestamp) and the dedup key (tx_hash, log_index, event_timestamp). A log's
+-- event_timestamp is its block's timestamp, so this dedups exactly like before; inserts use
+-- a target-less ON CONFLICT DO NOTHING.
+--
+-- Existing rows are copied into the new tables. dbt views built on the old tables are
+-- dropped with them; the next `dbt run` recreates them.
+
+-- Create monthly partitions <parent>_YYYYMM covering from_month..to_month (UTC month bounds)
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent TEXT, from_month DATE, to_month DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    m       DATE := date_trunc('month', from_month)::date;
+    part    TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE m <= to_month LOOP
+        part := format('%s_%s', parent, to_char(m, 'YYYYMM'));
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part,
+                parent,
+                m::timestamp AT TIME ZONE 'UTC',
+                (m + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+            );
+            created := created + 1;
+        END IF;
+        m := (m + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+DO $$
+DECLARE
+    t      TEXT;
+    legacy TEXT;
+    idx    RECORD;
+    lo     DATE;
+    hi     DATE;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['raw_events', 'raw_swaps', 'raw_transfers'] LOOP
+        IF (SELECT relkind FROM pg_class WHERE oid = t::regclass) = 'p' THEN
+            CONTINUE;
+        END IF;
+        legacy := t || '_legacy';
+
+        -- Free the index / constraint names for the new table
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', t, legacy);
+        FOR idx IN
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = legacy::regclass
+        LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.relname, idx.relname || '_legacy');
+        END LOOP;
+
+        -- Same columns, defaults (id sequence) and NOT NULLs; keys rebuilt with the partition key
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (event_timestamp)',
+            t, legacy
+        );
+        EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, event_timestamp)', t);
+        EXECUTE format('ALTER TABLE %I ADD UNIQUE (tx_hash, log_index, event_timestamp)', t);
+        EXECUTE format('ALTER SEQUENCE %I OWNED BY %I.id', t || '_id_seq', t);
+        -- Catches rows outside every monthly partition; keep it empty by creating months ahead
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', t || '_default', t);
+
+        -- Months from Uniswap V3 launch (or the oldest row) to two months ahead
+        EXECUTE format('SELECT min(event_timestamp)::date, max(event_timestamp)::date FROM %I', legacy) INTO lo, hi;
+        PERFORM ensure_monthly_partitions(
+            t,
+            LEAST(coalesce(lo, DATE '2021-05-01'), DATE '2021-05-01'),
+            (GREATEST(coalesce(hi, current_date), current_date) + interval '2 months')::date
+        );
+
+        EXECUTE format('INSERT INTO %I SELECT * FROM %I', t, legacy);
+        -- CASCADE also drops every view on the old table (the dbt staging views, and any
+        -- dbt model views built on them); run `dbt run` after migrating to recreate them
+        EXECUTE format('DROP TABLE %I CASCADE', legacy);
+    END LOOP;
+END;
+$$;
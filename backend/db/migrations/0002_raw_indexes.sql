@@ -0,0 +1,27 @@
+-- Secondary indexes matching the query patterns. Created on the partitioned parents, so
+-- every existing and future monthly partition gets its own copy.
+
+-- raw_swaps: /api/swaps newest-first (fallback when marts.fact_swaps is missing), per-wallet
+-- and per-token lookups, pool price warm-up, and analysis windows on event_timestamp
+CREATE INDEX IF NOT EXISTS raw_swaps_event_timestamp_idx ON raw_swaps (event_timestamp DESC);
+CREATE INDEX IF NOT EXISTS raw_swaps_sender_ts_idx ON raw_swaps (sender_address, event_timestamp DESC);
+CREATE INDEX IF NOT EXISTS raw_swaps_token0_ts_idx ON raw_swaps (token0_address, event_timestamp DESC);
+CREATE INDEX IF NOT EXISTS raw_swaps_token1_ts_idx ON raw_swaps (token1_address, event_timestamp DESC);
+CREATE INDEX IF NOT EXISTS raw_swaps_pool_block_idx ON raw_swaps (lower(pool_address), block_number DESC, log_index DESC);
+CREATE INDEX IF NOT EXISTS raw_swaps_block_number_idx ON raw_swaps (block_number);
+
+-- raw_transfers: token flow windows (time range scans -> BRIN, tiny and append-friendly),
+-- per-token and per-wallet lookups
+CREATE INDEX IF NOT EXISTS raw_transfers_event_timestamp_brin ON raw_transfers USING brin (event_timestamp);
+CREATE INDEX IF NOT EXISTS raw_transfers_token_ts_idx ON raw_transfers (token_address, event_timestamp DESC);
+CREATE INDEX IF NOT EXISTS raw_transfers_from_ts_idx ON raw_transfers (from_address, event_timestamp DESC);
+CREATE INDEX IF NOT EXISTS raw_transfers_to_ts_idx ON raw_transfers (to_address, event_timestamp DESC);
+CREATE INDEX IF NOT EXISTS raw_transfers_block_number_idx ON raw_transfers (block_number);
+
+-- raw_events: only read in bulk (dbt, compaction, archival) by time or block range
+CREATE INDEX IF NOT EXISTS raw_events_event_timestamp_brin ON raw_events USING brin (event_timestamp);
+CREATE INDEX IF NOT EXISTS raw_events_contract_block_idx ON raw_events (contract_address, block_number);
+
+ANALYZE raw_events;
+ANALYZE raw_swaps;
+ANALYZE raw_transfers;
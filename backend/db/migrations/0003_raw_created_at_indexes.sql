@@ -0,0 +1,4 @@
+-- dbt fact models read new raw rows by created_at (commit-safe watermark with a lookback),
+-- see dbt_chainpulse/macros/incremental.sql
+CREATE INDEX IF NOT EXISTS raw_swaps_created_at_idx ON raw_swaps (created_at);
+CREATE INDEX IF NOT EXISTS raw_transfers_created_at_idx ON raw_transfers (created_at);
@@ -0,0 +1,89 @@
+"""
+Monthly partitions of the raw tables (see migrations/0001_partition_raw_tables.sql):
+create upcoming months ahead of ingestion, and detach closed months for retention.
+"""
+from __future__ import annotations
+
+import os
+from datetime import date, datetime, timezone
+from typing import Dict, List
+
+from .connection import get_conn_cursor
+
+RAW_TABLES = ("raw_events", "raw_swaps", "raw_transfers")
+# Months created ahead of the current one, so rows never land in the default partition
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+
+
+def _add_months(d: date, months: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 + months, 12)
+    return date(y, m + 1, 1)
+
+
+def ensure_partitions(months_ahead: int | None = None, since: date | None = None) -> int:
+    """Create missing monthly partitions from `since` (default this month) to months_ahead. Returns created."""
+    today = datetime.now(timezone.utc).date().replace(day=1)
+    start = (since or today).replace(day=1)
+    end = _add_months(today, MONTHS_AHEAD if months_ahead is None else months_ahead)
+    created = 0
+    with get_conn_cursor() as (conn, cur):
+        for table in RAW_TABLES:
+            cur.execute("SELECT ensure_monthly_partitions(%s, %s, %s)", (table, start, end))
+            created += cur.fetchone()[0]
+    return created
+
+
+def ensure_months(parent: str, months) -> int:
+    """Create the partitions of `parent` for specific months (any day within each). Returns created."""
+    created = 0
+    with get_conn_cursor() as (conn, cur):
+        for month in sorted(months):
+            cur.execute("SELECT ensure_monthly_partitions(%s, %s, %s)", (parent, month, month))
+            created += cur.fetchone()[0]
+    return created
+
+
+def list_partitions(parent: str) -> List[Dict]:
+    """Monthly partitions of `parent` as {name, month}, oldest first (default partition excluded)."""
+    sql = """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """
+    with get_conn_cursor() as (conn, cur):
+        cur.execute(sql, (parent,))
+        names = [r[0] for r in cur.fetchall()]
+    out = []
+    for name in names:
+        suffix = name[len(parent) + 1:]
+        if len(suffix) == 6 and suffix.isdigit():
+            out.append({"name": name, "month": date(int(suffix[:4]), int(suffix[4:]), 1)})
+    return sorted(out, key=lambda p: p["month"])
+
+
+def closed_partitions(parent: str, keep_months: int) -> List[Dict]:
+    """Partitions whose whole month ended before the most recent keep_months months."""
+    cutoff = _add_months(datetime.now(timezone.utc).date().replace(day=1), -keep_months)
+    return [p for p in list_partitions(parent) if p["month"] < cutoff]
+
+
+def detach_partition(parent: str, name: str, drop: bool = False) -> None:
+    """
+    Detach one month from `parent`: queries stop seeing it, and the rows survive as a plain
+    table (for archival) unless drop is set.
+    """
+    with get_conn_cursor() as (conn, cur):
+        cur.execute(f'ALTER TABLE {parent} DETACH PARTITION "{name}"')
+        if drop:
+            cur.execute(f'DROP TABLE "{name}"')
+
+
+def detach_older_than(keep_months: int, drop: bool = False) -> List[str]:
+    """Detach every raw-table month older than keep_months. Returns detached partition names."""
+    detached = []
+    for parent in RAW_TABLES:
+        for p in closed_partitions(parent, keep_months):
+            detach_partition(parent, p["name"], drop=drop)
+            detached.append(p["name"])
+    return detached
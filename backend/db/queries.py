@@ -1,17 +1,33 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
 from typing import Iterable, List, Mapping, Sequence
 
 from .connection import get_conn_cursor
 
 
-def insert_raw_events(rows: Sequence[Mapping]) -> None:
+# Rows fetched per round trip by the streaming (server-side cursor) queries
+STREAM_ITERSIZE = 10_000
+
+
+@contextmanager
+def _cursor(cur=None):
+    """Reuse a caller's unit-of-work cursor, or open a short transaction of our own."""
+    if cur is not None:
+        yield cur
+        return
+    with get_conn_cursor() as (conn, own_cur):
+        yield own_cur
+
+
+def insert_raw_events(rows: Sequence[Mapping], cur=None) -> None:
     """
     Batch insert into raw_events.
 
     Each row should contain:
       block_number, tx_hash, log_index, contract_address,
-      event_name, event_params (dict), event_timestamp
+      event_name, event_params (dict or None), event_timestamp
+    and optionally topics / data (bytes) for compact retention.
     """
     if not rows:
         return
@@ -24,10 +40,12 @@ def insert_raw_events(rows: Sequence[Mapping]) -> None:
             contract_address,
             event_name,
             event_params,
+            topics,
+            data,
             event_timestamp
         )
         VALUES %s
-        ON CONFLICT (tx_hash, log_index) DO NOTHING
+        ON CONFLICT DO NOTHING
     """
     values = [
         (
@@ -36,7 +54,9 @@ def insert_raw_events(rows: Sequence[Mapping]) -> None:
             r["log_index"],
             r["contract_address"],
             r["event_name"],
-            r["event_params"],
+            r.get("event_params"),
+            r.get("topics"),
+            r.get("data"),
             r["event_timestamp"],
         )
         for r in rows
@@ -51,11 +71,11 @@ def insert_raw_events(rows: Sequence[Mapping]) -> None:
         v_list[5] = Json(v_list[5]) if isinstance(v_list[5], dict) else v_list[5]
         safe_values.append(tuple(v_list))
 
-    with get_conn_cursor() as (conn, cur):
-        execute_values(cur, sql, safe_values)
+    with _cursor(cur) as c:
+        execute_values(c, sql, safe_values)
 
 
-def insert_raw_swaps(rows: Sequence[Mapping]) -> None:
+def insert_raw_swaps(rows: Sequence[Mapping], cur=None) -> None:
     """
     Batch insert into raw_swaps.
     """
@@ -82,7 +102,7 @@ def insert_raw_swaps(rows: Sequence[Mapping]) -> None:
             size_bucket
         )
         VALUES %s
-        ON CONFLICT (tx_hash, log_index) DO NOTHING
+        ON CONFLICT DO NOTHING
     """
     values = [
         (
@@ -108,11 +128,11 @@ def insert_raw_swaps(rows: Sequence[Mapping]) -> None:
 
     from psycopg2.extras import execute_values
 
-    with get_conn_cursor() as (conn, cur):
-        execute_values(cur, sql, values)
+    with _cursor(cur) as c:
+        execute_values(c, sql, values)
 
 
-def insert_raw_transfers(rows: Sequence[Mapping]) -> None:
+def insert_raw_transfers(rows: Sequence[Mapping], cur=None) -> None:
     """
     Batch insert into raw_transfers.
     """
@@ -135,7 +155,7 @@ def insert_raw_transfers(rows: Sequence[Mapping]) -> None:
             event_timestamp
         )
         VALUES %s
-        ON CONFLICT (tx_hash, log_index) DO NOTHING
+        ON CONFLICT DO NOTHING
     """
     values = [
         (
@@ -157,14 +177,99 @@ def insert_raw_transfers(rows: Sequence[Mapping]) -> None:
 
     from psycopg2.extras import execute_values
 
-    with get_conn_cursor() as (conn, cur):
-        execute_values(cur, sql, values)
+    with _cursor(cur) as c:
+        execute_values(c, sql, values)
+
+
+# Column order used by the COPY bulk path (matches the execute_values inserts above)
+RAW_EVENT_COLUMNS = (
+    "block_number", "tx_hash", "log_index", "contract_address",
+    "event_name", "event_params", "topics", "data", "event_timestamp",
+)
+RAW_SWAP_COLUMNS = (
+    "block_number", "tx_hash", "log_index", "pool_address", "sender_address", "recipient_address",
+    "token0_address", "token1_address", "amount0", "amount1", "sqrt_price_x96", "liquidity", "tick",
+    "usd_value", "event_timestamp", "size_bucket",
+)
+RAW_TRANSFER_COLUMNS = (
+    "block_number", "tx_hash", "log_index", "token_address", "from_address", "to_address",
+    "amount_raw", "amount", "usd_value", "direction", "is_exchange", "event_timestamp",
+)
+
+
+def _copy_text(value) -> str:
+    """Format one value for COPY ... FROM STDIN (text format)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, dict):
+        import json
+        value = json.dumps(value)
+    elif isinstance(value, (list, tuple)):
+        # Postgres array literal (numeric arrays only)
+        value = "{" + ",".join("NULL" if v is None else str(v) for v in value) + "}"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _stage_rows(cur, table: str, columns: Sequence[str], rows: Sequence[Mapping]) -> str:
+    """COPY rows into a column-only temp table shaped like `table`; returns its name."""
+    import io
+
+    staging = f"_copy_{table}"
+    cols = ", ".join(columns)
+    # WITH NO DATA copies column types only, so no id sequence values are consumed
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA")
+    cur.execute(f"TRUNCATE {staging}")
+    buf = io.StringIO()
+    for r in rows:
+        buf.write("\t".join(_copy_text(r.get(c)) for c in columns))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {staging} ({cols}) FROM STDIN", buf)
+    return staging
+
+
+def copy_rows(cur, table: str, columns: Sequence[str], rows: Sequence[Mapping]) -> None:
+    """
+    Bulk load rows into `table` on an open cursor: COPY into a column-only temp staging
+    table, then one INSERT ... SELECT ... ON CONFLICT DO NOTHING. Caller owns the transaction.
+    """
+    if not rows:
+        return
+    staging = _stage_rows(cur, table, columns, rows)
+    cols = ", ".join(columns)
+    cur.execute(
+        f"""
+        INSERT INTO {table} ({cols})
+        SELECT {cols} FROM {staging}
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def copy_raw_rows(cur, events: Sequence[Mapping], swaps: Sequence[Mapping], transfers: Sequence[Mapping]) -> None:
+    """COPY one block range of raw_events / raw_swaps / raw_transfers on an open cursor."""
+    copy_rows(cur, "raw_events", RAW_EVENT_COLUMNS, events)
+    copy_rows(cur, "raw_swaps", RAW_SWAP_COLUMNS, swaps)
+    copy_rows(cur, "raw_transfers", RAW_TRANSFER_COLUMNS, transfers)
 
 
-def upsert_token_price(token_address: str, coingecko_id: str, price_usd, fetched_at, source: str = "coingecko") -> None:
+def upsert_token_prices(rows: Sequence[Mapping], cur=None) -> None:
     """
-    Upsert a token price record into token_prices.
+    Upsert many token_prices rows in one statement.
+    Each row: token_address, coingecko_id, price_usd, fetched_at, source.
     """
+    if not rows:
+        return
     sql = """
         INSERT INTO token_prices (
             token_address,
@@ -173,22 +278,88 @@ def upsert_token_price(token_address: str, coingecko_id: str, price_usd, fetched
             fetched_at,
             source
         )
-        VALUES (%s, %s, %s, %s, %s)
+        VALUES %s
         ON CONFLICT (token_address) DO UPDATE SET
             coingecko_id = EXCLUDED.coingecko_id,
             price_usd = EXCLUDED.price_usd,
             fetched_at = EXCLUDED.fetched_at,
             source = EXCLUDED.source
     """
+    values = [
+        (r["token_address"], r["coingecko_id"], r["price_usd"], r["fetched_at"], r.get("source", "coingecko"))
+        for r in rows
+    ]
+
+    from psycopg2.extras import execute_values
+
+    with _cursor(cur) as c:
+        execute_values(c, sql, values)
+
+
+def insert_token_price_history(rows: Sequence[Mapping], cur=None) -> None:
+    """
+    Upsert token_price_history points. Each row: token_address, ts, price_usd, source.
+    """
+    if not rows:
+        return
+    sql = """
+        INSERT INTO token_price_history (token_address, ts, price_usd, source)
+        VALUES %s
+        ON CONFLICT (token_address, ts) DO UPDATE SET
+            price_usd = EXCLUDED.price_usd,
+            source = EXCLUDED.source
+    """
+    values = [(r["token_address"].lower(), r["ts"], r["price_usd"], r.get("source", "coingecko")) for r in rows]
+
+    from psycopg2.extras import execute_values
+
+    with _cursor(cur) as c:
+        execute_values(c, sql, values, page_size=5000)
+
+
+def get_token_price_history(token_addresses: Sequence[str] | None = None) -> List[tuple]:
+    """(token_address, epoch seconds, price_usd) points ordered by token and time."""
+    sql = """
+        SELECT token_address, extract(epoch FROM ts)::float8, price_usd::float8
+        FROM token_price_history
+    """
+    params: tuple = ()
+    if token_addresses:
+        sql += " WHERE token_address = ANY(%s)"
+        params = ([a.lower() for a in token_addresses],)
+    sql += " ORDER BY token_address, ts"
+    with get_conn_cursor() as (conn, cur):
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
+def get_pool_prices_before(pool_addresses: Sequence[str], block_number: int) -> List[tuple]:
+    """(pool_address, block_number, sqrt_price_x96) of each pool's last swap before block_number."""
+    sql = """
+        SELECT DISTINCT ON (lower(pool_address)) lower(pool_address), block_number, sqrt_price_x96
+        FROM raw_swaps
+        WHERE lower(pool_address) = ANY(%s)
+          AND block_number < %s
+          AND sqrt_price_x96 IS NOT NULL
+        ORDER BY lower(pool_address), block_number DESC, log_index DESC
+    """
     with get_conn_cursor() as (conn, cur):
-        cur.execute(sql, (token_address, coingecko_id, price_usd, fetched_at, source))
+        cur.execute(sql, ([a.lower() for a in pool_addresses], block_number))
+        return cur.fetchall()
 
 
 def get_latest_event_timestamp() -> str | None:
     """
-    Return ISO string of the most recent event_timestamp in raw_events.
+    Return ISO string of the most recent event_timestamp across the raw tables
+    (raw_events may be empty when RAW_EVENTS_MODE=off).
+    """
+    sql = """
+        SELECT greatest(
+            (SELECT max(event_timestamp) FROM raw_events),
+            (SELECT max(event_timestamp) FROM raw_swaps),
+            (SELECT max(event_timestamp) FROM raw_transfers)
+        )
     """
-    sql = "SELECT max(event_timestamp) FROM raw_events"
     with get_conn_cursor() as (conn, cur):
         cur.execute(sql)
         row = cur.fetchone()
@@ -209,16 +380,145 @@ def get_block_checkpoint(contract_address: str) -> int | None:
     return int(row[0]) if row and row[0] is not None else None
 
 
-def upsert_block_checkpoint(contract_address: str, last_block: int) -> None:
+def upsert_block_checkpoint(contract_address: str, last_block: int, cur=None) -> None:
+    sql = """
+        INSERT INTO block_checkpoints (contract_address, last_block)
+        VALUES (%s, %s)
+        ON CONFLICT (contract_address) DO UPDATE SET
+            last_block = EXCLUDED.last_block,
+            updated_at = NOW()
+    """
+    with _cursor(cur) as c:
+        c.execute(sql, (contract_address, last_block))
+
+
+def advance_block_checkpoint(contract_address: str, from_block: int, to_block: int) -> None:
+    """
+    Move a live checkpoint up to `to_block` only if it is missing or already sits inside
+    [from_block - 1, to_block), i.e. contiguous with a completed backfill range.
+    """
     sql = """
         INSERT INTO block_checkpoints (contract_address, last_block)
         VALUES (%s, %s)
         ON CONFLICT (contract_address) DO UPDATE SET
             last_block = EXCLUDED.last_block,
             updated_at = NOW()
+        WHERE block_checkpoints.last_block >= %s
+          AND block_checkpoints.last_block < EXCLUDED.last_block
+    """
+    with get_conn_cursor() as (conn, cur):
+        cur.execute(sql, (contract_address, to_block, from_block - 1))
+
+
+def register_backfill_shards(shards: Iterable[tuple[int, int]]) -> None:
+    """Create shard rows for (from_block, to_block) ranges; existing shards keep their progress."""
+    values = [(f, t, f - 1) for f, t in shards]
+    if not values:
+        return
+    sql = """
+        INSERT INTO backfill_shards (from_block, to_block, last_block)
+        VALUES %s
+        ON CONFLICT (from_block, to_block) DO NOTHING
+    """
+    from psycopg2.extras import execute_values
+
+    with get_conn_cursor() as (conn, cur):
+        execute_values(cur, sql, values)
+
+
+def get_backfill_shards(from_block: int, to_block: int) -> list[dict]:
+    """Shards inside [from_block, to_block], ordered by block."""
+    return run_query(
+        """
+        SELECT from_block, to_block, last_block, status
+        FROM backfill_shards
+        WHERE from_block >= %s AND to_block <= %s
+        ORDER BY from_block
+        """,
+        (from_block, to_block),
+    )
+
+
+def update_backfill_shard(from_block: int, to_block: int, last_block: int, status: str, cur=None) -> None:
+    sql = """
+        UPDATE backfill_shards
+        SET last_block = %s, status = %s, updated_at = NOW()
+        WHERE from_block = %s AND to_block = %s
+    """
+    with _cursor(cur) as c:
+        c.execute(sql, (last_block, status, from_block, to_block))
+
+
+def bulk_insert_backfill_range(
+    events: Sequence[Mapping],
+    swaps: Sequence[Mapping],
+    transfers: Sequence[Mapping],
+    shard: tuple[int, int],
+    last_block: int,
+    status: str,
+) -> None:
+    """COPY one backfill range and move its shard checkpoint in the same transaction."""
+    with get_conn_cursor() as (conn, cur):
+        copy_raw_rows(cur, events, swaps, transfers)
+        update_backfill_shard(shard[0], shard[1], last_block, status, cur=cur)
+
+
+def write_analytics_rows(
+    table: str,
+    columns: Sequence[str],
+    rows: Sequence[Mapping],
+    mode: str = "replace",
+    conflict: Sequence[str] | None = None,
+    cur=None,
+) -> int:
     """
+    Write a whole analysis result set in one transaction: COPY into a temp staging table,
+    then
+      replace: DELETE + INSERT ... SELECT (readers see the old rows until commit, never
+               an empty table; TRUNCATE would lock them out for the whole write)
+      append:  INSERT ... SELECT ... ON CONFLICT (conflict) DO NOTHING
+      upsert:  INSERT ... SELECT ... ON CONFLICT (conflict) DO UPDATE of the other columns
+    Returns the number of rows staged.
+    """
+    if mode not in ("replace", "append", "upsert"):
+        raise ValueError(f"unknown write mode: {mode}")
+    if mode == "upsert" and not conflict:
+        raise ValueError("upsert needs conflict columns")
+    cols = ", ".join(columns)
+    on_conflict = ""
+    if conflict and mode == "upsert":
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in conflict)
+        on_conflict = f"ON CONFLICT ({', '.join(conflict)}) DO UPDATE SET {updates}"
+    elif conflict:
+        on_conflict = f"ON CONFLICT ({', '.join(conflict)}) DO NOTHING"
+    with _cursor(cur) as c:
+        if rows:
+            staging = _stage_rows(c, table, columns, rows)
+        if mode == "replace":
+            c.execute(f"DELETE FROM {table}")
+        if rows:
+            c.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} {on_conflict}")
+    return len(rows)
+
+
+def get_watermark(job: str):
+    """Last source timestamp an incremental analysis job has covered, or None."""
     with get_conn_cursor() as (conn, cur):
-        cur.execute(sql, (contract_address, last_block))
+        cur.execute("SELECT watermark FROM analytics_watermarks WHERE job = %s", (job,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(job: str, watermark, cur=None) -> None:
+    sql = """
+        INSERT INTO analytics_watermarks (job, watermark, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (job) DO UPDATE SET
+            watermark = EXCLUDED.watermark,
+            updated_at = EXCLUDED.updated_at
+    """
+    with _cursor(cur) as c:
+        c.execute(sql, (job, watermark))
 
 
 def run_query(sql: str, params: tuple = ()) -> list[dict]:
@@ -232,6 +532,81 @@ def run_query(sql: str, params: tuple = ()) -> list[dict]:
         return [dict(r) for r in rows]
 
 
+def stream_batches(sql: str, params: tuple = (), itersize: int = STREAM_ITERSIZE, columnar: bool = False):
+    """
+    Run a SELECT on a named (server-side) cursor and yield it in batches of up to
+    `itersize` rows: lists of tuples, or {column: list} dicts when columnar. Peak memory
+    follows the batch size, not the result size. Close the generator to release the
+    connection early.
+    """
+    import uuid
+
+    with get_conn_cursor() as (conn, _):
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cur.itersize = itersize
+        try:
+            cur.execute(sql, params)
+            names = None
+            while True:
+                rows = cur.fetchmany(itersize)
+                if not rows:
+                    break
+                if not columnar:
+                    yield rows
+                    continue
+                if names is None:
+                    names = [d[0] for d in cur.description]
+                yield {name: list(col) for name, col in zip(names, zip(*rows))}
+        finally:
+            cur.close()
+
+
+def _to_array(values: list):
+    """One column as a NumPy array: timestamps -> datetime64[us] (UTC), dates -> datetime64[D],
+    numerics -> float64 (None -> NaN), anything else -> object."""
+    import numpy as np
+    from datetime import date, datetime, timezone
+    from decimal import Decimal
+
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, datetime):
+        return np.array(
+            [
+                np.datetime64("NaT") if v is None
+                else (v.astimezone(timezone.utc).replace(tzinfo=None) if v.tzinfo else v)
+                for v in values
+            ],
+            dtype="datetime64[us]",
+        )
+    if isinstance(sample, date):
+        return np.array([np.datetime64("NaT") if v is None else v for v in values], dtype="datetime64[D]")
+    if isinstance(sample, (int, float, Decimal)) and not isinstance(sample, bool):
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    return np.array(values, dtype=object)
+
+
+def run_query_columnar(sql: str, params: tuple = (), itersize: int = STREAM_ITERSIZE) -> dict:
+    """
+    Execute SELECT and return {column: NumPy array} (see _to_array for types), built batch
+    by batch from a server-side cursor. An empty result gives {}.
+    """
+    import numpy as np
+
+    parts: dict[str, list] = {}
+    for batch in stream_batches(sql, params, itersize, columnar=True):
+        for name, values in batch.items():
+            parts.setdefault(name, []).append(_to_array(values))
+    out = {}
+    for name, arrays in parts.items():
+        typed = [a.dtype for a in arrays if a.dtype != object]
+        if typed and len(typed) < len(arrays):
+            # Batches that were all NULL come back as object arrays of None
+            fill = np.nan if typed[0] == np.float64 else np.datetime64("NaT")
+            arrays = [a if a.dtype != object else np.full(len(a), fill, dtype=typed[0]) for a in arrays]
+        out[name] = np.concatenate(arrays)
+    return out
+
+
 def execute_sql(sql: str, params: tuple = ()) -> None:
     """Execute a single statement (insert/update/delete)."""
     with get_conn_cursor() as (conn, cur):
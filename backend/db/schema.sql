@@ -7,12 +7,19 @@ CREATE TABLE IF NOT EXISTS raw_events (
     log_index       INTEGER NOT NULL,
     contract_address TEXT NOT NULL,
     event_name      TEXT NOT NULL,
-    event_params    JSONB NOT NULL,
+    event_params    JSONB,
+    topics          BYTEA,
+    data            BYTEA,
     event_timestamp TIMESTAMPTZ NOT NULL,
     created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     UNIQUE (tx_hash, log_index)
 );
 
+-- RAW_EVENTS_MODE=compact stores the original log topics/data instead of event_params
+ALTER TABLE raw_events ADD COLUMN IF NOT EXISTS topics BYTEA;
+ALTER TABLE raw_events ADD COLUMN IF NOT EXISTS data BYTEA;
+ALTER TABLE raw_events ALTER COLUMN event_params DROP NOT NULL;
+
 CREATE TABLE IF NOT EXISTS raw_swaps (
     id               BIGSERIAL PRIMARY KEY,
     block_number     BIGINT NOT NULL,
@@ -63,6 +70,16 @@ CREATE TABLE IF NOT EXISTS token_prices (
     source          TEXT DEFAULT 'coingecko'
 );
 
+-- Token price history (as-of pricing for historical events)
+
+CREATE TABLE IF NOT EXISTS token_price_history (
+    token_address   TEXT NOT NULL,
+    ts              TIMESTAMPTZ NOT NULL,
+    price_usd       NUMERIC NOT NULL,
+    source          TEXT DEFAULT 'coingecko',
+    PRIMARY KEY (token_address, ts)
+);
+
 -- Block processing checkpoints
 
 CREATE TABLE IF NOT EXISTS block_checkpoints (
@@ -73,6 +90,18 @@ CREATE TABLE IF NOT EXISTS block_checkpoints (
     UNIQUE (contract_address)
 );
 
+-- Historical backfill shards (one row per block range, resumable)
+
+CREATE TABLE IF NOT EXISTS backfill_shards (
+    id              BIGSERIAL PRIMARY KEY,
+    from_block      BIGINT NOT NULL,
+    to_block        BIGINT NOT NULL,
+    last_block      BIGINT NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'pending',
+    updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (from_block, to_block)
+);
+
 -- Analytics output tables (written by Python analysis scripts)
 
 CREATE TABLE IF NOT EXISTS analytics_wallet_segments (
@@ -85,6 +114,26 @@ CREATE TABLE IF NOT EXISTS analytics_wallet_segments (
     computed_at     TIMESTAMPTZ NOT NULL
 );
 
+-- High-water marks for incremental analysis jobs (job -> last source event_timestamp seen)
+
+CREATE TABLE IF NOT EXISTS analytics_watermarks (
+    job             TEXT PRIMARY KEY,
+    watermark       TIMESTAMPTZ NOT NULL,
+    updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Wallet clustering state (centroids in raw feature space, activity rank per centroid)
+
+CREATE TABLE IF NOT EXISTS analytics_cluster_state (
+    engine          TEXT PRIMARY KEY,
+    centroids       DOUBLE PRECISION[] NOT NULL,
+    ranks           INTEGER[] NOT NULL,
+    n_wallets       INTEGER NOT NULL,
+    n_refit         INTEGER NOT NULL,
+    full_fit_at     TIMESTAMPTZ NOT NULL,
+    updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
 CREATE TABLE IF NOT EXISTS analytics_anomalies (
     anomaly_id      UUID PRIMARY KEY,
     hour_bucket     TIMESTAMPTZ NOT NULL,
@@ -96,6 +145,19 @@ CREATE TABLE IF NOT EXISTS analytics_anomalies (
     detected_at     TIMESTAMPTZ NOT NULL
 );
 
+-- Rolling window per token for incremental anomaly detection (ring buffer of hourly volumes)
+
+CREATE TABLE IF NOT EXISTS analytics_anomaly_state (
+    token_address   TEXT PRIMARY KEY,
+    last_hour       TIMESTAMPTZ NOT NULL,
+    ring            DOUBLE PRECISION[] NOT NULL,
+    ring_pos        INTEGER NOT NULL,
+    hours_seen      INTEGER NOT NULL,
+    window_sum      DOUBLE PRECISION NOT NULL,
+    window_sumsq    DOUBLE PRECISION NOT NULL,
+    updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
 CREATE TABLE IF NOT EXISTS analytics_token_flows (
     id              BIGSERIAL PRIMARY KEY,
     hour_bucket     TIMESTAMPTZ NOT NULL,
@@ -0,0 +1,158 @@
+"""
+Async indexer engine: fetch logs and block headers for several ranges concurrently over
+AsyncWeb3, bounded by a semaphore and a token bucket. Ranges are persisted and
+checkpointed strictly in block order.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from web3 import AsyncHTTPProvider, AsyncWeb3
+
+from indexer import evm_indexer
+from indexer.log_fetcher import CombinedLogFetcher
+from indexer.price_service import refresh_if_due
+from indexer.range_controller import is_range_error
+
+# Max RPC requests in flight at once
+MAX_CONCURRENCY = int(os.getenv("RPC_MAX_CONCURRENCY", "4"))
+# Ranges planned per async pass (fetched concurrently, persisted in order)
+MAX_RANGES_PER_PASS = int(os.getenv("INDEXER_ASYNC_MAX_RANGES_PER_PASS", "16"))
+
+
+def get_async_web3() -> AsyncWeb3:
+    return AsyncWeb3(AsyncHTTPProvider(evm_indexer.get_rpc_url(), request_kwargs={"timeout": 30}))
+
+
+class _RpcGate:
+    """Bounded in-flight requests + shared token-bucket rate limit."""
+
+    def __init__(self, concurrency: int):
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def __aenter__(self) -> None:
+        await self._sem.acquire()
+        await evm_indexer._rate_limiter.acquire_async()
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self._sem.release()
+
+
+async def _fetch_logs(w3: AsyncWeb3, fetcher: CombinedLogFetcher, gate: _RpcGate, from_block: int, to_block: int) -> List:
+    """
+    Fetch one range; split it in half if the provider rejects or caps it, retry other
+    errors with backoff and raise once retries are exhausted.
+    """
+    controller = evm_indexer._range_controller
+    attempt = 0
+    while True:
+        error: Exception | None = None
+        logs: List = []
+        async with gate:
+            try:
+                logs = await fetcher.fetch_async(w3, from_block, to_block)
+            except Exception as e:
+                error = e
+        if error is None or is_range_error(error) or attempt >= evm_indexer.FETCH_RETRIES:
+            break
+        attempt += 1
+        await asyncio.sleep(evm_indexer.RETRY_BACKOFF * 2 ** (attempt - 1))
+    if error is None and (controller.record_success(len(logs)) or from_block == to_block):
+        return logs
+    if error is not None:
+        if from_block == to_block or not is_range_error(error):
+            raise error
+        controller.shrink()
+    mid = (from_block + to_block) // 2
+    left, right = await asyncio.gather(
+        _fetch_logs(w3, fetcher, gate, from_block, mid),
+        _fetch_logs(w3, fetcher, gate, mid + 1, to_block),
+    )
+    return left + right
+
+
+async def _fetch_timestamps(w3: AsyncWeb3, gate: _RpcGate, block_numbers: Iterable[int]) -> Dict[int, datetime]:
+    """
+    Timestamps of every block in one range: cached ones plus the missing headers. Returned
+    per range because the shared cache only keeps a window below its highest block, and
+    later ranges are fetched before earlier ones are persisted.
+    """
+    cache = evm_indexer._block_cache
+    headers: Dict[int, datetime] = {}
+    missing = []
+    for bn in sorted({int(bn) for bn in block_numbers}):
+        ts = cache.get(bn)
+        if ts is None:
+            missing.append(bn)
+        else:
+            headers[bn] = ts
+
+    async def one(bn: int) -> None:
+        async with gate:
+            try:
+                block = await w3.eth.get_block(bn)
+            except Exception:
+                return
+        ts = block.get("timestamp")
+        if isinstance(ts, (int, float)):
+            headers[bn] = datetime.fromtimestamp(ts, tz=timezone.utc)
+            cache.put(bn, headers[bn])
+
+    await asyncio.gather(*(one(bn) for bn in missing))
+    return headers
+
+
+async def _fetch_range(
+    w3: AsyncWeb3, fetcher: CombinedLogFetcher, gate: _RpcGate, from_block: int, to_block: int
+) -> Tuple[List, Dict[int, datetime]]:
+    logs = await _fetch_logs(w3, fetcher, gate, from_block, to_block)
+    headers = await _fetch_timestamps(w3, gate, (log["blockNumber"] for _, log in logs))
+    return logs, headers
+
+
+def _plan_ranges(start: int, end_block: int, max_ranges: int) -> List[Tuple[int, int]]:
+    ranges: List[Tuple[int, int]] = []
+    cursor = start
+    while cursor < end_block and len(ranges) < max_ranges:
+        from_block, to_block = evm_indexer._range_controller.next_range(cursor, end_block)
+        ranges.append((from_block, to_block))
+        cursor = to_block
+    return ranges
+
+
+def _range_timestamp(headers: Dict[int, datetime]) -> Callable[[int], datetime]:
+    def lookup(block_number: int) -> datetime:
+        ts = headers.get(block_number)
+        if ts is None:
+            raise RuntimeError(f"Block {block_number} header unavailable")
+        return ts
+    return lookup
+
+
+async def run_async_pass(max_ranges: int | None = None) -> None:
+    w3 = get_async_web3()
+    if not await w3.is_connected():
+        return
+
+    await asyncio.to_thread(refresh_if_due)
+    fetcher = evm_indexer._get_fetcher()
+    end_block = await w3.eth.block_number
+    checkpoints = await asyncio.to_thread(evm_indexer._load_checkpoints, fetcher.addresses, end_block)
+    ranges = _plan_ranges(min(checkpoints.values()), end_block, max_ranges or MAX_RANGES_PER_PASS)
+    if not ranges:
+        return
+
+    gate = _RpcGate(MAX_CONCURRENCY)
+    tasks = [asyncio.create_task(_fetch_range(w3, fetcher, gate, f, t)) for f, t in ranges]
+    try:
+        # Persist in order: a failed range stops the pass so checkpoints never skip a gap
+        for (_, to_block), task in zip(ranges, tasks):
+            logs, headers = await task
+            await asyncio.to_thread(evm_indexer._index_logs, logs, checkpoints, to_block, _range_timestamp(headers))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
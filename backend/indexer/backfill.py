@@ -0,0 +1,120 @@
+"""
+Parallel historical backfill: split [from_block, to_block] into shards, index each shard in a
+process pool and checkpoint it in backfill_shards. Live tip indexing keeps running; its
+block_checkpoints row only moves once every shard below it is done. Shards the Parquet
+archive (db/archive.py) fully covers are loaded from it instead of the RPC.
+"""
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple
+
+from db import queries as db_queries
+from indexer import evm_indexer
+from indexer.price_service import refresh_if_due
+
+# Blocks per shard; boundaries are aligned to multiples of this so reruns reuse shards
+DEFAULT_SHARD_SIZE = 5000
+DEFAULT_WORKERS = 4
+
+
+def plan_shards(from_block: int, to_block: int, shard_size: int = DEFAULT_SHARD_SIZE) -> List[Tuple[int, int]]:
+    """Inclusive (from, to) shards covering the range."""
+    shards: List[Tuple[int, int]] = []
+    start = from_block
+    while start <= to_block:
+        end = min(to_block, (start // shard_size + 1) * shard_size - 1)
+        shards.append((start, end))
+        start = end + 1
+    return shards
+
+
+def _index_shard(shard_from: int, shard_to: int, last_block: int) -> Tuple[int, int]:
+    """Worker: index one shard from its checkpoint to its end. Runs in a child process."""
+    w3 = evm_indexer.get_web3()
+    fetcher = evm_indexer._get_fetcher()
+    last = max(last_block, shard_from - 1)
+    while last < shard_to:
+        refresh_if_due()
+        to_block, logs = evm_indexer._fetch_range(w3, fetcher, last, shard_to)
+        headers = evm_indexer._block_cache.prefill(w3, (log["blockNumber"] for _, log in logs))
+        rows = evm_indexer._decode_logs(logs, evm_indexer._range_timestamp(w3, headers))
+        last = to_block
+        # COPY all three tables and the shard checkpoint in one transaction
+        db_queries.bulk_insert_backfill_range(
+            *rows, shard=(shard_from, shard_to), last_block=last, status="done" if last >= shard_to else "running"
+        )
+    return shard_from, shard_to
+
+
+def _contiguous_done(shards: List[dict], from_block: int) -> int | None:
+    """End of the completed prefix of shards starting at from_block, or None."""
+    done_to = None
+    expected = from_block
+    for s in shards:
+        if s["from_block"] != expected or s["status"] != "done":
+            break
+        done_to = s["to_block"]
+        expected = done_to + 1
+    return done_to
+
+
+def _advance_head(from_block: int, to_block: int, addresses: List[str]) -> None:
+    done_to = _contiguous_done(db_queries.get_backfill_shards(from_block, to_block), from_block)
+    if done_to is None:
+        return
+    for addr in addresses:
+        db_queries.advance_block_checkpoint(addr, from_block, done_to)
+
+
+def _restore_archived(shards: List[dict]) -> List[dict]:
+    """Load shards fully covered by the raw-table archive straight from Parquet; returns the rest."""
+    from db import archive
+
+    if not archive.load_manifest():
+        return shards
+    remaining = []
+    for s in shards:
+        lo, hi = int(s["from_block"]), int(s["to_block"])
+        if archive.covers(lo, hi):
+            db_queries.bulk_insert_backfill_range(*archive.rows_for_blocks(lo, hi), shard=(lo, hi), last_block=hi, status="done")
+        else:
+            remaining.append(s)
+    return remaining
+
+
+def _ensure_partitions(from_block: int) -> None:
+    """Monthly raw partitions from from_block's month on, so old rows never land in the default partition."""
+    from db.partitions import ensure_partitions
+
+    try:
+        ensure_partitions(since=evm_indexer._block_timestamp(evm_indexer.get_web3(), from_block).date())
+    except Exception as e:
+        print(f"[Backfill] Could not create partitions: {e}")
+
+
+def run_backfill(
+    from_block: int,
+    to_block: int,
+    workers: int = DEFAULT_WORKERS,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+) -> None:
+    """Index [from_block, to_block] across a process pool; safe to rerun to resume."""
+    db_queries.register_backfill_shards(plan_shards(from_block, to_block, shard_size))
+    shards = db_queries.get_backfill_shards(from_block, to_block)
+    pending = _restore_archived([s for s in shards if s["status"] != "done"])
+    addresses = sorted({p["address"].lower() for p in evm_indexer.UNISWAP_V3_POOLS} | {a.lower() for a in evm_indexer.ERC20_CONTRACTS})
+    if pending:
+        _ensure_partitions(min(int(s["last_block"]) for s in pending))
+        # spawn: children must not share the parent's pooled Postgres sockets
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_index_shard, int(s["from_block"]), int(s["to_block"]), int(s["last_block"]))
+                for s in pending
+            ]
+            for fut in as_completed(futures):
+                fut.result()
+                _advance_head(from_block, to_block, addresses)
+    _advance_head(from_block, to_block, addresses)
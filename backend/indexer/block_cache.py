@@ -0,0 +1,165 @@
+"""
+Block header cache: block_number -> timestamp, shared across indexer passes and contracts.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from web3 import Web3
+from web3._utils.request import make_post_request
+
+from indexer.rate_limiter import TokenBucket
+
+# Upper bound on cached headers (LRU eviction past this)
+MAX_CACHED_BLOCKS = 4096
+# Drop headers this many blocks below the highest block seen
+HEIGHT_WINDOW = 2048
+# Block numbers per JSON-RPC batch when pre-filling a getLogs range
+HEADER_BATCH_SIZE = 100
+
+
+def _to_datetime(ts: Any) -> Optional[datetime]:
+    if isinstance(ts, str):
+        ts = int(ts, 16)
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(ts, tz=timezone.utc)
+    return None
+
+
+class BlockTimestampCache:
+    """
+    LRU cache of block timestamps, bounded by size and by a height window below the tip.
+    Header fetches (single or batched) each take a token from rate_limiter when one is set.
+    """
+
+    def __init__(
+        self,
+        max_size: int = MAX_CACHED_BLOCKS,
+        height_window: int = HEIGHT_WINDOW,
+        rate_limiter: TokenBucket | None = None,
+    ):
+        self.max_size = max_size
+        self.height_window = height_window
+        self.rate_limiter = rate_limiter
+        self._entries: "OrderedDict[int, datetime]" = OrderedDict()
+        # Min-heap of cached block numbers (may hold stale ones) for the height-window floor
+        self._heights: List[int] = []
+        self._highest = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, block_number: int) -> bool:
+        return block_number in self._entries
+
+    def get(self, block_number: int) -> Optional[datetime]:
+        ts = self._entries.get(block_number)
+        if ts is not None:
+            self._entries.move_to_end(block_number)
+        return ts
+
+    def put(self, block_number: int, ts: datetime) -> None:
+        if block_number not in self._entries:
+            heapq.heappush(self._heights, block_number)
+        self._entries[block_number] = ts
+        self._entries.move_to_end(block_number)
+        if block_number > self._highest:
+            self._highest = block_number
+        self._evict()
+
+    def _evict(self) -> None:
+        floor = self._highest - self.height_window
+        while self._heights and self._heights[0] < floor:
+            self._entries.pop(heapq.heappop(self._heights), None)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        if len(self._heights) > 2 * self.max_size:
+            # Drop heap entries for blocks the LRU bound already evicted
+            self._heights = list(self._entries)
+            heapq.heapify(self._heights)
+
+    def _acquire(self) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def prefill(self, web3: Web3, block_numbers: Iterable[int]) -> Dict[int, datetime]:
+        """
+        Fetch all missing headers for a getLogs range in batched RPC calls. Returns every
+        timestamp of the range: a range can span more blocks than the height window keeps,
+        so decoding should read this map rather than the cache.
+        """
+        headers: Dict[int, datetime] = {}
+        missing = []
+        for bn in sorted({int(bn) for bn in block_numbers}):
+            ts = self.get(bn)
+            if ts is None:
+                missing.append(bn)
+            else:
+                headers[bn] = ts
+        for i in range(0, len(missing), HEADER_BATCH_SIZE):
+            chunk = missing[i : i + HEADER_BATCH_SIZE]
+            self._acquire()
+            fetched = _fetch_timestamps_batch(web3, chunk)
+            for bn in chunk:
+                ts = fetched.get(bn)
+                if ts is None:
+                    self._acquire()
+                    ts = _fetch_timestamp(web3, bn)
+                if ts is not None:
+                    headers[bn] = ts
+                    self.put(bn, ts)
+        return headers
+
+    def timestamp(self, web3: Web3, block_number: int) -> Optional[datetime]:
+        """Return the block timestamp, fetching the header on a cache miss."""
+        ts = self.get(block_number)
+        if ts is None:
+            self._acquire()
+            ts = _fetch_timestamp(web3, block_number)
+            if ts is not None:
+                self.put(block_number, ts)
+        return ts
+
+
+def _fetch_timestamp(web3: Web3, block_number: int) -> Optional[datetime]:
+    try:
+        block = web3.eth.get_block(block_number)
+        return _to_datetime(block.get("timestamp"))
+    except Exception:
+        return None
+
+
+def _fetch_timestamps_batch(web3: Web3, block_numbers: List[int]) -> Dict[int, datetime]:
+    """
+    One JSON-RPC batch of eth_getBlockByNumber, sent through the provider's own HTTP session
+    and request settings (headers, timeout); empty dict if the provider can't batch.
+    """
+    provider = web3.provider
+    endpoint = getattr(provider, "endpoint_uri", None)
+    if not endpoint or not block_numbers or not hasattr(provider, "get_request_kwargs"):
+        return {}
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": "eth_getBlockByNumber", "params": [hex(bn), False]}
+        for i, bn in enumerate(block_numbers)
+    ]
+    try:
+        raw = make_post_request(endpoint, json.dumps(payload).encode(), **provider.get_request_kwargs())
+        data = json.loads(raw)
+    except Exception:
+        return {}
+    if not isinstance(data, list):
+        return {}
+    out: Dict[int, datetime] = {}
+    for item in data:
+        result = item.get("result") if isinstance(item, dict) else None
+        if not result:
+            continue
+        ts = _to_datetime(result.get("timestamp"))
+        number = result.get("number")
+        if ts is not None and number is not None:
+            out[int(number, 16) if isinstance(number, str) else int(number)] = ts
+    return out
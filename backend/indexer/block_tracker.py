@@ -11,6 +11,6 @@ def get_last_block(contract_address: str) -> int | None:
     return db_queries.get_block_checkpoint(contract_address)
 
 
-def set_last_block(contract_address: str, block_number: int) -> None:
-    """Persist last processed block for this contract."""
-    db_queries.upsert_block_checkpoint(contract_address, block_number)
+def set_last_block(contract_address: str, block_number: int, cur=None) -> None:
+    """Persist last processed block for this contract (inside `cur`'s transaction if given)."""
+    db_queries.upsert_block_checkpoint(contract_address, block_number, cur=cur)
@@ -4,7 +4,7 @@ ABI event decoder and registry for Uniswap V3 Swap and ERC-20 Transfer.
 from __future__ import annotations
 
 from decimal import Decimal
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 # Uniswap V3 Pool Swap event
 UNISWAP_V3_SWAP_ABI = [
@@ -16,7 +16,7 @@ UNISWAP_V3_SWAP_ABI = [
             {"indexed": False, "name": "amount0", "type": "int256"},
             {"indexed": False, "name": "amount1", "type": "int256"},
             {"indexed": False, "name": "sqrtPriceX96", "type": "uint160"},
-            {"indexed": False, "name": "liquidity", "type": "int128"},
+            {"indexed": False, "name": "liquidity", "type": "uint128"},
             {"indexed": False, "name": "tick", "type": "int24"},
         ],
         "name": "Swap",
@@ -38,6 +38,10 @@ ERC20_TRANSFER_ABI = [
     }
 ]
 
+# topic0 = keccak256 of the canonical event signature
+SWAP_TOPIC = "0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"  # Swap(address,address,int256,int256,uint160,uint128,int24)
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"  # Transfer(address,address,uint256)
+
 # Token metadata: address -> decimals (and optional coingecko_id for price_service)
 KNOWN_TOKENS: Dict[str, Dict[str, Any]] = {
     "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48": {"symbol": "USDC", "decimals": 6, "coingecko_id": "usd-coin"},
@@ -47,6 +51,13 @@ KNOWN_TOKENS: Dict[str, Dict[str, Any]] = {
     "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2": {"symbol": "WETH", "decimals": 18, "coingecko_id": "weth"},
 }
 
+_KNOWN_TOKENS_LOWER = {addr.lower(): meta for addr, meta in KNOWN_TOKENS.items()}
+
+
+def token_meta(address: str) -> Dict[str, Any]:
+    """KNOWN_TOKENS entry for an address in any case, or {}."""
+    return _KNOWN_TOKENS_LOWER.get((address or "").lower(), {})
+
 
 def _to_decimal(value: Any) -> Decimal:
     if isinstance(value, Decimal):
@@ -71,6 +82,35 @@ def _addr(a: Any) -> str:
     return str(a).lower()
 
 
+def _event_ts(ts: Any) -> Any:
+    if hasattr(ts, "isoformat"):
+        return ts
+    from datetime import datetime
+    return datetime.utcfromtimestamp(ts) if isinstance(ts, (int, float)) else ts
+
+
+def _tx_hex(tx_hash: Any) -> str:
+    return tx_hash.hex() if hasattr(tx_hash, "hex") else str(tx_hash)
+
+
+# Raw eth_getLogs helpers: topics/data arrive as HexBytes from web3 or 0x-strings from JSON-RPC
+
+def _raw_bytes(value: Any) -> bytes:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    s = str(value)
+    return bytes.fromhex(s[2:] if s.startswith("0x") else s)
+
+
+def _word_int(data: bytes, index: int, signed: bool = False) -> int:
+    """ABI words are 32 bytes, sign-extended, so int24/int128 decode from the full word."""
+    return int.from_bytes(data[32 * index : 32 * index + 32], "big", signed=signed)
+
+
+def _topic_addr(topic: Any) -> str:
+    return "0x" + _raw_bytes(topic)[-20:].hex()
+
+
 class UniswapDecoder:
     """Decode Uniswap V3 Swap events into structured records."""
 
@@ -89,30 +129,59 @@ class UniswapDecoder:
         amount1 = args.get("amount1")
         if sender is None or amount0 is None or amount1 is None:
             return None
+        return self._record(
+            log, sender, recipient, amount0, amount1,
+            args.get("sqrtPriceX96"), args.get("liquidity"), args.get("tick"), block_timestamp,
+        )
+
+    def decode_raw(self, log: Dict[str, Any], block_timestamp: Any) -> Optional[Dict[str, Any]]:
+        """Decode straight from eth_getLogs topics/data, skipping web3 event processing."""
+        topics = log.get("topics") or []
+        data = _raw_bytes(log.get("data") or b"")
+        if len(topics) < 3 or len(data) < 160:
+            return None
+        return self._record(
+            log,
+            _topic_addr(topics[1]),
+            _topic_addr(topics[2]),
+            _word_int(data, 0, signed=True),
+            _word_int(data, 1, signed=True),
+            _word_int(data, 2),
+            _word_int(data, 3),
+            _word_int(data, 4, signed=True),
+            block_timestamp,
+        )
+
+    def decode_raw_batch(self, logs: List[Dict[str, Any]], block_timestamp: Callable[[int], Any]) -> List[Dict[str, Any]]:
+        out = []
+        for log in logs:
+            rec = self.decode_raw(log, block_timestamp(log["blockNumber"]))
+            if rec is not None:
+                out.append(rec)
+        return out
+
+    def _record(
+        self,
+        log: Dict[str, Any],
+        sender: Any,
+        recipient: Any,
+        amount0: Any,
+        amount1: Any,
+        sqrt_price_x96: Any,
+        liquidity: Any,
+        tick: Any,
+        block_timestamp: Any,
+    ) -> Optional[Dict[str, Any]]:
         amount0_d = _to_decimal(amount0)
         amount1_d = _to_decimal(amount1)
-        amt0_human = _human_amount(amount0_d, self.token0_decimals)
-        amt1_human = _human_amount(amount1_d, self.token1_decimals)
         # Swap direction: negative amount = token out, positive = token in
-        if amount0_d < 0 and amount1_d > 0:
-            token_in_addr, token_out_addr = self.token1_address, self.token0_address
-            amount_in, amount_out = amt1_human, -amt0_human
-        elif amount0_d > 0 and amount1_d < 0:
-            token_in_addr, token_out_addr = self.token0_address, self.token1_address
-            amount_in, amount_out = amt0_human, -amt1_human
-        else:
+        if not ((amount0_d < 0 and amount1_d > 0) or (amount0_d > 0 and amount1_d < 0)):
             return None
-        ts = block_timestamp
-        if hasattr(ts, "isoformat"):
-            event_ts = ts
-        else:
-            from datetime import datetime
-            event_ts = datetime.utcfromtimestamp(ts) if isinstance(ts, (int, float)) else ts
-        tx_hash = log.get("transactionHash")
-        tx_hex = tx_hash.hex() if hasattr(tx_hash, "hex") else str(tx_hash)
+        amt0_human = _human_amount(amount0_d, self.token0_decimals)
+        amt1_human = _human_amount(amount1_d, self.token1_decimals)
         return {
             "block_number": log.get("blockNumber"),
-            "tx_hash": tx_hex,
+            "tx_hash": _tx_hex(log.get("transactionHash")),
             "log_index": log.get("logIndex", 0),
             "pool_address": self.pool_address,
             "sender_address": _addr(sender),
@@ -121,10 +190,10 @@ class UniswapDecoder:
             "token1_address": self.token1_address,
             "amount0": amt0_human if amount0_d >= 0 else -amt0_human,
             "amount1": amt1_human if amount1_d >= 0 else -amt1_human,
-            "sqrt_price_x96": args.get("sqrtPriceX96"),
-            "liquidity": args.get("liquidity"),
-            "tick": args.get("tick"),
-            "event_timestamp": event_ts,
+            "sqrt_price_x96": sqrt_price_x96,
+            "liquidity": liquidity,
+            "tick": tick,
+            "event_timestamp": _event_ts(block_timestamp),
         }
 
 
@@ -143,26 +212,37 @@ class ERC20Decoder:
         value = args.get("value")
         if value is None:
             return None
+        return self._record(log, from_addr, to_addr, value, block_timestamp)
+
+    def decode_raw(self, log: Dict[str, Any], block_timestamp: Any) -> Optional[Dict[str, Any]]:
+        """Decode straight from eth_getLogs topics/data, skipping web3 event processing."""
+        topics = log.get("topics") or []
+        data = _raw_bytes(log.get("data") or b"")
+        if len(topics) < 3 or len(data) < 32:
+            return None
+        return self._record(log, _topic_addr(topics[1]), _topic_addr(topics[2]), _word_int(data, 0), block_timestamp)
+
+    def decode_raw_batch(self, logs: List[Dict[str, Any]], block_timestamp: Callable[[int], Any]) -> List[Dict[str, Any]]:
+        out = []
+        for log in logs:
+            rec = self.decode_raw(log, block_timestamp(log["blockNumber"]))
+            if rec is not None:
+                out.append(rec)
+        return out
+
+    def _record(self, log: Dict[str, Any], from_addr: Any, to_addr: Any, value: Any, block_timestamp: Any) -> Dict[str, Any]:
         amount_raw = _to_decimal(value)
         amount = _human_amount(amount_raw, self.decimals)
-        ts = block_timestamp
-        if hasattr(ts, "isoformat"):
-            event_ts = ts
-        else:
-            from datetime import datetime
-            event_ts = datetime.utcfromtimestamp(ts) if isinstance(ts, (int, float)) else ts
-        tx_hash = log.get("transactionHash")
-        tx_hex = tx_hash.hex() if hasattr(tx_hash, "hex") else str(tx_hash)
         return {
             "block_number": log.get("blockNumber"),
-            "tx_hash": tx_hex,
+            "tx_hash": _tx_hex(log.get("transactionHash")),
             "log_index": log.get("logIndex", 0),
             "token_address": self.token_address,
             "from_address": _addr(from_addr),
             "to_address": _addr(to_addr),
             "amount_raw": amount_raw,
             "amount": amount,
-            "event_timestamp": event_ts,
+            "event_timestamp": _event_ts(block_timestamp),
         }
 
 
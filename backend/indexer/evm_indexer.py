@@ -3,30 +3,39 @@ EVM indexer: fetch Uniswap V3 Swap and ERC-20 Transfer events, decode, enrich, p
 """
 from __future__ import annotations
 
+import asyncio
 import os
 import time
-from datetime import datetime, timezone
+from datetime import datetime
 from decimal import Decimal
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Tuple
 
 from web3 import Web3
 
+from indexer.block_cache import BlockTimestampCache
 from indexer.block_tracker import get_last_block, set_last_block
-from indexer.decoder import (
-    KNOWN_TOKENS,
-    ERC20Decoder,
-    UniswapDecoder,
-)
+from indexer import price_history
+from indexer.decoder import token_meta
 from indexer.event_classifier import classify_swap_size, filter_dust_transfer
-from indexer.price_service import fetch_and_cache_for_token, get_cached_price
-from db.queries import insert_raw_events, insert_raw_swaps, insert_raw_transfers
+from indexer.log_fetcher import CombinedLogFetcher
+from indexer.range_controller import AdaptiveRangeController
+from indexer.raw_events import raw_event_row, raw_events_mode
+from indexer.rate_limiter import TokenBucket
+from indexer.price_oracle import PriceOracle
+from indexer.price_service import get_price, refresh_if_due
+from db.connection import unit_of_work
+from db.queries import copy_raw_rows
 
 # Alchemy RPC
-def get_web3() -> Web3:
+def get_rpc_url() -> str:
     url = os.getenv("ALCHEMY_API_URL", "").strip()
     if not url:
         url = "https://eth-mainnet.g.alchemy.com/v2/demo"
-    return Web3(Web3.HTTPProvider(url, request_kwargs={"timeout": 30}))
+    return url
+
+
+def get_web3() -> Web3:
+    return Web3(Web3.HTTPProvider(get_rpc_url(), request_kwargs={"timeout": 30}))
 
 # Contract config: Uniswap V3 pools (address -> token0, token1) and ERC-20 list
 UNISWAP_V3_POOLS: List[Dict[str, str]] = [
@@ -44,175 +53,231 @@ ERC20_CONTRACTS: List[str] = [
     "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",  # WETH
 ]
 
-BATCH_SIZE = 50
-BLOCK_CHUNK = 9  # Alchemy free tier: max 10 blocks per eth_getLogs
+# getLogs ranges per pass; range size itself adapts to the provider (see range_controller)
+MAX_RANGES_PER_PASS = int(os.getenv("INDEXER_MAX_RANGES_PER_PASS", "1"))
 # How many blocks behind head to start if no checkpoint exists
 DEFAULT_LOOKBACK = 200
+# Retries for non range-limit getLogs errors before the pass gives up
+FETCH_RETRIES = 3
+RETRY_BACKOFF = 1.0  # seconds, doubled per attempt
+# USD price sources for enrichment, highest priority first
+PRICE_SOURCES = ("onchain", "history", "spot")
+DEFAULT_PRICE_SOURCE = "onchain,history,spot"
+
+_range_controller = AdaptiveRangeController.from_env()
+_rate_limiter = TokenBucket.from_env()
+# Block timestamps survive across passes and contracts (scheduler reuses this process);
+# header fetches share the getLogs rate limit
+_block_cache = BlockTimestampCache(rate_limiter=_rate_limiter)
+_price_oracle = PriceOracle(UNISWAP_V3_POOLS)
 
 
 def _block_timestamp(web3: Web3, block_number: int) -> datetime:
-    try:
-        block = web3.eth.get_block(block_number)
-        ts = block.get("timestamp")
-        if isinstance(ts, (int, float)):
-            return datetime.fromtimestamp(ts, tz=timezone.utc)
-    except Exception:
-        pass
-    return datetime.now(timezone.utc)
-
-
-def _swap_usd_value(amount_in: Decimal, token_in_address: str) -> Decimal | None:
-    """Estimate swap USD from token-in amount and cached price."""
-    addr = token_in_address.lower()
-    meta = KNOWN_TOKENS.get(token_in_address) or KNOWN_TOKENS.get(addr)
-    if not meta:
-        return None
-    cg_id = meta.get("coingecko_id")
-    if not cg_id:
-        return None
-    price = get_cached_price(cg_id)
-    if price is None:
-        price = fetch_and_cache_for_token(addr, cg_id)
+    ts = _block_cache.timestamp(web3, block_number)
+    if ts is None:
+        # Failing the range beats stamping events with the wrong time
+        raise RuntimeError(f"Block {block_number} header unavailable")
+    return ts
+
+
+def _range_timestamp(web3: Web3, headers: Dict[int, datetime]) -> Callable[[int], datetime]:
+    """Timestamp lookup for one range: its prefilled headers first, then the shared cache / RPC."""
+    def lookup(block_number: int) -> datetime:
+        ts = headers.get(block_number)
+        return ts if ts is not None else _block_timestamp(web3, block_number)
+    return lookup
+
+
+def price_sources() -> List[str]:
+    """Enrichment price sources in priority order (PRICE_SOURCE, comma-separated)."""
+    sources = [p.strip().lower() for p in os.getenv("PRICE_SOURCE", DEFAULT_PRICE_SOURCE).split(",")]
+    return [p for p in sources if p in PRICE_SOURCES] or DEFAULT_PRICE_SOURCE.split(",")
+
+
+def _usd_price(token_address: str, ts: datetime | None, block_number: int | None = None) -> float | None:
+    """
+    USD price as of the event, trying each configured source in order: on-chain pool
+    state at the block, price history at the timestamp, then the in-memory spot price
+    for events recent enough that spot is still a fair estimate. No I/O.
+    """
+    cg_id = token_meta(token_address).get("coingecko_id")
+    for source in price_sources():
+        price = None
+        if source == "onchain" and block_number is not None:
+            price = _price_oracle.price_usd(token_address, block_number)
+        elif source == "history" and ts is not None:
+            price = price_history.price_at(token_address, ts)
+        elif source == "spot" and cg_id and (ts is None or time.time() - ts.timestamp() <= price_history.MAX_GAP):
+            price = get_price(cg_id)
+        if price is not None:
+            return price
+    return None
+
+
+def _swap_usd_value(
+    amount_in: Decimal,
+    token_in_address: str,
+    ts: datetime | None = None,
+    block_number: int | None = None,
+) -> Decimal | None:
+    """Estimate swap USD from token-in amount and the as-of price."""
+    price = _usd_price(token_in_address, ts, block_number)
     if price is None:
         return None
     return amount_in * Decimal(str(price))
 
 
-def _run_indexer_pass() -> None:
+def _swap_record(decoded: Dict[str, Any]) -> Dict[str, Any]:
+    """Enrich a decoded swap with USD value and size bucket."""
+    amount_in = decoded.get("amount1") if decoded.get("amount0", 0) < 0 else decoded.get("amount0")
+    token_in = decoded.get("token1_address") if decoded.get("amount0", 0) < 0 else decoded.get("token0_address")
+    usd = _swap_usd_value(Decimal(str(amount_in)), token_in, decoded.get("event_timestamp"), decoded.get("block_number"))
+    decoded["usd_value"] = float(usd) if usd is not None else None
+    decoded["size_bucket"] = classify_swap_size(usd)
+    return decoded
+
+
+def _transfer_record(decoded: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Enrich a decoded transfer with USD value; None if it is dust."""
+    amount = decoded.get("amount")
+    usd = None
+    if amount is not None:
+        price = _usd_price(decoded["token_address"], decoded.get("event_timestamp"), decoded.get("block_number"))
+        if price is not None:
+            usd = Decimal(str(amount)) * Decimal(str(price))
+    if not filter_dust_transfer(usd):
+        return None
+    decoded["usd_value"] = float(usd) if usd is not None else None
+    decoded["direction"] = None  # optional: pass tracked_wallets
+    decoded["is_exchange"] = False
+    return decoded
+
+
+def _get_fetcher() -> CombinedLogFetcher:
+    return CombinedLogFetcher(UNISWAP_V3_POOLS, ERC20_CONTRACTS)
+
+
+def _load_checkpoints(addresses: List[str], end_block: int) -> Dict[str, int]:
+    default_start = max(0, end_block - DEFAULT_LOOKBACK)
+    checkpoints: Dict[str, int] = {}
+    for addr in addresses:
+        last = get_last_block(addr)
+        checkpoints[addr] = default_start if last is None else last
+    return checkpoints
+
+
+def _fetch_range(w3: Web3, fetcher: CombinedLogFetcher, start: int, end_block: int) -> Tuple[int, List]:
+    """
+    Fetch the next adaptive range after `start`; returns (to_block, routed logs).
+    Range-limit errors shrink and retry; other RPC errors retry with backoff and then
+    raise, so the caller never checkpoints past a range it could not read.
+    """
+    attempt = 0
+    while True:
+        from_block, to_block = _range_controller.next_range(start, end_block)
+        _rate_limiter.acquire()
+        try:
+            logs = fetcher.fetch(w3, from_block, to_block)
+        except Exception as e:
+            if _range_controller.record_failure(e):
+                continue
+            attempt += 1
+            if attempt > FETCH_RETRIES:
+                raise
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            continue
+        if _range_controller.record_success(len(logs)):
+            return to_block, logs
+
+
+def _decode_logs(
+    logs: List,
+    block_timestamp: Callable[[int], datetime],
+    checkpoints: Dict[str, int] | None = None,
+) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Decode and enrich routed logs into (raw_events, swaps, transfers) rows."""
+    # Group per route so each decoder works on a whole batch of raw logs
+    by_route: Dict[Tuple[str, str], Tuple[Any, List]] = {}
+    for route, log in logs:
+        # Contracts already past this block were indexed by an earlier pass
+        if checkpoints is not None and log["blockNumber"] <= checkpoints[route.address]:
+            continue
+        by_route.setdefault((route.address, route.topic), (route, []))[1].append(log)
+
+    decoded_groups = [(route, group, route.decoder.decode_raw_batch(group, block_timestamp)) for route, group in by_route.values()]
+    if decoded_groups and "onchain" in price_sources():
+        # Pool state first, so every event in the range sees its block's on-chain price
+        _price_oracle.warm(min(log["blockNumber"] for _, group, _ in decoded_groups for log in group))
+        _price_oracle.observe_swaps([d for route, _, rows in decoded_groups if route.event_name == "Swap" for d in rows])
+
+    mode = raw_events_mode()
+    raw_events_batch: List[Dict] = []
+    swaps_batch: List[Dict] = []
+    transfers_batch: List[Dict] = []
+    for route, group, decoded_rows in decoded_groups:
+        by_position = {(log["blockNumber"], log.get("logIndex", 0)): log for log in group} if mode == "compact" else {}
+        for decoded in decoded_rows:
+            if route.event_name == "Swap":
+                swaps_batch.append(_swap_record(decoded))
+            else:
+                if _transfer_record(decoded) is None:
+                    continue
+                transfers_batch.append(decoded)
+            raw_log = by_position.get((decoded["block_number"], decoded["log_index"]))
+            raw_event = raw_event_row(decoded, route.address, route.event_name, raw_log, mode)
+            if raw_event is not None:
+                raw_events_batch.append(raw_event)
+    return raw_events_batch, swaps_batch, transfers_batch
+
+
+def _index_logs(
+    logs: List,
+    checkpoints: Dict[str, int],
+    to_block: int,
+    block_timestamp: Callable[[int], datetime],
+) -> None:
+    """
+    Decode, enrich and persist one fetched range. Rows and the checkpoint advance to
+    `to_block` commit in one transaction, so a crash can't leave them out of step.
+    """
+    rows = _decode_logs(logs, block_timestamp, checkpoints)
+    advanced = [addr for addr, last in checkpoints.items() if last < to_block]
+    with unit_of_work() as cur:
+        copy_raw_rows(cur, *rows)
+        for addr in advanced:
+            set_last_block(addr, to_block, cur=cur)
+    for addr in advanced:
+        checkpoints[addr] = to_block
+
+
+def _run_indexer_pass(max_ranges: int | None = None) -> None:
     w3 = get_web3()
     if not w3.is_connected():
         return
 
-    # Index Uniswap V3 Swap events
-    swap_abi = [
-        {
-            "anonymous": False,
-            "inputs": [
-                {"indexed": True, "name": "sender", "type": "address"},
-                {"indexed": True, "name": "recipient", "type": "address"},
-                {"indexed": False, "name": "amount0", "type": "int256"},
-                {"indexed": False, "name": "amount1", "type": "int256"},
-                {"indexed": False, "name": "sqrtPriceX96", "type": "uint160"},
-                {"indexed": False, "name": "liquidity", "type": "int128"},
-                {"indexed": False, "name": "tick", "type": "int24"},
-            ],
-            "name": "Swap",
-            "type": "event",
-        }
-    ]
-    transfer_abi = [
-        {
-            "anonymous": False,
-            "inputs": [
-                {"indexed": True, "name": "from", "type": "address"},
-                {"indexed": True, "name": "to", "type": "address"},
-                {"indexed": False, "name": "value", "type": "uint256"},
-            ],
-            "name": "Transfer",
-            "type": "event",
-        }
-    ]
-
-    for pool in UNISWAP_V3_POOLS:
-        addr = pool["address"].lower()
-        end_block = w3.eth.block_number
-        start = get_last_block(addr)
-        if start is None:
-            start = max(0, end_block - DEFAULT_LOOKBACK)
-        if start >= end_block:
-            continue
-        decoder = UniswapDecoder(pool["address"], pool["token0"], pool["token1"])
-        to_block = min(start + BLOCK_CHUNK, end_block)
-        try:
-            contract = w3.eth.contract(address=Web3.to_checksum_address(pool["address"]), abi=swap_abi)
-            logs = contract.events.Swap.get_logs(fromBlock=start + 1, toBlock=to_block)
-        except Exception:
-            logs = []
-        raw_events_batch: List[Dict] = []
-        swaps_batch: List[Dict] = []
-        for log in logs:
-            block_ts = _block_timestamp(w3, log["blockNumber"])
-            decoded = decoder.decode(dict(log), block_ts)
-            if not decoded:
-                continue
-            # Enrich with USD and size_bucket
-            amount_in = decoded.get("amount1") if decoded.get("amount0", 0) < 0 else decoded.get("amount0")
-            token_in = decoded.get("token1_address") if decoded.get("amount0", 0) < 0 else decoded.get("token0_address")
-            usd = _swap_usd_value(Decimal(str(amount_in)), token_in)
-            decoded["usd_value"] = float(usd) if usd is not None else None
-            decoded["size_bucket"] = classify_swap_size(usd)
-            # Raw event
-            raw_events_batch.append({
-                "block_number": decoded["block_number"],
-                "tx_hash": decoded["tx_hash"],
-                "log_index": decoded["log_index"],
-                "contract_address": addr,
-                "event_name": "Swap",
-                "event_params": {k: str(v) for k, v in decoded.items()},
-                "event_timestamp": decoded["event_timestamp"],
-            })
-            swaps_batch.append(decoded)
-        for i in range(0, len(raw_events_batch), BATCH_SIZE):
-            insert_raw_events(raw_events_batch[i : i + BATCH_SIZE])
-        for i in range(0, len(swaps_batch), BATCH_SIZE):
-            insert_raw_swaps(swaps_batch[i : i + BATCH_SIZE])
-        set_last_block(addr, to_block)
-        time.sleep(0.2)  # rate limit
-
-    # Index ERC-20 Transfer events
-    for token_address in ERC20_CONTRACTS:
-        addr = token_address.lower()
-        end_block = w3.eth.block_number
-        start = get_last_block(addr)
-        if start is None:
-            start = max(0, end_block - DEFAULT_LOOKBACK)
+    # Prices are refreshed here, once per pass, never per log
+    refresh_if_due()
+    fetcher = _get_fetcher()
+    end_block = w3.eth.block_number
+    checkpoints = _load_checkpoints(fetcher.addresses, end_block)
+    for _ in range(max_ranges or MAX_RANGES_PER_PASS):
+        # One range for all contracts, starting at the one furthest behind
+        start = min(checkpoints.values())
         if start >= end_block:
-            continue
-        decoder = ERC20Decoder(token_address)
-        to_block = min(start + BLOCK_CHUNK, end_block)
-        try:
-            contract = w3.eth.contract(address=Web3.to_checksum_address(token_address), abi=transfer_abi)
-            logs = contract.events.Transfer.get_logs(fromBlock=start + 1, toBlock=to_block)
-        except Exception:
-            logs = []
-        raw_events_batch = []
-        transfers_batch = []
-        meta = KNOWN_TOKENS.get(token_address) or KNOWN_TOKENS.get(addr) or {}
-        cg_id = meta.get("coingecko_id")
-        for log in logs:
-            block_ts = _block_timestamp(w3, log["blockNumber"])
-            decoded = decoder.decode(dict(log), block_ts)
-            if not decoded:
-                continue
-            amount = decoded.get("amount")
-            usd = None
-            if cg_id and amount is not None:
-                price = get_cached_price(cg_id) or (fetch_and_cache_for_token(addr, cg_id))
-                if price is not None:
-                    usd = Decimal(str(amount)) * Decimal(str(price))
-            if not filter_dust_transfer(usd):
-                continue
-            decoded["usd_value"] = float(usd) if usd is not None else None
-            decoded["direction"] = None  # optional: pass tracked_wallets
-            decoded["is_exchange"] = False
-            raw_events_batch.append({
-                "block_number": decoded["block_number"],
-                "tx_hash": decoded["tx_hash"],
-                "log_index": decoded["log_index"],
-                "contract_address": addr,
-                "event_name": "Transfer",
-                "event_params": {k: str(v) for k, v in decoded.items()},
-                "event_timestamp": decoded["event_timestamp"],
-            })
-            transfers_batch.append(decoded)
-        for i in range(0, len(raw_events_batch), BATCH_SIZE):
-            insert_raw_events(raw_events_batch[i : i + BATCH_SIZE])
-        for i in range(0, len(transfers_batch), BATCH_SIZE):
-            insert_raw_transfers(transfers_batch[i : i + BATCH_SIZE])
-        set_last_block(addr, to_block)
-        time.sleep(0.2)
-
-
-def run_indexer_once() -> None:
-    """Single indexer pass (called by scheduler or manually)."""
-    _run_indexer_pass()
+            return
+        to_block, logs = _fetch_range(w3, fetcher, start, end_block)
+        headers = _block_cache.prefill(w3, (log["blockNumber"] for _, log in logs))
+        _index_logs(logs, checkpoints, to_block, _range_timestamp(w3, headers))
+
+
+def run_indexer_once(max_ranges: int | None = None, mode: str | None = None) -> None:
+    """
+    Single indexer pass (called by scheduler or manually).
+    mode: "sync" (default) or "async"; falls back to INDEXER_MODE.
+    """
+    mode = (mode or os.getenv("INDEXER_MODE") or "sync").strip().lower()
+    if mode == "async":
+        from indexer.async_indexer import run_async_pass
+        asyncio.run(run_async_pass(max_ranges))
+        return
+    _run_indexer_pass(max_ranges)
@@ -0,0 +1,93 @@
+"""
+Combined log fetcher: one eth_getLogs per block range across every tracked contract,
+routed back to the matching decoder by (address, topic0). Logs stay raw; decoders read
+topics/data directly.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from web3 import Web3
+
+from indexer.decoder import SWAP_TOPIC, TRANSFER_TOPIC, ERC20Decoder, UniswapDecoder
+
+
+def _hex(value: Any) -> str:
+    h = value.hex() if hasattr(value, "hex") else str(value)
+    h = h.lower()
+    return h if h.startswith("0x") else "0x" + h
+
+
+@dataclass
+class LogRoute:
+    """Where a (contract address, topic0) pair goes: event kind and decoder."""
+
+    address: str
+    topic: str
+    event_name: str
+    decoder: Any
+
+
+class CombinedLogFetcher:
+    """Fetch Swap + Transfer logs for all pools and tokens with a single getLogs filter."""
+
+    def __init__(self, pools: List[Dict[str, str]], tokens: List[str]):
+        self.routes: Dict[Tuple[str, str], LogRoute] = {}
+        for pool in pools:
+            self._add(LogRoute(
+                address=pool["address"].lower(),
+                topic=SWAP_TOPIC,
+                event_name="Swap",
+                decoder=UniswapDecoder(pool["address"], pool["token0"], pool["token1"]),
+            ))
+        for token_address in tokens:
+            self._add(LogRoute(
+                address=token_address.lower(),
+                topic=TRANSFER_TOPIC,
+                event_name="Transfer",
+                decoder=ERC20Decoder(token_address),
+            ))
+
+    def _add(self, route: LogRoute) -> None:
+        self.routes[(route.address, route.topic)] = route
+
+    @property
+    def addresses(self) -> List[str]:
+        return sorted({r.address for r in self.routes.values()})
+
+    @property
+    def topics(self) -> List[str]:
+        return sorted({r.topic for r in self.routes.values()})
+
+    def log_filter(self, from_block: int, to_block: int) -> Dict[str, Any]:
+        return {
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": [Web3.to_checksum_address(a) for a in self.addresses],
+            # Single topic0 position with an OR-list: Swap or Transfer
+            "topics": [self.topics],
+        }
+
+    def route(self, log: Any) -> LogRoute | None:
+        topics = log.get("topics") or []
+        if not topics:
+            return None
+        return self.routes.get((str(log.get("address", "")).lower(), _hex(topics[0])))
+
+    def fetch(self, w3: Web3, from_block: int, to_block: int) -> List[Tuple[LogRoute, Dict[str, Any]]]:
+        """One eth_getLogs for the range; returns (route, raw log) pairs in chain order."""
+        return self.route_all(w3.eth.get_logs(self.log_filter(from_block, to_block)))
+
+    async def fetch_async(self, w3: Any, from_block: int, to_block: int) -> List[Tuple[LogRoute, Dict[str, Any]]]:
+        """Same as fetch, on an AsyncWeb3 instance."""
+        return self.route_all(await w3.eth.get_logs(self.log_filter(from_block, to_block)))
+
+    def route_all(self, raw_logs: List[Any]) -> List[Tuple[LogRoute, Dict[str, Any]]]:
+        out: List[Tuple[LogRoute, Dict[str, Any]]] = []
+        for raw in raw_logs:
+            route = self.route(raw)
+            if route is not None:
+                out.append((route, raw))
+        out.sort(key=lambda x: (x[1].get("blockNumber", 0), x[1].get("logIndex", 0)))
+        return out
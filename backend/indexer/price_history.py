@@ -0,0 +1,223 @@
+"""
+Historical USD prices: token_price_history loaded into an in-memory as-of index keyed by
+(token, timestamp), linearly interpolated between points. Filled in bulk from CoinGecko
+market_chart/range or a local JSON/CSV dump, so historical events are priced without
+network calls.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db import queries as db_queries
+from indexer.decoder import KNOWN_TOKENS
+
+# Don't interpolate across (or extrapolate beyond) gaps wider than this many seconds
+MAX_GAP = int(os.getenv("PRICE_HISTORY_MAX_GAP", str(6 * 3600)))
+# Reload the in-memory index from Postgres at most this often
+RELOAD_INTERVAL = 3600
+# CoinGecko market_chart/range returns hourly points for windows up to 90 days
+CHUNK_SECONDS = 90 * 86400
+
+
+def _epoch(ts: datetime | float | int) -> float:
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.timestamp()
+    return float(ts)
+
+
+class PriceHistoryIndex:
+    """Per-token sorted (epoch, price) arrays with bisect lookups."""
+
+    def __init__(self, max_gap: float = MAX_GAP):
+        self.max_gap = max_gap
+        self._ts: Dict[str, List[float]] = {}
+        self._px: Dict[str, List[float]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._ts.values())
+
+    def load(self, points: Iterable[Tuple[str, float, float]]) -> None:
+        """Replace contents with (token_address, epoch, price) points."""
+        merged: Dict[str, Dict[float, float]] = {}
+        for token, ts, price in points:
+            merged.setdefault(token.lower(), {})[float(ts)] = float(price)
+        self._ts.clear()
+        self._px.clear()
+        for token, series in merged.items():
+            keys = sorted(series)
+            self._ts[token] = keys
+            self._px[token] = [series[k] for k in keys]
+
+    def add(self, token_address: str, ts: datetime | float, price: float) -> None:
+        token = token_address.lower()
+        t = _epoch(ts)
+        times = self._ts.setdefault(token, [])
+        prices = self._px.setdefault(token, [])
+        i = bisect_right(times, t)
+        if i and times[i - 1] == t:
+            prices[i - 1] = float(price)
+            return
+        times.insert(i, t)
+        prices.insert(i, float(price))
+
+    def price_at(self, token_address: str, ts: datetime | float) -> Optional[float]:
+        """Price as of ts: interpolated between neighbours, or the nearest point within max_gap."""
+        token = (token_address or "").lower()
+        times = self._ts.get(token)
+        if not times:
+            return None
+        t = _epoch(ts)
+        i = bisect_right(times, t)
+        if i == 0:
+            return self._px[token][0] if times[0] - t <= self.max_gap else None
+        t0, p0 = times[i - 1], self._px[token][i - 1]
+        if i == len(times) or t0 == t:
+            return p0 if t - t0 <= self.max_gap else None
+        t1, p1 = times[i], self._px[token][i]
+        if t1 - t0 > self.max_gap:
+            # Too sparse to interpolate: only trust a point close to ts
+            if t - t0 <= self.max_gap:
+                return p0
+            return p1 if t1 - t <= self.max_gap else None
+        return p0 + (p1 - p0) * (t - t0) / (t1 - t0)
+
+
+_index = PriceHistoryIndex()
+_loaded_at = 0.0
+_load_lock = threading.Lock()
+
+
+def reload_if_due() -> None:
+    """
+    Reload the shared index from token_price_history when RELOAD_INTERVAL has passed (called
+    with the spot refresh, once per indexer pass); keeps the old points if the DB is unreachable.
+    """
+    global _loaded_at
+    if time.time() - _loaded_at >= RELOAD_INTERVAL:
+        with _load_lock:
+            if time.time() - _loaded_at >= RELOAD_INTERVAL:
+                try:
+                    _index.load(db_queries.get_token_price_history())
+                except Exception:
+                    pass
+                _loaded_at = time.time()
+
+
+def get_index() -> PriceHistoryIndex:
+    """Shared in-memory index; no I/O (see reload_if_due)."""
+    return _index
+
+
+def price_at(token_address: str, ts: datetime | float) -> Optional[float]:
+    return _index.price_at(token_address, ts)
+
+
+# Bulk loaders
+
+def _history_rows(token_address: str, points: Iterable[Tuple[float, float]], source: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            "token_address": token_address.lower(),
+            "ts": datetime.fromtimestamp(ts, tz=timezone.utc),
+            "price_usd": price,
+            "source": source,
+        }
+        for ts, price in points
+    ]
+
+
+def fetch_market_chart_range(coingecko_id: str, start: float, end: float) -> List[Tuple[float, float]]:
+    """(epoch, price) points from /coins/{id}/market_chart/range, fetched in 90-day chunks."""
+    from indexer.price_service import _get_client, get_base_url
+
+    points: List[Tuple[float, float]] = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(end, chunk_start + CHUNK_SECONDS)
+        r = _get_client().get(
+            f"{get_base_url()}/coins/{coingecko_id}/market_chart/range",
+            params={"vs_currency": "usd", "from": int(chunk_start), "to": int(chunk_end)},
+        )
+        r.raise_for_status()
+        points.extend((ms / 1000.0, float(price)) for ms, price in r.json().get("prices") or [])
+        chunk_start = chunk_end
+    return points
+
+
+def load_from_coingecko(start: datetime | float, end: datetime | float) -> int:
+    """Fetch history for every KNOWN_TOKENS entry and store it. Returns points written."""
+    written = 0
+    for addr, meta in KNOWN_TOKENS.items():
+        cg_id = meta.get("coingecko_id")
+        if not cg_id:
+            continue
+        try:
+            points = fetch_market_chart_range(cg_id, _epoch(start), _epoch(end))
+        except Exception as e:
+            print(f"[PriceHistory] {cg_id}: {e}")
+            continue
+        db_queries.insert_token_price_history(_history_rows(addr, points, "coingecko"))
+        written += len(points)
+    _invalidate()
+    return written
+
+
+def _parse_ts(value: Any) -> float:
+    if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+        v = float(value)
+        # Millisecond epochs (CoinGecko dumps)
+        return v / 1000.0 if v > 1e11 else v
+    return _epoch(datetime.fromisoformat(str(value).replace("Z", "+00:00")))
+
+
+def _token_for(key: str) -> Optional[str]:
+    """Token address for an address or coingecko_id."""
+    if key.lower().startswith("0x"):
+        return key.lower()
+    for addr, meta in KNOWN_TOKENS.items():
+        if meta.get("coingecko_id") == key:
+            return addr.lower()
+    return None
+
+
+def load_from_file(path: str, token: str | None = None) -> int:
+    """
+    Import a local dump. JSON: a market_chart response ({"prices": [[ms, price], ...]}, needs
+    token) or {token_or_coingecko_id: market_chart response}. CSV: token (address or
+    coingecko_id), ts (epoch or ISO 8601), price_usd.
+    """
+    series: Dict[str, List[Tuple[float, float]]] = {}
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                addr = _token_for(row.get("token") or row.get("token_address") or row.get("coingecko_id") or token or "")
+                if addr:
+                    series.setdefault(addr, []).append((_parse_ts(row["ts"]), float(row["price_usd"])))
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        charts = {token: data} if "prices" in data else data
+        for key, chart in charts.items():
+            addr = _token_for(key or "")
+            if addr:
+                series.setdefault(addr, []).extend((_parse_ts(ts), float(p)) for ts, p in chart.get("prices") or [])
+    written = 0
+    for addr, points in series.items():
+        db_queries.insert_token_price_history(_history_rows(addr, points, "file"))
+        written += len(points)
+    _invalidate()
+    return written
+
+
+def _invalidate() -> None:
+    global _loaded_at
+    _loaded_at = 0.0
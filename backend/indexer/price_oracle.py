@@ -0,0 +1,155 @@
+"""
+On-chain USD prices from Uniswap V3 pool state: each Swap's sqrtPriceX96 gives the pool
+price at that block, and tokens are valued by routing through pools to a stablecoin
+(e.g. WETH via USDC/WETH, WBTC via WBTC/WETH then WETH/USDC). Deterministic and offline,
+so backfills price events without any external lookups.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from indexer.decoder import token_meta
+
+# Stablecoins valued at exactly 1 USD (lowercase)
+STABLECOINS = {
+    "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48",  # USDC
+    "0xdac17f958d2ee523a2206206994597c13d831ec7",  # USDT
+    "0x6b175474e89094c44da98b954eedeac495271d0f",  # DAI
+}
+# Ignore pool state older than this many blocks (~1 day)
+MAX_STALE_BLOCKS = 7200
+# Pool hops allowed between a token and a stablecoin
+MAX_HOPS = 2
+Q96 = 2 ** 96
+
+
+def sqrt_price_to_price(sqrt_price_x96: Any, decimals0: int, decimals1: int) -> float:
+    """Human price of token0 in token1 from a pool's sqrtPriceX96."""
+    ratio = (int(sqrt_price_x96) / Q96) ** 2
+    return ratio * 10 ** (decimals0 - decimals1)
+
+
+class PriceOracle:
+    """Per-pool sqrtPriceX96 observations plus a per-(block, token) USD price cache."""
+
+    def __init__(self, pools: List[Dict[str, str]], cache_size: int = 65536):
+        self.pools: Dict[str, Tuple[str, str]] = {
+            p["address"].lower(): (p["token0"].lower(), p["token1"].lower()) for p in pools
+        }
+        self._obs: Dict[str, List[Tuple[int, int]]] = {addr: [] for addr in self.pools}
+        self._cache: "OrderedDict[Tuple[int, str], Optional[float]]" = OrderedDict()
+        self._cache_size = cache_size
+        # Highest block with a cached price: observations past it can't invalidate anything
+        self._cached_through = -1
+        self._warmed_at: int | None = None
+
+    def observe(self, pool_address: str, block_number: int, sqrt_price_x96: Any) -> None:
+        """Record a pool's price after a swap; later swaps in the same block win."""
+        obs = self._obs.get((pool_address or "").lower())
+        if obs is None or not sqrt_price_x96:
+            return
+        entry = (int(block_number), int(sqrt_price_x96))
+        if obs and obs[-1][0] == entry[0]:
+            obs[-1] = entry
+        elif not obs or obs[-1][0] < entry[0]:
+            obs.append(entry)
+        else:
+            i = bisect_right(obs, (entry[0], -1))
+            if i < len(obs) and obs[i][0] == entry[0]:
+                obs[i] = entry
+            else:
+                insort(obs, entry)
+        # Cached prices at or after this block may have changed. Observations normally land
+        # past every cached block (swaps are observed before the range is priced), so the
+        # scan only runs for out-of-order ones.
+        if entry[0] <= self._cached_through:
+            for key in [k for k in self._cache if k[0] >= entry[0]]:
+                del self._cache[key]
+            self._cached_through = max((k[0] for k in self._cache), default=-1)
+
+    def observe_swaps(self, swaps: List[Dict[str, Any]]) -> None:
+        for s in sorted(swaps, key=lambda s: (s["block_number"], s["log_index"])):
+            self.observe(s.get("pool_address"), s["block_number"], s.get("sqrt_price_x96"))
+
+    def _pool_price(self, pool_address: str, block_number: int) -> Optional[float]:
+        """token0 priced in token1 as of the end of block_number, if not stale."""
+        obs = self._obs[pool_address]
+        i = bisect_right(obs, (block_number, float("inf")))
+        if i == 0:
+            return None
+        obs_block, sqrt_price = obs[i - 1]
+        if block_number - obs_block > MAX_STALE_BLOCKS:
+            return None
+        token0, token1 = self.pools[pool_address]
+        dec0 = int(token_meta(token0).get("decimals", 18))
+        dec1 = int(token_meta(token1).get("decimals", 18))
+        return sqrt_price_to_price(sqrt_price, dec0, dec1)
+
+    def price_usd(self, token_address: str, block_number: int) -> Optional[float]:
+        token = (token_address or "").lower()
+        if token in STABLECOINS:
+            return 1.0
+        key = (int(block_number), token)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        price = self._route(token, int(block_number), MAX_HOPS, {token})
+        self._cache[key] = price
+        if key[0] > self._cached_through:
+            self._cached_through = key[0]
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return price
+
+    def _route(self, token: str, block_number: int, hops: int, seen: set) -> Optional[float]:
+        """Depth-first search for a pool path from token to a stablecoin."""
+        if hops <= 0:
+            return None
+        for pool, (token0, token1) in self.pools.items():
+            if token not in (token0, token1):
+                continue
+            other = token1 if token == token0 else token0
+            if other in seen:
+                continue
+            pool_price = self._pool_price(pool, block_number)
+            if not pool_price:
+                continue
+            # Price of token in units of other
+            in_other = pool_price if token == token0 else 1.0 / pool_price
+            if other in STABLECOINS:
+                return in_other
+            other_usd = self._route(other, block_number, hops - 1, seen | {other})
+            if other_usd is not None:
+                return in_other * other_usd
+        return None
+
+    def _prune(self, before_block: int) -> None:
+        """Drop observations older than before_block; earlier blocks then need warm() again."""
+        for pool_address, obs in self._obs.items():
+            i = bisect_right(obs, (before_block - 1, float("inf")))
+            if i:
+                del obs[:i]
+                if self._warmed_at is not None:
+                    self._warmed_at = max(self._warmed_at, before_block + MAX_STALE_BLOCKS)
+
+    def warm(self, block_number: int) -> None:
+        """
+        Seed each pool with its last swap before block_number from raw_swaps, so a pass or
+        backfill shard can price its first blocks. Skipped if already warmed at or below it.
+        Observations too stale to price block_number or later are dropped first, so a
+        long-running indexer keeps a bounded history.
+        """
+        self._prune(block_number - MAX_STALE_BLOCKS)
+        if self._warmed_at is not None and block_number >= self._warmed_at:
+            return
+        from db.queries import get_pool_prices_before
+
+        try:
+            rows = get_pool_prices_before(list(self.pools), block_number)
+        except Exception:
+            return
+        for pool_address, obs_block, sqrt_price in rows:
+            self.observe(pool_address, obs_block, sqrt_price)
+        self._warmed_at = block_number
@@ -1,21 +1,31 @@
 """
-CoinGecko price fetcher with 5-minute in-memory cache and optional DB write.
+CoinGecko price fetcher: one batched /simple/price request for every tracked token on a
+pooled client, refreshed ahead of the 5-minute TTL so the indexer hot loop only reads memory.
 """
 from __future__ import annotations
 
 import os
+import threading
 import time
-from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
 
 import httpx
 
 from db import queries as db_queries
+from indexer import price_history
+from indexer.decoder import KNOWN_TOKENS
 
 # Cache TTL seconds (5 min)
 CACHE_TTL = 300
+# Refresh this long before entries expire
+REFRESH_INTERVAL = CACHE_TTL * 0.8
 
 # In-memory cache: coingecko_id -> (price_usd, fetched_at)
 _price_cache: Dict[str, tuple[float, float]] = {}
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+_client: httpx.Client | None = None
 
 
 def get_base_url() -> str:
@@ -26,61 +36,93 @@ def get_api_key() -> Optional[str]:
     return os.getenv("COINGECKO_API_KEY") or None
 
 
-def fetch_price(coingecko_id: str) -> Optional[float]:
-    """
-    Fetch current USD price for a CoinGecko id. Uses 5-min cache.
-    Writes to token_prices table when token_address is provided via fetch_and_cache.
-    """
-    now = time.time()
-    if coingecko_id in _price_cache:
-        price, fetched_at = _price_cache[coingecko_id]
-        if now - fetched_at < CACHE_TTL:
-            return price
-    url = f"{get_base_url()}/simple/price"
-    params = {"ids": coingecko_id, "vs_currencies": "usd"}
+def _headers() -> Dict[str, str]:
     headers = {}
     api_key = get_api_key()
     if api_key:
         headers["x-cg-demo-api-key" if "demo" in api_key.lower() else "x-cg-pro-api-key"] = api_key
+    return headers
+
+
+def _get_client() -> httpx.Client:
+    """Shared keep-alive client (connection pooling across refreshes)."""
+    global _client
+    if _client is None:
+        _client = httpx.Client(timeout=10.0, headers=_headers())
+    return _client
+
+
+def _tracked_ids() -> Dict[str, str]:
+    """coingecko_id -> lowercase token address for every KNOWN_TOKENS entry."""
+    return {
+        meta["coingecko_id"]: addr.lower()
+        for addr, meta in KNOWN_TOKENS.items()
+        if meta.get("coingecko_id")
+    }
+
+
+def fetch_prices(coingecko_ids: Iterable[str]) -> Dict[str, float]:
+    """Fetch USD prices for many ids in one comma-joined request and update the cache."""
+    ids = sorted(set(coingecko_ids))
+    if not ids:
+        return {}
     try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(url, params=params, headers=headers or None)
-            r.raise_for_status()
-            data = r.json()
-        price = data.get(coingecko_id, {}).get("usd")
-        if price is not None:
-            _price_cache[coingecko_id] = (float(price), now)
-            return float(price)
+        r = _get_client().get(f"{get_base_url()}/simple/price", params={"ids": ",".join(ids), "vs_currencies": "usd"})
+        r.raise_for_status()
+        data = r.json()
     except Exception:
-        pass
-    # Fallback to last known from cache even if stale
-    if coingecko_id in _price_cache:
-        return _price_cache[coingecko_id][0]
-    return None
+        return {}
+    now = time.time()
+    out: Dict[str, float] = {}
+    for cg_id in ids:
+        price = (data.get(cg_id) or {}).get("usd")
+        if price is not None:
+            out[cg_id] = float(price)
+            _price_cache[cg_id] = (float(price), now)
+    return out
 
 
-def fetch_and_cache_for_token(token_address: str, coingecko_id: str) -> Optional[float]:
+def refresh_prices() -> Dict[str, float]:
+    """Refresh every tracked token in one request and upsert token_prices in one transaction."""
+    global _last_refresh
+    with _refresh_lock:
+        ids = _tracked_ids()
+        prices = fetch_prices(ids)
+        _last_refresh = time.time()
+    if prices:
+        fetched_at = datetime.now(timezone.utc)
+        rows = [
+            {
+                "token_address": ids[cg_id],
+                "coingecko_id": cg_id,
+                "price_usd": price,
+                "fetched_at": fetched_at,
+                "source": "coingecko",
+            }
+            for cg_id, price in prices.items()
+        ]
+        try:
+            db_queries.upsert_token_prices(rows)
+            # Spot refreshes also extend the history so live events keep as-of prices
+            db_queries.insert_token_price_history([{**r, "ts": fetched_at} for r in rows])
+        except Exception:
+            pass
+        for r in rows:
+            price_history.get_index().add(r["token_address"], fetched_at, r["price_usd"])
+    return prices
+
+
+def refresh_if_due() -> None:
     """
-    Fetch price, update cache, and upsert into token_prices table.
+    Refresh spot prices when the last refresh is older than REFRESH_INTERVAL, and the price
+    history index when it is due (called once per indexer pass, so enrichment never waits on I/O).
     """
-    price = fetch_price(coingecko_id)
-    if price is not None:
-        from datetime import datetime, timezone
-        db_queries.upsert_token_price(
-            token_address=token_address.lower(),
-            coingecko_id=coingecko_id,
-            price_usd=price,
-            fetched_at=datetime.now(timezone.utc),
-            source="coingecko",
-        )
-    return price
-
-
-def get_cached_price(coingecko_id: str) -> Optional[float]:
-    """Return cached price if still valid, else None."""
-    if coingecko_id not in _price_cache:
-        return None
-    price, fetched_at = _price_cache[coingecko_id]
-    if time.time() - fetched_at >= CACHE_TTL:
-        return None
-    return price
+    price_history.reload_if_due()
+    if time.time() - _last_refresh >= REFRESH_INTERVAL:
+        refresh_prices()
+
+
+def get_price(coingecko_id: str) -> Optional[float]:
+    """Last known price regardless of age; never does I/O (indexer hot path)."""
+    entry = _price_cache.get(coingecko_id)
+    return entry[0] if entry else None
@@ -0,0 +1,87 @@
+"""
+Adaptive eth_getLogs block-range sizing: grow while responses stay under the provider's
+limits, halve on "too many results" / response-size / timeout errors.
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Tuple
+
+# Per-provider limits: max blocks per getLogs call and max logs per response
+PROVIDER_LIMITS: Dict[str, Dict[str, int]] = {
+    "alchemy-free": {"max_block_range": 10, "max_logs": 10000},
+    "alchemy": {"max_block_range": 2000, "max_logs": 10000},
+    "infura": {"max_block_range": 10000, "max_logs": 10000},
+    "quicknode": {"max_block_range": 10000, "max_logs": 10000},
+    "local": {"max_block_range": 100000, "max_logs": 100000},
+}
+DEFAULT_PROVIDER = "alchemy-free"
+
+# Error fragments providers use when a range is too large or too slow
+RANGE_ERROR_MARKERS = (
+    "more than",
+    "too many",
+    "response size",
+    "limit exceeded",
+    "block range",
+    "range is too large",
+    "query timeout",
+    "timed out",
+    "timeout",
+    "-32005",
+)
+
+
+def is_range_error(exc: BaseException) -> bool:
+    """True if the error means the range should be retried smaller."""
+    if isinstance(exc, TimeoutError) or "Timeout" in type(exc).__name__:
+        return True
+    msg = str(exc).lower()
+    return any(m in msg for m in RANGE_ERROR_MARKERS)
+
+
+class AdaptiveRangeController:
+    """Tracks the current getLogs range size for one provider."""
+
+    def __init__(self, max_block_range: int, max_logs: int, min_block_range: int = 1, initial: int | None = None):
+        self.max_block_range = max(1, max_block_range)
+        self.max_logs = max(1, max_logs)
+        self.min_block_range = max(1, min(min_block_range, self.max_block_range))
+        self.size = min(self.max_block_range, initial or self.max_block_range)
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveRangeController":
+        provider = os.getenv("RPC_PROVIDER", DEFAULT_PROVIDER).strip().lower() or DEFAULT_PROVIDER
+        limits = PROVIDER_LIMITS.get(provider, PROVIDER_LIMITS[DEFAULT_PROVIDER])
+        max_range = int(os.getenv("RPC_MAX_BLOCK_RANGE") or limits["max_block_range"])
+        max_logs = int(os.getenv("RPC_MAX_LOGS") or limits["max_logs"])
+        # Start small on big-range providers and let success grow it
+        return cls(max_range, max_logs, initial=min(max_range, 100))
+
+    def next_range(self, start: int, head: int) -> Tuple[int, int]:
+        """Inclusive (from_block, to_block) after checkpoint `start`, capped at `head`."""
+        return start + 1, min(start + self.size, head)
+
+    def record_success(self, n_logs: int) -> bool:
+        """
+        Update size after a response. Returns False if the response hit the log cap
+        (possibly truncated) and the range must be retried smaller.
+        """
+        if n_logs >= self.max_logs and self.size > self.min_block_range:
+            self.shrink()
+            return False
+        if n_logs < self.max_logs // 2:
+            self.size = min(self.max_block_range, self.size * 2)
+        elif n_logs > (self.max_logs * 3) // 4:
+            self.size = max(self.min_block_range, (self.size * 3) // 4)
+        return True
+
+    def record_failure(self, exc: BaseException) -> bool:
+        """Halve on range-limit errors. Returns True if a smaller retry is worthwhile."""
+        if not is_range_error(exc) or self.size <= self.min_block_range:
+            return False
+        self.shrink()
+        return True
+
+    def shrink(self) -> None:
+        self.size = max(self.min_block_range, self.size // 2)
@@ -0,0 +1,43 @@
+"""
+Token-bucket rate limiter for RPC calls, usable from sync and asyncio code.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """Allow `rate` calls per second on average with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = max(rate, 0.001)
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TokenBucket":
+        return cls(float(os.getenv("RPC_RATE_LIMIT", "5")))
+
+    def _take(self) -> float:
+        """Take one token if available; otherwise return seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        while (wait := self._take()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,163 @@
+"""
+raw_events retention: full (stringified JSONB params), compact (original topics/data as
+bytea, no JSONB) or off (typed raw_swaps/raw_transfers only). Includes the tool that
+rewrites existing full rows to compact, or drops them for off.
+"""
+from __future__ import annotations
+
+import os
+from decimal import Decimal, localcontext
+from typing import Any, Dict, List, Optional
+
+from indexer.decoder import KNOWN_TOKENS, SWAP_TOPIC, TRANSFER_TOPIC, _raw_bytes
+
+RAW_EVENTS_MODES = ("full", "compact", "off")
+DEFAULT_MODE = "full"
+# Rows per batch when compacting existing raw_events
+COMPACT_BATCH_SIZE = 5000
+
+
+def raw_events_mode() -> str:
+    mode = os.getenv("RAW_EVENTS_MODE", DEFAULT_MODE).strip().lower()
+    return mode if mode in RAW_EVENTS_MODES else DEFAULT_MODE
+
+
+def raw_event_row(
+    decoded: Dict[str, Any],
+    contract_address: str,
+    event_name: str,
+    log: Dict[str, Any] | None,
+    mode: str | None = None,
+) -> Optional[Dict[str, Any]]:
+    """raw_events row for a decoded log in the given retention mode; None when mode is off."""
+    mode = mode or raw_events_mode()
+    if mode == "off":
+        return None
+    row = {
+        "block_number": decoded["block_number"],
+        "tx_hash": decoded["tx_hash"],
+        "log_index": decoded["log_index"],
+        "contract_address": contract_address,
+        "event_name": event_name,
+        "event_params": None,
+        "topics": None,
+        "data": None,
+        "event_timestamp": decoded["event_timestamp"],
+    }
+    if mode == "compact" and log is not None:
+        row["topics"] = b"".join(_raw_bytes(t) for t in log.get("topics") or [])
+        row["data"] = _raw_bytes(log.get("data") or b"")
+    else:
+        row["event_params"] = {k: str(v) for k, v in decoded.items()}
+    return row
+
+
+# Re-encoding stringified params back to the original log layout (for existing rows)
+
+def _word(value: int) -> bytes:
+    return int(value).to_bytes(32, "big", signed=value < 0)
+
+
+def _addr_word(address: str) -> bytes:
+    return b"\0" * 12 + bytes.fromhex(address.lower().removeprefix("0x"))
+
+
+def _decimals(token_address: str) -> int:
+    for addr, meta in KNOWN_TOKENS.items():
+        if addr.lower() == (token_address or "").lower():
+            return int(meta.get("decimals", 18))
+    return 18
+
+
+def _raw_amount(human: str, decimals: int) -> int:
+    with localcontext() as ctx:
+        ctx.prec = 100
+        return int(Decimal(human).scaleb(decimals))
+
+
+def encode_params(event_name: str, params: Dict[str, str]) -> tuple[bytes, bytes] | None:
+    """(topics, data) rebuilt from a full-mode event_params dict, or None if it can't be."""
+    try:
+        if event_name == "Swap":
+            topics = _raw_bytes(SWAP_TOPIC) + _addr_word(params["sender_address"]) + _addr_word(params["recipient_address"])
+            data = b"".join([
+                _word(_raw_amount(params["amount0"], _decimals(params["token0_address"]))),
+                _word(_raw_amount(params["amount1"], _decimals(params["token1_address"]))),
+                _word(int(params["sqrt_price_x96"])),
+                _word(int(params["liquidity"])),
+                _word(int(params["tick"])),
+            ])
+            return topics, data
+        if event_name == "Transfer":
+            topics = _raw_bytes(TRANSFER_TOPIC) + _addr_word(params["from_address"]) + _addr_word(params["to_address"])
+            return topics, _word(int(Decimal(params["amount_raw"])))
+    except (KeyError, ValueError, ArithmeticError, OverflowError):
+        return None
+    return None
+
+
+def compact_existing(mode: str = "compact", batch_size: int = COMPACT_BATCH_SIZE) -> int:
+    """
+    Migrate full-mode raw_events rows: compact re-encodes event_params to topics/data and
+    nulls the JSONB; off deletes the rows; full leaves them as they are. Returns rows
+    changed. Safe to rerun.
+    """
+    if mode not in RAW_EVENTS_MODES:
+        raise ValueError(f"unknown raw_events mode: {mode}")
+    if mode == "full":
+        return 0
+
+    from psycopg2.extras import execute_values
+
+    from db.connection import get_conn_cursor, init_connection_pool
+    from db.queries import run_query
+
+    init_connection_pool()
+    if mode == "off":
+        changed = 0
+        while True:
+            with get_conn_cursor() as (conn, cur):
+                cur.execute(
+                    "DELETE FROM raw_events WHERE id IN (SELECT id FROM raw_events ORDER BY id LIMIT %s)",
+                    (batch_size,),
+                )
+                n = cur.rowcount
+            changed += n
+            if n < batch_size:
+                return changed
+
+    changed = 0
+    last_id = 0
+    while True:
+        rows = run_query(
+            """
+            SELECT id, event_name, event_params
+            FROM raw_events
+            WHERE event_params IS NOT NULL AND id > %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_id, batch_size),
+        )
+        if not rows:
+            return changed
+        last_id = rows[-1]["id"]
+        updates: List[tuple] = []
+        for r in rows:
+            encoded = encode_params(r["event_name"], r["event_params"] or {})
+            if encoded is not None:
+                updates.append((r["id"], encoded[0], encoded[1]))
+        if updates:
+            with get_conn_cursor() as (conn, cur):
+                execute_values(
+                    cur,
+                    """
+                    UPDATE raw_events AS e
+                    SET event_params = NULL, topics = v.topics, data = v.data
+                    FROM (VALUES %s) AS v(id, topics, data)
+                    WHERE e.id = v.id
+                    """,
+                    updates,
+                    template="(%s, %s::bytea, %s::bytea)",
+                )
+            changed += len(updates)
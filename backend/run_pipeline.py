@@ -7,7 +7,15 @@ Run the full ChainPulse data pipeline:
 Usage:
   python run_pipeline.py            # run everything
   python run_pipeline.py index      # only indexer
+  python run_pipeline.py index 25 --async   # indexer on the concurrent asyncio engine
   python run_pipeline.py analyze    # only analysis
+  python run_pipeline.py backfill <from_block> <to_block> [workers] [shard_size]
+  python run_pipeline.py compact-events [compact|off]   # migrate existing raw_events rows
+  python run_pipeline.py prices <from_date> [to_date]     # load CoinGecko price history
+  python run_pipeline.py prices <file.json|file.csv> [token]   # load price history from a dump
+  python run_pipeline.py migrate    # apply db/migrations and create upcoming raw-table partitions
+  python run_pipeline.py partitions [keep_months]   # create upcoming months; detach older ones
+  python run_pipeline.py archive <keep_months>   # export older months to Parquet, then drop them
 """
 import os
 import sys
@@ -20,11 +28,11 @@ backend_dir = Path(__file__).parent
 load_dotenv(backend_dir / ".env")
 
 
-def run_indexer():
+def run_indexer(mode=None):
     print("[Pipeline] Running indexer (recent blocks)...")
     from indexer.evm_indexer import run_indexer_once
     try:
-        run_indexer_once()
+        run_indexer_once(mode=mode)
         print("[Pipeline] Indexer pass complete.")
     except Exception as e:
         print(f"[Pipeline] Indexer error: {e}")
@@ -32,6 +40,90 @@ def run_indexer():
         traceback.print_exc()
 
 
+def run_backfill(from_block, to_block, workers=None, shard_size=None):
+    print(f"[Pipeline] Backfilling blocks {from_block}..{to_block}...")
+    from indexer.backfill import DEFAULT_SHARD_SIZE, DEFAULT_WORKERS, run_backfill as _run_backfill
+    try:
+        _run_backfill(from_block, to_block, workers or DEFAULT_WORKERS, shard_size or DEFAULT_SHARD_SIZE)
+        print("[Pipeline] Backfill complete.")
+    except Exception as e:
+        print(f"[Pipeline] Backfill error: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def run_compact_events(mode="compact"):
+    print(f"[Pipeline] Compacting raw_events (mode={mode})...")
+    from indexer.raw_events import compact_existing
+    try:
+        n = compact_existing(mode)
+        print(f"[Pipeline] raw_events: {n} rows migrated. Run VACUUM raw_events to reclaim space.")
+    except Exception as e:
+        print(f"[Pipeline] Compaction error: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def run_price_history(source, extra=None):
+    from indexer import price_history
+    try:
+        if os.path.exists(source):
+            print(f"[Pipeline] Loading price history from {source}...")
+            n = price_history.load_from_file(source, extra)
+        else:
+            from datetime import datetime, timezone
+            start = datetime.fromisoformat(source).replace(tzinfo=timezone.utc)
+            end = datetime.fromisoformat(extra).replace(tzinfo=timezone.utc) if extra else datetime.now(timezone.utc)
+            print(f"[Pipeline] Loading CoinGecko price history {start.date()}..{end.date()}...")
+            n = price_history.load_from_coingecko(start, end)
+        print(f"[Pipeline] token_price_history: {n} points loaded.")
+    except Exception as e:
+        print(f"[Pipeline] Price history error: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def run_migrate():
+    print("[Pipeline] Applying schema migrations...")
+    from db.migrate import migrate
+    from db.partitions import ensure_partitions
+    try:
+        applied = migrate()
+        print(f"[Pipeline] Migrations applied: {', '.join(applied) or 'none pending'}.")
+        print(f"[Pipeline] Raw partitions created: {ensure_partitions()}.")
+    except Exception as e:
+        print(f"[Pipeline] Migration error: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def run_partitions(keep_months=None):
+    from db.partitions import detach_older_than, ensure_partitions
+    try:
+        print(f"[Pipeline] Raw partitions created: {ensure_partitions()}.")
+        if keep_months is not None:
+            detached = detach_older_than(keep_months)
+            print(f"[Pipeline] Detached {len(detached)} partitions older than {keep_months} months: {', '.join(detached)}")
+    except Exception as e:
+        print(f"[Pipeline] Partition maintenance error: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def run_archive(keep_months):
+    print(f"[Pipeline] Archiving raw partitions older than {keep_months} months...")
+    from db.archive import ARCHIVE_DIR, archive_closed
+    try:
+        entries = archive_closed(keep_months)
+        for e in entries:
+            print(f"  -> {e['partition']}: {e['rows']} rows, {e['bytes']} bytes")
+        print(f"[Pipeline] {len(entries)} partitions archived to {ARCHIVE_DIR}.")
+    except Exception as e:
+        print(f"[Pipeline] Archive error: {e}")
+        import traceback
+        traceback.print_exc()
+
+
 def run_analysis():
     print("[Pipeline] Running analysis scripts...")
     scripts = [
@@ -53,14 +145,65 @@ def run_analysis():
     print("[Pipeline] Analysis complete.")
 
 
+def _usage(line):
+    print(f"Usage: python run_pipeline.py {line}")
+
+
 def main():
-    mode = sys.argv[1] if len(sys.argv) > 1 else "all"
-    passes = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    mode = args[0] if args else "all"
+    if mode == "compact-events":
+        if len(args) > 1 and args[1] not in ("compact", "off"):
+            _usage("compact-events [compact|off]")
+            return
+        run_compact_events(args[1] if len(args) > 1 else "compact")
+        print("\n[Pipeline] All done!")
+        return
+    if mode == "prices":
+        if len(args) < 2:
+            _usage("prices <from_date> [to_date]")
+            _usage("prices <file.json|file.csv> [token]")
+            return
+        run_price_history(args[1], args[2] if len(args) > 2 else None)
+        print("\n[Pipeline] All done!")
+        return
+    if mode == "migrate":
+        run_migrate()
+        print("\n[Pipeline] All done!")
+        return
+    if mode == "partitions":
+        if len(args) > 1 and not args[1].isdigit():
+            _usage("partitions [keep_months]")
+            return
+        run_partitions(int(args[1]) if len(args) > 1 else None)
+        print("\n[Pipeline] All done!")
+        return
+    if mode == "archive":
+        if len(args) < 2 or not args[1].isdigit():
+            _usage("archive <keep_months>")
+            return
+        run_archive(int(args[1]))
+        print("\n[Pipeline] All done!")
+        return
+    if mode == "backfill":
+        try:
+            nums = [int(a) for a in args[1:5]]
+        except ValueError:
+            nums = []
+        if len(nums) < 2:
+            _usage("backfill <from_block> <to_block> [workers] [shard_size]")
+            return
+        run_backfill(*nums)
+        print("\n[Pipeline] All done!")
+        return
+    passes = int(args[1]) if len(args) > 1 else 25
+    indexer_mode = "async" if "--async" in flags else None
     if mode in ("all", "index"):
         # Run indexer multiple passes — Alchemy free tier = 10 blocks per pass
         for i in range(passes):
             print(f"\n[Pipeline] Indexer pass {i+1}/{passes}")
-            run_indexer()
+            run_indexer(indexer_mode)
     if mode in ("all", "analyze"):
         run_analysis()
     print("\n[Pipeline] All done!")
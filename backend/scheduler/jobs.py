@@ -1,5 +1,6 @@
 """
-APScheduler jobs: indexer every 15s, dbt run every 30min, analysis every hour.
+APScheduler jobs: prices every 4min, indexer every 15s, dbt run every 30min, analysis every hour,
+raw-table partition maintenance and Parquet archival daily.
 """
 from __future__ import annotations
 
@@ -16,11 +17,19 @@ logger = logging.getLogger(__name__)
 def run_indexer():
     try:
         from indexer.evm_indexer import run_indexer_once
-        run_indexer_once()
+        run_indexer_once(mode=os.getenv("INDEXER_MODE", "sync"))
     except Exception as e:
         logger.exception("Indexer job failed: %s", e)
 
 
+def run_price_refresh():
+    try:
+        from indexer.price_service import refresh_prices
+        refresh_prices()
+    except Exception as e:
+        logger.exception("Price refresh failed: %s", e)
+
+
 def run_dbt():
     try:
         dbt_dir = os.getenv("DBT_PROFILES_DIR", "").replace("/dbt_chainpulse", "")
@@ -50,10 +59,30 @@ def run_analysis():
         logger.exception("Analysis job failed: %s", e)
 
 
+def run_partition_maintenance():
+    try:
+        from db.archive import archive_closed
+        from db.partitions import ensure_partitions
+        ensure_partitions()
+        keep = os.getenv("RAW_RETENTION_MONTHS")
+        if keep:
+            archived = archive_closed(int(keep))
+            if archived:
+                logger.info("Archived raw partitions to Parquet: %s", ", ".join(e["partition"] for e in archived))
+    except Exception as e:
+        logger.exception("Partition maintenance failed: %s", e)
+
+
 def start_scheduler():
+    from datetime import datetime
+    from indexer.price_service import REFRESH_INTERVAL
+
     scheduler = BackgroundScheduler()
+    # Refresh prices ahead of the cache TTL so indexer passes never block on CoinGecko
+    scheduler.add_job(run_price_refresh, IntervalTrigger(seconds=REFRESH_INTERVAL), id="prices", next_run_time=datetime.now())
     scheduler.add_job(run_indexer, IntervalTrigger(seconds=15), id="indexer")
     scheduler.add_job(run_dbt, IntervalTrigger(minutes=30), id="dbt")
     scheduler.add_job(run_analysis, IntervalTrigger(hours=1), id="analysis")
+    scheduler.add_job(run_partition_maintenance, IntervalTrigger(days=1), id="partitions", next_run_time=datetime.now())
     scheduler.start()
     return scheduler
@@ -46,7 +46,7 @@ SELECT block_number, tx_hash, log_index,
     json_build_object('sender', sender_address, 'amount0', amount0::text, 'amount1', amount1::text)::jsonb,
     event_timestamp
 FROM raw_swaps
-ON CONFLICT (tx_hash, log_index) DO NOTHING;
+ON CONFLICT DO NOTHING;
 
 -- Generate raw_transfers
 INSERT INTO raw_transfers (block_number, tx_hash, log_index, token_address, from_address, to_address,
@@ -71,7 +71,7 @@ SELECT
     random() < 0.1,
     NOW() - ((1000 - s) || ' minutes')::interval
 FROM generate_series(1, 1000) s
-ON CONFLICT (tx_hash, log_index) DO NOTHING;
+ON CONFLICT DO NOTHING;
 
 -- Wallet segments (120 wallets)
 INSERT INTO analytics_wallet_segments (wallet_address, segment, cluster_id, rfm_recency, rfm_frequency, rfm_volume, computed_at)
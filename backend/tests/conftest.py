@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modules import each other as top-level packages (analysis, db, indexer), as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
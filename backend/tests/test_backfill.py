@@ -0,0 +1,18 @@
+from indexer.backfill import plan_shards
+
+
+def test_shards_cover_the_range_on_aligned_boundaries():
+    shards = plan_shards(1_234, 5_100, shard_size=1_000)
+    assert shards == [(1_234, 1_999), (2_000, 2_999), (3_000, 3_999), (4_000, 4_999), (5_000, 5_100)]
+
+
+def test_shard_ends_do_not_depend_on_where_the_range_starts():
+    # backfill_shards is keyed by (from_block, to_block), so reruns must land on the same ends
+    full = plan_shards(0, 9_999, 1_000)
+    later = plan_shards(2_500, 9_999, 1_000)
+    assert [end for _, end in later] == [end for _, end in full][2:]
+
+
+def test_single_block_and_empty_ranges():
+    assert plan_shards(7, 7, 1_000) == [(7, 7)]
+    assert plan_shards(8, 7, 1_000) == []
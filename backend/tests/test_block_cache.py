@@ -0,0 +1,85 @@
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from web3 import Web3
+
+from indexer.block_cache import HEADER_BATCH_SIZE, BlockTimestampCache
+
+
+class _Limiter:
+    def __init__(self):
+        self.calls = 0
+
+    def acquire(self):
+        self.calls += 1
+
+
+@pytest.fixture
+def rpc():
+    """Local JSON-RPC endpoint answering eth_getBlockByNumber with timestamp = 1000 + number."""
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            seen.append((dict(self.headers), body))
+            calls = body if isinstance(body, list) else [body]
+            out = [
+                {"jsonrpc": "2.0", "id": c["id"], "result": {"number": c["params"][0], "timestamp": hex(1000 + int(c["params"][0], 16))}}
+                for c in calls
+            ]
+            data = json.dumps(out if isinstance(body, list) else out[0]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", seen
+    server.shutdown()
+
+
+def test_prefill_batches_through_the_provider_and_the_rate_limiter(rpc):
+    url, seen = rpc
+    w3 = Web3(Web3.HTTPProvider(url, request_kwargs={"timeout": 5, "headers": {"X-Api-Key": "k"}}))
+    limiter = _Limiter()
+    cache = BlockTimestampCache(rate_limiter=limiter)
+    blocks = range(500, 500 + 2 * HEADER_BATCH_SIZE + 1)
+    headers = cache.prefill(w3, list(blocks) + [500])
+    assert headers == {bn: datetime.fromtimestamp(1000 + bn, tz=timezone.utc) for bn in blocks}
+    assert len(seen) == limiter.calls == 3
+    assert all(h.get("X-Api-Key") == "k" and isinstance(body, list) for h, body in seen)
+    # Cached now: no further requests or tokens
+    assert cache.prefill(w3, blocks) == headers
+    assert limiter.calls == 3
+
+
+def test_single_lookups_take_a_token_only_on_a_miss(rpc):
+    url, seen = rpc
+    limiter = _Limiter()
+    cache = BlockTimestampCache(rate_limiter=limiter)
+    w3 = Web3(Web3.HTTPProvider(url))
+    assert cache.timestamp(w3, 7) == datetime.fromtimestamp(1007, tz=timezone.utc)
+    assert cache.timestamp(w3, 7) == datetime.fromtimestamp(1007, tz=timezone.utc)
+    assert limiter.calls == 1
+
+
+def test_eviction_keeps_the_height_window_and_size_bound():
+    cache = BlockTimestampCache(max_size=50, height_window=20)
+    ts = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for bn in range(1000):
+        cache.put(bn, ts)
+    assert len(cache) == 21
+    assert 978 not in cache and 979 in cache and 999 in cache
+    small = BlockTimestampCache(max_size=5, height_window=1000)
+    for bn in range(10):
+        small.put(bn, ts)
+    assert len(small) == 5 and 4 not in small and 9 in small
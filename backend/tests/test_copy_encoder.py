@@ -0,0 +1,47 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from db.queries import RAW_SWAP_COLUMNS, _copy_text
+
+
+def test_nulls_and_scalars():
+    assert _copy_text(None) == "\\N"
+    assert _copy_text(True) == "t"
+    assert _copy_text(False) == "f"
+    assert _copy_text(0) == "0"
+    assert _copy_text(2**160) == str(2**160)
+    assert _copy_text(Decimal("-2500.000001")) == "-2500.000001"
+    assert _copy_text(datetime(2026, 1, 1, tzinfo=timezone.utc)) == "2026-01-01 00:00:00+00:00"
+
+
+def test_bytes_become_bytea_hex():
+    # COPY text format unescapes \\x to \x, which Postgres reads as bytea hex
+    assert _copy_text(b"\x00\xab\xff") == "\\\\x00abff"
+    assert _copy_text(bytearray(b"\x01")) == "\\\\x01"
+    assert _copy_text(memoryview(b"")) == "\\\\x"
+
+
+def test_special_characters_are_escaped():
+    assert _copy_text("a\tb") == "a\\tb"
+    assert _copy_text("a\nb\rc") == "a\\nb\\rc"
+    assert _copy_text("back\\slash") == "back\\\\slash"
+    # Escaping the backslash first keeps the other escapes single
+    assert _copy_text("\\\t") == "\\\\\\t"
+
+
+def test_dicts_and_lists():
+    params = {"memo": "tab\there", "amount": "1"}
+    encoded = _copy_text(params)
+    assert "\t" not in encoded
+    assert json.loads(encoded.replace("\\\\", "\\")) == params
+    assert _copy_text([1, None, 3]) == "{1,NULL,3}"
+    assert _copy_text(()) == "{}"
+
+
+def test_row_stays_one_line_with_one_field_per_column():
+    row = {c: None for c in RAW_SWAP_COLUMNS}
+    row.update(tx_hash="ab\ncd", sender_address="0x1\t2", amount0=Decimal("-1.5"))
+    line = "\t".join(_copy_text(row.get(c)) for c in RAW_SWAP_COLUMNS)
+    assert "\n" not in line
+    assert len(line.split("\t")) == len(RAW_SWAP_COLUMNS)
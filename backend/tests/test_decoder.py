@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from eth_abi import encode
+from hexbytes import HexBytes
+
+from indexer.decoder import SWAP_TOPIC, TRANSFER_TOPIC, ERC20Decoder, UniswapDecoder
+
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+POOL = "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+SENDER = "0xE592427A0AEce92De3Edee1F18E0157C05861564"
+RECIPIENT = "0x1111111254EEB25477B68fb85Ed929f73A960582"
+TS = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _topic(address: str) -> str:
+    return "0x" + "00" * 12 + address[2:].lower()
+
+
+def _log(topic0: str, indexed, data: bytes, block: int = 100, as_hex: bool = True) -> dict:
+    topics = [topic0] + [_topic(a) for a in indexed]
+    return {
+        "blockNumber": block,
+        "transactionHash": HexBytes("0x" + "ab" * 32),
+        "logIndex": 7,
+        "topics": topics if as_hex else [HexBytes(t) for t in topics],
+        "data": "0x" + data.hex() if as_hex else HexBytes(data),
+    }
+
+
+def _swap_data(amount0, amount1, sqrt_price, liquidity, tick) -> bytes:
+    return encode(
+        ["int256", "int256", "uint160", "uint128", "int24"],
+        [amount0, amount1, sqrt_price, liquidity, tick],
+    )
+
+
+def test_swap_decode_raw_matches_abi_decode():
+    dec = UniswapDecoder(POOL, USDC, WETH)
+    args = {
+        "sender": SENDER,
+        "recipient": RECIPIENT,
+        "amount0": -2_500_000_000,
+        "amount1": 10**18,
+        "sqrtPriceX96": 2**159 + 12345,
+        # Top bit of uint128 set: must not come back negative
+        "liquidity": 2**128 - 1,
+        "tick": -887272,
+    }
+    data = _swap_data(args["amount0"], args["amount1"], args["sqrtPriceX96"], args["liquidity"], args["tick"])
+    for as_hex in (True, False):
+        log = _log(SWAP_TOPIC, [SENDER, RECIPIENT], data, as_hex=as_hex)
+        raw = dec.decode_raw(log, TS)
+        assert raw == dec.decode({**log, "args": args}, TS)
+    assert raw["liquidity"] == 2**128 - 1
+    assert raw["tick"] == -887272
+    assert raw["sqrt_price_x96"] == 2**159 + 12345
+    assert raw["amount0"] == Decimal(-2500)
+    assert raw["amount1"] == Decimal(1)
+    assert raw["sender_address"] == SENDER.lower()
+    assert raw["recipient_address"] == RECIPIENT.lower()
+    assert raw["pool_address"] == POOL.lower()
+    assert raw["tx_hash"].removeprefix("0x") == "ab" * 32
+    assert raw["event_timestamp"] == TS
+
+
+def test_swap_decode_raw_rejects_same_sign_amounts_and_short_logs():
+    dec = UniswapDecoder(POOL, USDC, WETH)
+    same_sign = _swap_data(5, 7, 1, 1, 0)
+    assert dec.decode_raw(_log(SWAP_TOPIC, [SENDER, RECIPIENT], same_sign), TS) is None
+    valid = _swap_data(-5, 7, 1, 1, 0)
+    assert dec.decode_raw(_log(SWAP_TOPIC, [SENDER, RECIPIENT], valid[:128]), TS) is None
+    assert dec.decode_raw(_log(SWAP_TOPIC, [SENDER], valid), TS) is None
+
+
+def test_swap_decode_raw_batch_looks_up_each_block_and_skips_bad_logs():
+    dec = UniswapDecoder(POOL, USDC, WETH)
+    logs = [
+        _log(SWAP_TOPIC, [SENDER, RECIPIENT], _swap_data(-1, 1, 1, 1, 0), block=10),
+        _log(SWAP_TOPIC, [SENDER, RECIPIENT], _swap_data(1, 1, 1, 1, 0), block=11),
+        _log(SWAP_TOPIC, [SENDER, RECIPIENT], _swap_data(1, -1, 1, 1, 0), block=12),
+    ]
+    seen = []
+
+    def block_timestamp(n):
+        seen.append(n)
+        return datetime.fromtimestamp(n, tz=timezone.utc)
+
+    out = dec.decode_raw_batch(logs, block_timestamp)
+    assert seen == [10, 11, 12]
+    assert [r["block_number"] for r in out] == [10, 12]
+    assert out[1]["event_timestamp"] == datetime.fromtimestamp(12, tz=timezone.utc)
+
+
+def test_transfer_decode_raw_matches_abi_decode():
+    dec = ERC20Decoder(USDC)
+    value = 2**255 + 1
+    log = _log(TRANSFER_TOPIC, [SENDER, RECIPIENT], encode(["uint256"], [value]))
+    raw = dec.decode_raw(log, TS)
+    assert raw == dec.decode({**log, "args": {"from": SENDER, "to": RECIPIENT, "value": value}}, TS)
+    assert raw["token_address"] == USDC.lower()
+    assert raw["from_address"] == SENDER.lower()
+    assert raw["to_address"] == RECIPIENT.lower()
+    assert raw["amount_raw"] == Decimal(value)
+    assert raw["amount"] == Decimal(value) / 10**6
+
+
+def test_transfer_decode_raw_batch_skips_logs_without_value():
+    dec = ERC20Decoder(WETH)
+    logs = [
+        _log(TRANSFER_TOPIC, [SENDER, RECIPIENT], encode(["uint256"], [10**18]), block=5),
+        _log(TRANSFER_TOPIC, [SENDER, RECIPIENT], b"", block=6),
+    ]
+    out = dec.decode_raw_batch(logs, lambda n: TS)
+    assert len(out) == 1
+    assert out[0]["amount"] == Decimal(1)
@@ -0,0 +1,10 @@
+from datetime import date
+
+from db.partitions import _add_months
+
+
+def test_add_months_crosses_year_boundaries():
+    assert _add_months(date(2025, 11, 1), 2) == date(2026, 1, 1)
+    assert _add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert _add_months(date(2026, 3, 31), 0) == date(2026, 3, 1)
+    assert _add_months(date(2026, 1, 15), -25) == date(2023, 12, 1)
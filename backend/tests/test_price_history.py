@@ -0,0 +1,42 @@
+import pytest
+
+from indexer import price_history
+from indexer.price_history import PriceHistoryIndex
+
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+
+def test_interpolates_between_points_and_respects_max_gap():
+    idx = PriceHistoryIndex(max_gap=3600)
+    idx.load([(WETH.upper(), 0, 100.0), (WETH, 3600, 200.0), (WETH, 100_000, 300.0)])
+    assert idx.price_at(WETH, 1800) == pytest.approx(150.0)
+    assert idx.price_at(WETH, 3600) == 200.0
+    # Sparse: nearest point within max_gap, else nothing
+    assert idx.price_at(WETH, 5000) == 200.0
+    assert idx.price_at(WETH, 50_000) is None
+    assert idx.price_at(WETH, 99_000) == 300.0
+    assert idx.price_at(WETH, -3600) == 100.0
+    assert idx.price_at(WETH, -3601) is None
+    assert idx.price_at("0xunknown", 0) is None
+
+
+def test_add_replaces_same_timestamp():
+    idx = PriceHistoryIndex()
+    idx.add(WETH, 10, 1.0)
+    idx.add(WETH, 10, 2.0)
+    idx.add(WETH, 5, 0.5)
+    assert len(idx) == 2
+    assert idx.price_at(WETH, 10) == 2.0
+
+
+def test_price_at_never_touches_the_database(monkeypatch):
+    loads = []
+    monkeypatch.setattr(price_history.db_queries, "get_token_price_history", lambda: loads.append(1) or [(WETH, 0, 5.0)])
+    monkeypatch.setattr(price_history, "_index", PriceHistoryIndex())
+    monkeypatch.setattr(price_history, "_loaded_at", 0.0)
+    assert price_history.price_at(WETH, 0) is None
+    assert loads == []
+    price_history.reload_if_due()
+    price_history.reload_if_due()
+    assert loads == [1]
+    assert price_history.price_at(WETH, 0) == 5.0
@@ -0,0 +1,62 @@
+import pytest
+
+from indexer.price_oracle import MAX_STALE_BLOCKS, Q96, PriceOracle
+
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+POOL = "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640"
+
+
+def _sqrt_price(weth_usd: float) -> int:
+    # token0 = USDC (6 decimals), token1 = WETH (18): price0 in token1 = 1 / weth_usd
+    return int(Q96 * ((1 / weth_usd) * 10**12) ** 0.5)
+
+
+@pytest.fixture
+def oracle(monkeypatch):
+    warms = []
+    monkeypatch.setattr("db.queries.get_pool_prices_before", lambda pools, block: warms.append(block) or [])
+    o = PriceOracle([{"address": POOL, "token0": USDC, "token1": WETH}])
+    o.warms = warms
+    return o
+
+
+def _swaps(blocks, weth_usd=2000.0):
+    return [{"pool_address": POOL, "block_number": b, "log_index": 0, "sqrt_price_x96": _sqrt_price(weth_usd)} for b in blocks]
+
+
+def test_prices_route_through_the_pool_and_go_stale(oracle):
+    oracle.observe_swaps(_swaps([100]))
+    assert oracle.price_usd(WETH, 100) == pytest.approx(2000.0)
+    assert oracle.price_usd(WETH, 100 + MAX_STALE_BLOCKS) == pytest.approx(2000.0)
+    assert oracle.price_usd(WETH, 101 + MAX_STALE_BLOCKS) is None
+    assert oracle.price_usd(USDC, 1) == 1.0
+
+
+def test_out_of_order_observation_invalidates_later_cached_prices(oracle):
+    oracle.observe_swaps(_swaps([100]))
+    assert oracle.price_usd(WETH, 200) == pytest.approx(2000.0)
+    oracle.observe_swaps(_swaps([150], weth_usd=2500.0))
+    assert oracle.price_usd(WETH, 200) == pytest.approx(2500.0)
+    assert oracle.price_usd(WETH, 120) == pytest.approx(2000.0)
+
+
+def test_history_stays_bounded_over_a_long_run(oracle):
+    for start in range(1_000_000, 1_100_000, 100):
+        oracle.warm(start)
+        oracle.observe_swaps(_swaps(range(start, start + 100, 10)))
+        assert oracle.price_usd(WETH, start) is not None
+    obs = oracle._obs[POOL]
+    assert len(obs) <= MAX_STALE_BLOCKS // 10 + 10
+    assert obs[0][0] >= 1_099_900 - MAX_STALE_BLOCKS
+    # Only the first pass needed the database
+    assert oracle.warms == [1_000_000]
+
+
+def test_warming_below_pruned_history_reloads(oracle):
+    oracle.warm(1_000)
+    oracle.observe_swaps(_swaps([1_000]))
+    oracle.warm(1_000 + 2 * MAX_STALE_BLOCKS)
+    assert oracle._obs[POOL] == []
+    oracle.warm(1_500)
+    assert oracle.warms == [1_000, 1_500]
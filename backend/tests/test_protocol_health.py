@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from analysis.protocol_health import _gini_by_group
+
+
+def _gini(values):
+    v = np.sort(np.asarray(values, dtype=np.float64))
+    n = len(v)
+    if n == 0 or v.sum() == 0:
+        return 0.0
+    return float(((2 * np.arange(1, n + 1) - n - 1) * v).sum() / (n * v.sum()))
+
+
+def test_matches_per_group_reference():
+    rng = np.random.default_rng(1)
+    group = rng.integers(0, 5, 500)
+    values = rng.lognormal(5, 2, 500)
+    out = _gini_by_group(group, values, 6)
+    for g in range(6):
+        assert out[g] == pytest.approx(_gini(values[group == g]))
+
+
+def test_known_values():
+    group = np.array([0, 0, 0, 0, 1, 1, 1, 1, 2])
+    values = np.array([5.0, 5.0, 5.0, 5.0, 0.0, 0.0, 0.0, 10.0, 0.0])
+    out = _gini_by_group(group, values, 4)
+    assert out[0] == pytest.approx(0.0)
+    assert out[1] == pytest.approx(0.75)
+    # All-zero and empty groups are 0, not NaN
+    assert out[2] == 0.0
+    assert out[3] == 0.0
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from analysis import protocol_health as ph
+from db import archive
+
+SWAP_COLUMNS = [
+    ("block_number", "bigint"),
+    ("tx_hash", "text"),
+    ("log_index", "integer"),
+    ("sender_address", "text"),
+    ("usd_value", "numeric"),
+    ("event_timestamp", "timestamp with time zone"),
+]
+
+
+def _swaps(day: datetime, amounts, wallets, first_block: int) -> list[dict]:
+    return [
+        {
+            "block_number": first_block + i,
+            "tx_hash": f"0x{first_block + i:064x}",
+            "log_index": 0,
+            "sender_address": w,
+            "usd_value": None if a is None else str(Decimal(a)),
+            "event_timestamp": day + timedelta(minutes=i),
+        }
+        for i, (a, w) in enumerate(zip(amounts, wallets))
+    ]
+
+
+@pytest.fixture
+def archived_month(tmp_path, monkeypatch):
+    """A raw_swaps_202501 Parquet file and manifest entry, written by the real archiver."""
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path)
+    rows = _swaps(datetime(2025, 1, 3, tzinfo=timezone.utc), [10, 60_000, 30, None], ["0xa", "0xb", "0xa", "0xc"], 100)
+    rows += _swaps(datetime(2025, 1, 4, tzinfo=timezone.utc), [5, 7], ["0xa", "0xa"], 200)
+    batch = {c: [r[c] for r in rows] for c, _ in SWAP_COLUMNS}
+    monkeypatch.setattr(archive, "stream_batches", lambda *a, **kw: iter([batch]))
+    dest = tmp_path / "raw_swaps" / "raw_swaps_202501.parquet"
+    written = archive._write_parquet("raw_swaps_202501", SWAP_COLUMNS, dest)
+    archive._record({
+        "table": "raw_swaps", "partition": "raw_swaps_202501", "month": "2025-01",
+        "path": str(dest.relative_to(tmp_path)), "rows": written["rows"],
+        "min_block": written["min_block"], "max_block": written["max_block"],
+    })
+    return rows
+
+
+def _by_day(rows):
+    return {r["date_bucket"]: r for r in rows}
+
+
+def test_full_rebuild_includes_archived_days(archived_month):
+    out = _by_day(ph._health_rows(ph._with_archive({})))
+    jan3 = out[datetime(2025, 1, 3).date()]
+    assert jan3["total_swaps"] == 4
+    assert jan3["unique_active_wallets"] == 3
+    assert jan3["total_volume_usd"] == pytest.approx(60_040)
+    assert jan3["median_swap_size"] == pytest.approx(20)
+    assert jan3["whale_share_pct"] == pytest.approx(60_000 * 100 / 60_040, abs=1e-3)
+    jan4 = out[datetime(2025, 1, 4).date()]
+    assert jan4["total_swaps"] == 2
+    assert jan4["unique_active_wallets"] == 1
+    assert jan4["gini_coefficient"] == 0
+
+
+def test_grouping_matches_the_sql_shape(archived_month):
+    data = ph._archived_scan(None)
+    assert sorted(data) == sorted(["date_bucket", "wallet_address", "is_day", "swaps", "volume", "whale_volume", "median_swap_size"])
+    wallet_rows = data["is_day"] == 0
+    pairs = {(d.astype("datetime64[D]").astype(object), w): v for d, w, v in zip(data["date_bucket"][wallet_rows], data["wallet_address"][wallet_rows], data["volume"][wallet_rows])}
+    assert pairs[(datetime(2025, 1, 3).date(), "0xa")] == pytest.approx(40)
+    assert pairs[(datetime(2025, 1, 3).date(), "0xc")] == 0
+    assert np.isnan(data["median_swap_size"][wallet_rows]).all()
+
+
+def test_archived_days_already_in_the_live_scan_are_not_counted_twice(archived_month):
+    live = ph._group_swaps(
+        np.array(["2025-01-04T12:00"], dtype="datetime64[us]"),
+        np.array(["0xd"], dtype=object),
+        np.array([1.0]),
+    )
+    out = _by_day(ph._health_rows(ph._with_archive(live)))
+    assert set(out) == {datetime(2025, 1, 3).date(), datetime(2025, 1, 4).date()}
+    assert out[datetime(2025, 1, 4).date()]["total_swaps"] == 1
+
+
+def test_no_archive_leaves_the_live_scan_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path)
+    live = {"date_bucket": np.array(["2025-01-04"], dtype="datetime64[D]")}
+    assert ph._with_archive(live) is live
@@ -0,0 +1,55 @@
+import pytest
+
+from indexer.range_controller import AdaptiveRangeController, is_range_error
+
+
+def test_next_range_is_inclusive_and_capped_at_head():
+    ctl = AdaptiveRangeController(max_block_range=100, max_logs=1000)
+    assert ctl.next_range(999, 10_000) == (1000, 1099)
+    assert ctl.next_range(999, 1050) == (1000, 1050)
+
+
+def test_success_grows_up_to_the_provider_max():
+    ctl = AdaptiveRangeController(max_block_range=100, max_logs=1000, initial=10)
+    for expected in (20, 40, 80, 100, 100):
+        assert ctl.record_success(0)
+        assert ctl.size == expected
+
+
+def test_busy_responses_shrink_and_full_responses_retry_smaller():
+    ctl = AdaptiveRangeController(max_block_range=100, max_logs=1000)
+    assert ctl.record_success(800)
+    assert ctl.size == 75
+    assert ctl.record_success(600)
+    assert ctl.size == 75
+    # Hitting the cap may have truncated the response
+    assert not ctl.record_success(1000)
+    assert ctl.size == 37
+
+
+def test_full_response_at_minimum_size_is_accepted():
+    ctl = AdaptiveRangeController(max_block_range=1, max_logs=10)
+    assert ctl.record_success(10)
+    assert ctl.size == 1
+
+
+@pytest.mark.parametrize(
+    "exc",
+    [
+        TimeoutError(),
+        ValueError({"code": -32005, "message": "query returned more than 10000 results"}),
+        RuntimeError("Log response size exceeded"),
+    ],
+)
+def test_range_errors_halve_until_the_minimum(exc):
+    assert is_range_error(exc)
+    ctl = AdaptiveRangeController(max_block_range=4, max_logs=1000)
+    assert ctl.record_failure(exc) and ctl.size == 2
+    assert ctl.record_failure(exc) and ctl.size == 1
+    assert not ctl.record_failure(exc)
+
+
+def test_other_errors_do_not_shrink():
+    ctl = AdaptiveRangeController(max_block_range=100, max_logs=1000)
+    assert not ctl.record_failure(ConnectionRefusedError("connection refused"))
+    assert ctl.size == 100
@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from analysis import volume_anomaly as va
+
+
+def _reference(volumes, window):
+    mean = np.zeros_like(volumes)
+    std = np.zeros_like(volumes)
+    for i in range(window, volumes.shape[1]):
+        mean[:, i] = volumes[:, i - window : i].mean(axis=1)
+        std[:, i] = volumes[:, i - window : i].std(axis=1)
+    return mean, std
+
+
+@pytest.mark.parametrize("window", [1, 3, 24, va.WINDOW])
+def test_rolling_matches_a_direct_window_computation(window):
+    rng = np.random.default_rng(window)
+    volumes = rng.lognormal(8, 2, (4, 3 * window + 17))
+    mean, std, _ = va.rolling_zscores(volumes, np.zeros(4, dtype=np.int64), window)
+    ref_mean, ref_std = _reference(volumes, window)
+    np.testing.assert_allclose(mean, ref_mean, rtol=1e-9)
+    np.testing.assert_allclose(std, ref_std, rtol=1e-6, atol=1e-9)
+
+
+def test_quiet_window_after_busy_hours_has_zero_mean_and_std():
+    rng = np.random.default_rng(0)
+    volumes = np.zeros((1, 4 * va.WINDOW + 1))
+    volumes[0, : va.WINDOW] = rng.lognormal(18, 3, va.WINDOW)
+    volumes[0, 3 * va.WINDOW :] = 5.0
+    mean, std, _ = va.rolling_zscores(volumes, np.zeros(1, dtype=np.int64))
+    quiet = slice(2 * va.WINDOW, 3 * va.WINDOW + 1)
+    assert (mean[0, quiet] == 0).all()
+    assert (std[0, quiet] == 0).all()
+    # Last column's window is the constant tail
+    assert mean[0, -1] == pytest.approx(5.0)
+    assert std[0, -1] == 0
+
+
+def test_valid_needs_a_full_window_since_the_first_hour():
+    volumes = np.ones((2, 10))
+    _, _, valid = va.rolling_zscores(volumes, np.array([0, 4]), window=3)
+    assert valid[0].tolist() == [False] * 3 + [True] * 7
+    assert valid[1].tolist() == [False] * 7 + [True] * 3
+
+
+def test_run_full_replaces_both_tables_in_the_incremental_transaction(monkeypatch):
+    statements = []
+    writes = []
+
+    @contextmanager
+    def unit_of_work():
+        statements.append("BEGIN")
+        yield type("Cur", (), {"execute": lambda self, sql, params=None: statements.append(sql)})()
+        statements.append("COMMIT")
+
+    now = datetime(2026, 1, 10, 12, tzinfo=timezone.utc)
+    hours = np.array([np.datetime64("2026-01-10T09:00", "us"), np.datetime64("2026-01-10T10:00", "us")])
+    monkeypatch.setattr(va, "unit_of_work", unit_of_work)
+    monkeypatch.setattr(va, "init_connection_pool", lambda: None)
+    monkeypatch.setattr(va, "_load_state", lambda: pytest.fail("a rebuild must not read the old state"))
+    monkeypatch.setattr(va, "_hourly_volume", lambda since, until: {
+        "hour_bucket": hours,
+        "token_address": np.array(["0xa", "0xa"], dtype=object),
+        "volume_usd": np.array([1.0, 2.0]),
+    })
+    monkeypatch.setattr(va, "write_analytics_rows", lambda table, cols, rows, **kw: writes.append((table, len(rows))))
+
+    va.run_full(now=now)
+    assert statements[0] == "BEGIN" and statements[-1] == "COMMIT"
+    assert statements.index("DELETE FROM analytics_anomaly_state") < statements.index("COMMIT")
+    assert "DELETE FROM analytics_anomalies" in statements
+    assert not any("TRUNCATE" in s for s in statements)
+    assert ("analytics_anomaly_state", 1) in writes
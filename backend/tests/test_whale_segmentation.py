@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from analysis import whale_segmentation as ws
+
+
+def _features(n: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    now = np.datetime64("2026-01-01T00:00:00", "us")
+    last = now - (rng.integers(0, 30 * 86400, n)).astype("timedelta64[s]")
+    return {
+        "wallet_address": np.array([f"0x{i:040x}" for i in range(n)], dtype=object),
+        "first_ts": last - np.timedelta64(86400, "s"),
+        "last_ts": last,
+        "frequency": rng.integers(1, 200, n).astype(np.float64),
+        "volume": rng.lognormal(8, 2, n),
+        "max_amount": rng.lognormal(7, 2, n),
+    }
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """In-memory stand-ins for analytics_cluster_state / analytics_wallet_segments."""
+    store: dict = {}
+
+    def write(table, columns, rows, mode="replace", conflict=None, cur=None):
+        store[table] = rows
+        return len(rows)
+
+    def load_state(k):
+        rows = store.get("analytics_cluster_state")
+        if not rows:
+            return None
+        return {
+            "centroids": np.array(rows[0]["centroids"], dtype=np.float64).reshape(k, ws.N_FEATURES),
+            "ranks": np.array(rows[0]["ranks"], dtype=np.int64),
+            "full_fit_at": rows[0]["full_fit_at"],
+        }
+
+    def previous():
+        rows = store.get("analytics_wallet_segments")
+        if not rows:
+            return {}
+        return {c: np.array([r[c] for r in rows]) for c in ("wallet_address", "cluster_id", "rfm_frequency", "rfm_volume")}
+
+    monkeypatch.setenv("WALLET_CLUSTER_ENGINE", "minibatch")
+    monkeypatch.setattr(ws, "write_analytics_rows", write)
+    monkeypatch.setattr(ws, "_load_cluster_state", load_state)
+    monkeypatch.setattr(ws, "_previous_assignments", previous)
+    return store
+
+
+@pytest.mark.parametrize("n_changed", [0, 1, ws.N_CLUSTERS - 1])
+def test_minibatch_incremental_with_fewer_changed_wallets_than_clusters(fake_db, n_changed):
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    features = _features(200)
+    fake_db["analytics_wallet_segments"] = ws._rfm_and_cluster(features, now)
+
+    features["frequency"] = features["frequency"].copy()
+    features["frequency"][:n_changed] += 1
+    later = now + timedelta(hours=1)
+    segments = ws._rfm_and_cluster(features, later)
+
+    assert len(segments) == 200
+    assert fake_db["analytics_cluster_state"][0]["n_refit"] == n_changed
+    assert all(0 <= s["cluster_id"] < ws.N_CLUSTERS for s in segments)
+    # Unchanged wallets keep their cluster
+    before = {s["wallet_address"]: s["cluster_id"] for s in fake_db["analytics_wallet_segments"]}
+    assert all(s["cluster_id"] == before[s["wallet_address"]] for s in segments[n_changed:])
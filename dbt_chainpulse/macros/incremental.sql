@@ -0,0 +1,59 @@
+{#
+  Incremental helpers. Fact models watermark on the raw rows' created_at (set when the
+  writing transaction starts), not event_timestamp, so rows that arrive late (same
+  timestamp, backfills of old blocks) are still picked up. A row only becomes visible when
+  its transaction commits, and it can commit after newer rows were already loaded, so each
+  run re-reads raw_commit_lookback behind the watermark. That must exceed the longest raw
+  write transaction (indexer and backfill COPY batches take seconds). Aggregates watermark
+  on the facts' loaded_at, which only dbt writes, one run at a time.
+#}
+
+{% macro has_column(relation, column) %}
+  {% if not execute %}
+    {{ return(false) }}
+  {% endif %}
+  {{ return(column in (adapter.get_columns_in_relation(relation) | map(attribute='name') | list)) }}
+{% endmacro %}
+
+{# Filter for raw rows committed since the last run of a fact model #}
+{% macro raw_watermark(source_column='created_at', target_column='raw_created_at') %}
+  {%- if has_column(this, target_column) -%}
+    {#- All-null (no rows since the column was added) rescans once; the merge is idempotent -#}
+    {{ source_column }} > (
+      select coalesce(max({{ target_column }}) - interval '{{ var('raw_commit_lookback') }}', '-infinity')
+      from {{ this }}
+    )
+  {%- else -%}
+    {#- Built before raw_created_at existed: one timestamp run (>= keeps same-second rows) fills it in -#}
+    event_timestamp >= (select max(event_timestamp) from {{ this }})
+  {%- endif -%}
+{% endmacro %}
+
+{#
+  Bucket starts an aggregate over fact_swaps must recompute: the newest (still open) bucket
+  plus `lookback` buckets before it, and every bucket holding fact rows loaded or updated
+  since this aggregate's last run (its last_loaded_at column).
+#}
+{% macro changed_buckets(grain, bucket_column, lookback, facts) %}
+  select generate_series(
+    (select max({{ bucket_column }}) from {{ this }})::timestamp - interval '{{ lookback }} {{ grain }}',
+    date_trunc('{{ grain }}', (select max(event_timestamp) from {{ facts }})),
+    interval '1 {{ grain }}'
+  ) as bucket_start
+  {%- if has_column(this, 'last_loaded_at') %}
+  union
+  select distinct date_trunc('{{ grain }}', event_timestamp)
+  from {{ facts }}
+  where loaded_at > (select coalesce(max(last_loaded_at), '-infinity') from {{ this }})
+  {%- endif %}
+{% endmacro %}
+
+{% macro first_by_id(relation, alias) %}
+  not exists (
+    select 1
+    from {{ relation }} dup
+    where dup.tx_hash = {{ alias }}.tx_hash
+      and dup.log_index = {{ alias }}.log_index
+      and dup.id < {{ alias }}.id
+  )
+{% endmacro %}
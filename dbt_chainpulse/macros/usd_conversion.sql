@@ -1,3 +1,15 @@
 {% macro usd_conversion(amount_column, price_column) %}
   coalesce({{ amount_column }} * nullif({{ price_column }}, 0), 0)
 {% endmacro %}
+
+{# Price of a token as of a timestamp from token_price_history (latest point at or before ts) #}
+{% macro price_as_of(token_column, ts_column) %}
+  (
+    select h.price_usd
+    from {{ source('raw', 'token_price_history') }} h
+    where h.token_address = {{ token_column }}
+      and h.ts <= {{ ts_column }} at time zone 'UTC'
+    order by h.ts desc
+    limit 1
+  )
+{% endmacro %}
@@ -2,17 +2,36 @@
   config(
     materialized='incremental',
     unique_key='date_bucket',
-    incremental_strategy='merge'
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns'
   )
 }}
-with daily as (
+with
+{% if is_incremental() %}
+changed as (
+  {{ changed_buckets('day', 'date_bucket', var('incremental_lookback_days'), ref('fact_swaps')) }}
+),
+facts as (
+  select f.*
+  from changed c
+  join {{ ref('fact_swaps') }} f
+    on f.event_timestamp >= c.bucket_start
+   and f.event_timestamp < c.bucket_start + interval '1 day'
+),
+{% else %}
+facts as (
+  select * from {{ ref('fact_swaps') }}
+),
+{% endif %}
+daily as (
   select
     date_trunc('day', event_timestamp)::date as date_bucket,
     count(distinct wallet_address) as unique_wallets,
     count(*) as total_swaps,
     sum(amount_usd) as total_volume,
-    percentile_cont(0.5) within group (order by amount_usd) as median_swap_size
-  from {{ ref('fact_swaps') }}
+    percentile_cont(0.5) within group (order by amount_usd) as median_swap_size,
+    max(loaded_at) as last_loaded_at
+  from facts
   group by 1
 )
 select
@@ -20,8 +39,6 @@ select
   unique_wallets,
   total_swaps,
   total_volume,
-  median_swap_size
+  median_swap_size,
+  last_loaded_at
 from daily
-{% if is_incremental() %}
-where date_bucket > (select max(date_bucket) from {{ this }})
-{% endif %}
@@ -2,10 +2,29 @@
   config(
     materialized='incremental',
     unique_key=['hour_bucket', 'token_address'],
-    incremental_strategy='merge'
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns'
   )
 }}
-with swaps as (
+with
+{% if is_incremental() %}
+changed as (
+  {{ changed_buckets('hour', 'hour_bucket', var('incremental_lookback_hours'), ref('fact_swaps')) }}
+),
+facts as (
+  -- Whole hours are re-aggregated, so late rows and the open hour merge in correctly
+  select f.*
+  from changed c
+  join {{ ref('fact_swaps') }} f
+    on f.event_timestamp >= c.bucket_start
+   and f.event_timestamp < c.bucket_start + interval '1 hour'
+),
+{% else %}
+facts as (
+  select * from {{ ref('fact_swaps') }}
+),
+{% endif %}
+swaps as (
   select
     date_trunc('hour', event_timestamp) as hour_bucket,
     token_in_address as token_address,
@@ -13,8 +32,9 @@ with swaps as (
     sum(amount_usd) as volume_usd,
     count(distinct wallet_address) as unique_wallets,
     avg(amount_usd) as avg_size,
-    max(amount_usd) as max_size
-  from {{ ref('fact_swaps') }}
+    max(amount_usd) as max_size,
+    max(loaded_at) as last_loaded_at
+  from facts
   group by 1, 2
 )
 select
@@ -24,8 +44,6 @@ select
   volume_usd,
   unique_wallets,
   avg_size,
-  max_size
+  max_size,
+  last_loaded_at
 from swaps
-{% if is_incremental() %}
-where hour_bucket > (select max(hour_bucket) from {{ this }})
-{% endif %}
@@ -20,11 +20,19 @@ select
   s.token1_address,
   s.amount0,
   s.amount1,
-  coalesce(s.usd_value, 0) as amount_usd,
+  -- Indexer value when present, else the token-in amount at its as-of historical price
+  coalesce(
+    s.usd_value,
+    case
+      when s.amount0 > 0 then {{ usd_conversion('s.amount0', price_as_of('s.token0_address', 's.event_timestamp')) }}
+      else {{ usd_conversion('s.amount1', price_as_of('s.token1_address', 's.event_timestamp')) }}
+    end
+  ) as amount_usd,
   s.event_timestamp,
   date_trunc('hour', s.event_timestamp) as hour_bucket,
   date_trunc('day', s.event_timestamp)::date as day_bucket,
   date_trunc('week', s.event_timestamp)::date as week_bucket,
   s.size_bucket,
-  case when coalesce(s.usd_value, 0) >= 50000 then true else false end as is_whale
+  case when coalesce(s.usd_value, 0) >= 50000 then true else false end as is_whale,
+  s.created_at
 from swaps s
@@ -24,5 +24,6 @@ select
     when coalesce(t.usd_value, 0) >= 50000 then 'whale'
     when t.is_exchange then 'exchange'
     else 'standard'
-  end as transfer_type
+  end as transfer_type,
+  t.created_at
 from transfers t
@@ -3,7 +3,13 @@
     materialized='incremental',
     unique_key='swap_id',
     incremental_strategy='merge',
-    merge_update_columns=['amount_usd', 'is_whale', 'wallet_segment']
+    merge_update_columns=['amount_usd', 'is_whale', 'wallet_segment', 'loaded_at'],
+    on_schema_change='append_new_columns',
+    post_hook=[
+      "create index if not exists {{ this.name }}_raw_created_at_idx on {{ this }} (raw_created_at)",
+      "create index if not exists {{ this.name }}_loaded_at_idx on {{ this }} (loaded_at)",
+      "create index if not exists {{ this.name }}_event_timestamp_idx on {{ this }} (event_timestamp)"
+    ]
   )
 }}
 with enriched as (
@@ -25,8 +31,11 @@ select
   event_timestamp,
   is_whale,
   null::numeric as anomaly_score,
-  'retail' as wallet_segment
+  'retail' as wallet_segment,
+  id as raw_id,
+  created_at as raw_created_at,
+  '{{ run_started_at }}'::timestamptz as loaded_at
 from enriched
 {% if is_incremental() %}
-where event_timestamp > (select max(event_timestamp) from {{ this }})
+where {{ raw_watermark() }}
 {% endif %}
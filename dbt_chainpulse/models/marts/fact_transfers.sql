@@ -3,7 +3,9 @@
     materialized='incremental',
     unique_key='transfer_id',
     incremental_strategy='merge',
-    merge_update_columns=['amount_usd', 'direction']
+    merge_update_columns=['amount_usd', 'direction', 'loaded_at'],
+    on_schema_change='append_new_columns',
+    post_hook="create index if not exists {{ this.name }}_raw_created_at_idx on {{ this }} (raw_created_at)"
   )
 }}
 with enriched as (
@@ -19,8 +21,11 @@ select
   amount,
   amount_usd,
   coalesce(direction, 'unknown') as direction,
-  event_timestamp
+  event_timestamp,
+  id as raw_id,
+  created_at as raw_created_at,
+  '{{ run_started_at }}'::timestamptz as loaded_at
 from enriched
 {% if is_incremental() %}
-where event_timestamp > (select max(event_timestamp) from {{ this }})
+where {{ raw_watermark() }}
 {% endif %}
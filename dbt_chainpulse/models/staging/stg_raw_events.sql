@@ -3,8 +3,25 @@
     materialized='view'
   )
 }}
+{#- raw_events_mode mirrors the indexer's RAW_EVENTS_MODE: full | compact | off -#}
+{% set mode = var('raw_events_mode', 'full') %}
 with source as (
-  select * from {{ source('raw', 'raw_events') }}
+{% if mode == 'off' %}
+  -- raw_events is not written; rebuild the event list from the typed raw tables
+  select id, block_number, tx_hash, log_index, pool_address as contract_address, 'Swap' as event_name,
+    null::jsonb as event_params, null::bytea as topics, null::bytea as data, event_timestamp, created_at
+  from {{ source('raw', 'raw_swaps') }} s
+  where {{ first_by_id(source('raw', 'raw_swaps'), 's') }}
+  union all
+  select id, block_number, tx_hash, log_index, token_address as contract_address, 'Transfer' as event_name,
+    null::jsonb as event_params, null::bytea as topics, null::bytea as data, event_timestamp, created_at
+  from {{ source('raw', 'raw_transfers') }} s
+  where {{ first_by_id(source('raw', 'raw_transfers'), 's') }}
+{% else %}
+  -- Lowest id per (tx_hash, log_index), as an index-friendly anti-join
+  select * from {{ source('raw', 'raw_events') }} s
+  where {{ first_by_id(source('raw', 'raw_events'), 's') }}
+{% endif %}
 ),
 cleaned as (
   select
@@ -15,6 +32,8 @@ cleaned as (
     lower(contract_address) as contract_address,
     event_name,
     event_params,
+    topics,
+    data,
     (event_timestamp at time zone 'UTC')::timestamp as event_timestamp,
     created_at
   from source
@@ -23,15 +42,6 @@ cleaned as (
     and block_number is not null
     and event_timestamp is not null
     and event_timestamp <= current_timestamp
-),
-deduped as (
-  select * from (
-    select
-      *,
-      row_number() over (partition by tx_hash, log_index order by id) as rn
-    from cleaned
-  ) t
-  where rn = 1
 )
-select id, block_number, tx_hash, log_index, contract_address, event_name, event_params, event_timestamp, created_at
-from deduped
+select id, block_number, tx_hash, log_index, contract_address, event_name, event_params, topics, data, event_timestamp, created_at
+from cleaned
@@ -4,7 +4,10 @@
   )
 }}
 with source as (
-  select * from {{ source('raw', 'raw_swaps') }}
+  -- Lowest id per (tx_hash, log_index); an anti-join keeps `id > x` filters from downstream
+  -- incremental models pushed down to the raw table's indexes
+  select * from {{ source('raw', 'raw_swaps') }} s
+  where {{ first_by_id(source('raw', 'raw_swaps'), 's') }}
 ),
 cleaned as (
   select
@@ -32,16 +35,7 @@ cleaned as (
     and block_number is not null
     and event_timestamp is not null
 )
-deduped as (
-  select * from (
-    select
-      *,
-      row_number() over (partition by tx_hash, log_index order by id) as rn
-    from cleaned
-  ) t
-  where rn = 1
-)
 select id, block_number, tx_hash, log_index, pool_address, sender_address, recipient_address,
   token0_address, token1_address, amount0, amount1, sqrt_price_x96, liquidity, tick,
   usd_value, event_timestamp, size_bucket, created_at
-from deduped
+from cleaned
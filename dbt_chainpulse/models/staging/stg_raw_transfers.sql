@@ -4,7 +4,10 @@
   )
 }}
 with source as (
-  select * from {{ source('raw', 'raw_transfers') }}
+  -- Lowest id per (tx_hash, log_index); an anti-join keeps `id > x` filters from downstream
+  -- incremental models pushed down to the raw table's indexes
+  select * from {{ source('raw', 'raw_transfers') }} s
+  where {{ first_by_id(source('raw', 'raw_transfers'), 's') }}
 ),
 cleaned as (
   select
@@ -29,15 +32,6 @@ cleaned as (
     and event_timestamp is not null
     and usd_value >= 1000
 )
-deduped as (
-  select * from (
-    select
-      *,
-      row_number() over (partition by tx_hash, log_index order by id) as rn
-    from cleaned
-  ) t
-  where rn = 1
-)
 select id, block_number, tx_hash, log_index, token_address, from_address, to_address,
   amount_raw, amount, usd_value, direction, is_exchange, event_timestamp, created_at
-from deduped
+from cleaned
@@ -7,7 +7,12 @@ export const runtime = 'nodejs';
 export async function GET() {
   try {
     const sql = getSql();
-    const rows = await sql`SELECT max(event_timestamp) AS ts FROM raw_events`;
+    const rows = await sql`
+      SELECT greatest(
+        (SELECT max(event_timestamp) FROM raw_events),
+        (SELECT max(event_timestamp) FROM raw_swaps),
+        (SELECT max(event_timestamp) FROM raw_transfers)
+      ) AS ts`;
     const ts = rows[0]?.ts;
     if (ts == null) return NextResponse.json({ seconds_since_last_event: null, message: 'No events yet' });
     const last = typeof ts === 'string' ? new Date(ts) : ts instanceof Date ? ts : new Date();